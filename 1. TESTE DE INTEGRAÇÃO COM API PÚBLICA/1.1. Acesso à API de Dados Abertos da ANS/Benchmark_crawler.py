@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+# não mistura as listagens falsas com o cache HTTP de verdade
+os.environ.setdefault("ANS_CACHE_HTTP_DIR", tempfile.mkdtemp(prefix="cache_http_bench_"))
+
+from Identificar_arquivos import coletar_zips_da_ans, coletar_zips_da_ans_async  # noqa: E402
+
+
+def montar_arvore(qtd_anos: int, ano_final: int = 2025) -> Dict[str, List[str]]:
+    """Estrutura parecida com a da ANS: alguns ZIPs na raiz e uma pasta YYYY/ por ano."""
+    anos = list(range(ano_final - qtd_anos + 1, ano_final + 1))
+    arvore: Dict[str, List[str]] = {"/": [f"{a}/" for a in anos] + ["1T2007.zip", "leia-me.zip"]}
+    for a in anos:
+        if a % 2 == 0:
+            nomes = [f"{t}T{a}.zip" for t in range(1, 5)]
+        else:
+            nomes = [f"{t}-Trimestre.zip" for t in range(1, 5)]
+        arvore[f"/{a}/"] = nomes
+    return arvore
+
+
+def criar_servidor(arvore: Dict[str, List[str]], latencia_s: float) -> ThreadingHTTPServer:
+    class FakeANS(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            time.sleep(latencia_s)
+            itens = arvore.get(self.path)
+            if itens is None:
+                self.send_error(404)
+                return
+            links = "".join(f'<a href="{i}">{i}</a>\n' for i in ["../"] + itens)
+            corpo = f"<html><body><pre>{links}</pre></body></html>".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), FakeANS)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compara o crawler sequencial com o async num servidor ANS falso.")
+    parser.add_argument("--anos", type=int, default=24)
+    parser.add_argument("--latencia-ms", type=int, default=150)
+    parser.add_argument("--concorrencia", type=int, default=8)
+    args = parser.parse_args()
+
+    servidor = criar_servidor(montar_arvore(args.anos), args.latencia_ms / 1000)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{servidor.server_address[1]}/"
+
+    try:
+        t0 = time.perf_counter()
+        seq = coletar_zips_da_ans(base_url)
+        t_seq = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        par = asyncio.run(coletar_zips_da_ans_async(base_url, concorrencia=args.concorrencia))
+        t_async = time.perf_counter() - t0
+    finally:
+        servidor.shutdown()
+
+    print(f"Pastas de ano: {args.anos} | latência por request: {args.latencia_ms} ms")
+    print(f"Trimestres reconhecidos: {len(seq[0])} | ignorados: {len(seq[1])}")
+    print(f"Sequencial: {t_seq:.2f}s")
+    print(f"Async (concorrência {args.concorrencia}): {t_async:.2f}s")
+    print(f"Speedup: {t_seq / t_async:.1f}x")
+    print(f"Resultados iguais: {seq == par}")
+
+
+if __name__ == "__main__":
+    main()
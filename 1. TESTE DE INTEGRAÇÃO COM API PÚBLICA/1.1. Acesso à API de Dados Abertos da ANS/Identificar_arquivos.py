@@ -1,20 +1,34 @@
 from __future__ import annotations
 
+import argparse
+import asyncio
 import json
 import logging
+import random
 import re
+import sys
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+# Módulos compartilhados entre os testes (pasta Compartilhado/ na raiz do repositório)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Cache_http import cache_padrao  # noqa: E402
 
 # =========================
 # Configurações
 # =========================
 BASE_URL = "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/"
 
+# Modo async: quantas requisições simultâneas (e conexões no pool)
+CONCORRENCIA_PADRAO = 8
+TENTATIVAS_HTTP = 5
+
 LOGGER = logging.getLogger("teste1.1")
 
 
@@ -57,11 +71,9 @@ def raiz_teste1() -> Path:
 def obter_texto(url: str, timeout_s: int = 30) -> str:
     """GET com retry automático."""
     erro: Optional[Exception] = None
-    for tentativa in range(1, 6):
+    for tentativa in range(1, TENTATIVAS_HTTP + 1):
         try:
-            resp = requests.get(url, timeout=timeout_s)
-            resp.raise_for_status()
-            return resp.text
+            return cache_padrao().obter_texto(url, timeout_s=timeout_s)
         except Exception as e:
             erro = e
             espera = min(2 ** tentativa, 20)
@@ -69,6 +81,49 @@ def obter_texto(url: str, timeout_s: int = 30) -> str:
     raise RuntimeError(f"Falha ao acessar {url}: {erro}") from erro
 
 
+def criar_sessao(concorrencia: int) -> requests.Session:
+    """Sessão com um único pool de conexões dimensionado para a concorrência."""
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concorrencia))
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    return sessao
+
+
+def _get_texto(sessao: requests.Session, url: str, timeout_s: int) -> str:
+    return cache_padrao().obter_texto(url, timeout_s=timeout_s, sessao=sessao)
+
+
+async def _com_retry(
+    url: str,
+    sessao: requests.Session,
+    limite: asyncio.Semaphore,
+    funcao: Callable[[requests.Session, str, int], Any],
+    timeout_s: int,
+) -> Any:
+    """Retry por requisição. A espera (com jitter) acontece fora do semáforo, então uma URL com falha não segura vaga das outras."""
+    erro: Optional[Exception] = None
+    for tentativa in range(1, TENTATIVAS_HTTP + 1):
+        async with limite:
+            try:
+                return await asyncio.to_thread(funcao, sessao, url, timeout_s)
+            except Exception as e:
+                erro = e
+        espera = min(2 ** tentativa, 20) * random.uniform(0.5, 1.0)
+        await asyncio.sleep(espera)
+    raise RuntimeError(f"Falha ao acessar {url}: {erro}") from erro
+
+
+async def obter_texto_async(
+    url: str,
+    sessao: requests.Session,
+    limite: asyncio.Semaphore,
+    timeout_s: int = 30,
+) -> str:
+    """GET com retry por requisição (ver _com_retry)."""
+    return await _com_retry(url, sessao, limite, _get_texto, timeout_s)
+
+
 def extrair_hrefs(html: str) -> List[str]:
     hrefs = re.findall(r'href="([^"]+)"', html, flags=re.IGNORECASE)
     saida: List[str] = []
@@ -84,9 +139,8 @@ def extrair_hrefs(html: str) -> List[str]:
     return saida
 
 
-def listar_itens(url_dir: str) -> Tuple[List[str], List[str]]:
-    """Retorna (subdiretorios, arquivos_zip)."""
-    html = obter_texto(url_dir)
+def separar_itens(html: str) -> Tuple[List[str], List[str]]:
+    """Retorna (subdiretorios, arquivos_zip) de uma listagem HTML."""
     hrefs = extrair_hrefs(html)
 
     subdirs = [h for h in hrefs if h.endswith("/")]
@@ -95,6 +149,19 @@ def listar_itens(url_dir: str) -> Tuple[List[str], List[str]]:
     return subdirs, zips
 
 
+def listar_itens(url_dir: str) -> Tuple[List[str], List[str]]:
+    """Retorna (subdiretorios, arquivos_zip)."""
+    return separar_itens(obter_texto(url_dir))
+
+
+async def listar_itens_async(
+    url_dir: str,
+    sessao: requests.Session,
+    limite: asyncio.Semaphore,
+) -> Tuple[List[str], List[str]]:
+    return separar_itens(await obter_texto_async(url_dir, sessao, limite))
+
+
 def extrai_trimestre(nome_zip: str, ano_contexto: Optional[int] = None) -> Optional[TrimestreRef]:
     """ Extrai (ano, trimestre) do nome do ZIP. Se o nome não tiver ano, tenta usar ano_contexto (pasta YYYY/). """
     nome = Path(nome_zip).name
@@ -120,37 +187,65 @@ def extrai_trimestre(nome_zip: str, ano_contexto: Optional[int] = None) -> Optio
     return None
 
 
-def coletar_zips_da_ans() -> Tuple[Dict[TrimestreRef, List[str]], List[str]]:
+def agrupar_zips(
+    zips: List[str],
+    url_dir: str,
+    agrupado: Dict[TrimestreRef, List[str]],
+    ignorados: List[str],
+    ano_contexto: Optional[int] = None,
+) -> None:
+    for z in zips:
+        tref = extrai_trimestre(z, ano_contexto=ano_contexto)
+        url_zip = f"{url_dir}{z}"
+        if tref is None:
+            ignorados.append(url_zip)
+            continue
+        agrupado.setdefault(tref, []).append(url_zip)
+
+
+def pastas_de_ano(subdirs: List[str]) -> List[str]:
+    return [d for d in subdirs if re.fullmatch(r"\d{4}/", d)]
+
+
+def coletar_zips_da_ans(base_url: str = BASE_URL) -> Tuple[Dict[TrimestreRef, List[str]], List[str]]:
     agrupado: Dict[TrimestreRef, List[str]] = {}
     ignorados: List[str] = []
 
-    subdirs_base, zips_base = listar_itens(BASE_URL)
+    subdirs_base, zips_base = listar_itens(base_url)
 
     # ZIPs na raiz
-    for z in zips_base:
-        tref = extrai_trimestre(z)
-        url_zip = f"{BASE_URL}{z}"
-        if tref is None:
-            ignorados.append(url_zip)
-            continue
-        agrupado.setdefault(tref, []).append(url_zip)
+    agrupar_zips(zips_base, base_url, agrupado, ignorados)
 
     # ZIPs em subpastas YYYY/
-    for d in subdirs_base:
-        if not re.fullmatch(r"\d{4}/", d):
-            continue
-
-        ano_contexto = int(d.strip("/"))
-        url_ano = f"{BASE_URL}{d}"
+    for d in pastas_de_ano(subdirs_base):
+        url_ano = f"{base_url}{d}"
         _, zips_ano = listar_itens(url_ano)
+        agrupar_zips(zips_ano, url_ano, agrupado, ignorados, ano_contexto=int(d.strip("/")))
+
+    return agrupado, ignorados
+
+
+async def coletar_zips_da_ans_async(
+    base_url: str = BASE_URL,
+    concorrencia: int = CONCORRENCIA_PADRAO,
+) -> Tuple[Dict[TrimestreRef, List[str]], List[str]]:
+    """Mesmo resultado de coletar_zips_da_ans, mas busca todas as pastas YYYY/ ao mesmo tempo."""
+    agrupado: Dict[TrimestreRef, List[str]] = {}
+    ignorados: List[str] = []
+
+    limite = asyncio.Semaphore(concorrencia)
+    with criar_sessao(concorrencia) as sessao:
+        subdirs_base, zips_base = await listar_itens_async(base_url, sessao, limite)
+        agrupar_zips(zips_base, base_url, agrupado, ignorados)
 
-        for z in zips_ano:
-            tref = extrai_trimestre(z, ano_contexto=ano_contexto)
-            url_zip = f"{url_ano}{z}"
-            if tref is None:
-                ignorados.append(url_zip)
-                continue
-            agrupado.setdefault(tref, []).append(url_zip)
+        anos = pastas_de_ano(subdirs_base)
+        listagens = await asyncio.gather(
+            *(listar_itens_async(f"{base_url}{d}", sessao, limite) for d in anos)
+        )
+
+    # gather preserva a ordem, então o agrupamento fica igual ao do modo sequencial
+    for d, (_, zips_ano) in zip(anos, listagens):
+        agrupar_zips(zips_ano, f"{base_url}{d}", agrupado, ignorados, ano_contexto=int(d.strip("/")))
 
     return agrupado, ignorados
 
@@ -164,24 +259,91 @@ def selecionar_ultimos_3(agrupado: Dict[TrimestreRef, List[str]]) -> Dict[Trimes
     return {t: agrupado[t] for t in ultimos}
 
 
-def salvar_material(ultimos: Dict[TrimestreRef, List[str]], ignorados: List[str]) -> Path:
+def _head_zip(sessao: requests.Session, url: str, timeout_s: int) -> Dict[str, Any]:
+    return cache_padrao().metadados(url, timeout_s=timeout_s, sessao=sessao)
+
+
+async def obter_metadados_zip_async(
+    url: str,
+    sessao: requests.Session,
+    limite: asyncio.Semaphore,
+    timeout_s: int = 30,
+) -> Dict[str, Any]:
+    """Tamanho, Last-Modified e ETag do ZIP pelo cache HTTP (índice ou HEAD condicional), com o mesmo retry de obter_texto_async. Se todas as tentativas falharem, tudo None."""
+    try:
+        return await _com_retry(url, sessao, limite, _head_zip, timeout_s)
+    except RuntimeError as e:
+        LOGGER.warning("HEAD falhou para %s: %s", url, e.__cause__)
+        return {"tamanho": None, "last_modified": None, "etag": None}
+
+
+async def obter_metadados_zips_async(urls: List[str], concorrencia: int = CONCORRENCIA_PADRAO) -> List[Dict[str, Any]]:
+    """Metadados de todos os ZIPs ao mesmo tempo, na ordem de urls."""
+    limite = asyncio.Semaphore(concorrencia)
+    with criar_sessao(concorrencia) as sessao:
+        return await asyncio.gather(*(obter_metadados_zip_async(url, sessao, limite) for url in urls))
+
+
+def mesmo_zip_remoto(novo: Dict[str, Any], anterior: Dict[str, Any]) -> bool:
+    """Só considera igual se o servidor informou tamanho e alguma data/ETag, e tudo bate."""
+    if novo.get("tamanho") is None or not (novo.get("last_modified") or novo.get("etag")):
+        return False
+    return all(novo.get(k) == anterior.get(k) for k in ("tamanho", "last_modified", "etag"))
+
+
+def ler_manifesto_anterior(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def salvar_material(
+    ultimos: Dict[TrimestreRef, List[str]],
+    ignorados: List[str],
+    concorrencia: int = CONCORRENCIA_PADRAO,
+) -> Path:
+    """ Grava o manifesto com as URLs e a impressão digital de cada ZIP (HEADs em paralelo, pelo cache HTTP). O sha256 (calculado pela 1.2 depois do download) e o bloco "saida" de cada trimestre são mantidos da execução anterior quando o ZIP remoto não mudou, para a 1.2 poder pular trimestres já processados."""
     base = raiz_teste1()
     doc_dir = base / "Documentos"
     doc_dir.mkdir(parents=True, exist_ok=True)
 
     out_path = doc_dir / "Ultimos_3_trimestres.json"
 
+    anterior = ler_manifesto_anterior(out_path).get("ultimos_3_trimestres", [])
+    zips_anteriores = {z["url"]: z for item in anterior for z in item.get("zips", [])}
+    saidas_anteriores = {item["rotulo"]: item["saida"] for item in anterior if item.get("saida")}
+
+    todas = [url for _, urls in sorted(ultimos.items()) for url in sorted(urls)]
+    metadados = dict(zip(todas, asyncio.run(obter_metadados_zips_async(todas, concorrencia))))
+
+    trimestres = []
+    for t, urls in sorted(ultimos.items()):
+        zips = []
+        for url in sorted(urls):
+            meta: Dict[str, Any] = {"url": url, **metadados[url]}
+            ant = zips_anteriores.get(url)
+            if ant and ant.get("sha256") and mesmo_zip_remoto(meta, ant):
+                meta["sha256"] = ant["sha256"]
+            zips.append(meta)
+
+        entrada: Dict[str, Any] = {
+            "ano": t.ano,
+            "trimestre": t.trimestre,
+            "rotulo": t.rotulo(),
+            "zip_urls": sorted(urls),
+            "zips": zips,
+        }
+        if t.rotulo() in saidas_anteriores:
+            entrada["saida"] = saidas_anteriores[t.rotulo()]
+        trimestres.append(entrada)
+
     payload = {
         "base_url": BASE_URL,
-        "ultimos_3_trimestres": [
-            {
-                "ano": t.ano,
-                "trimestre": t.trimestre,
-                "rotulo": t.rotulo(),
-                "zip_urls": sorted(urls),
-            }
-            for t, urls in sorted(ultimos.items())
-        ]
+        "ultimos_3_trimestres": trimestres,
     }
 
     with open(out_path, "w", encoding="utf-8") as f:
@@ -190,10 +352,23 @@ def salvar_material(ultimos: Dict[TrimestreRef, List[str]], ignorados: List[str]
     return out_path
 
 
+def ler_argumentos() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Identifica os últimos 3 trimestres publicados pela ANS.")
+    parser.add_argument("--async", dest="modo_async", action="store_true",
+                        help="busca as pastas YYYY/ em paralelo (asyncio)")
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA_PADRAO,
+                        help="requisições simultâneas no modo --async e nos HEADs dos ZIPs")
+    return parser.parse_args()
+
+
 def main() -> None:
     configurar_logging()
+    args = ler_argumentos()
 
-    agrupado, ignorados = coletar_zips_da_ans()
+    if args.modo_async:
+        agrupado, ignorados = asyncio.run(coletar_zips_da_ans_async(concorrencia=args.concorrencia))
+    else:
+        agrupado, ignorados = coletar_zips_da_ans()
     ultimos = selecionar_ultimos_3(agrupado)
 
     LOGGER.info("Total de trimestres reconhecidos: %d", len(agrupado))
@@ -201,8 +376,9 @@ def main() -> None:
     for t in sorted(ultimos.keys()):
         LOGGER.info("  - Ano: %d | Trimestre: %d | Nome do Arquivo: %s", t.ano, t.trimestre, t.rotulo())
 
-    out_path = salvar_material(ultimos, ignorados)
+    out_path = salvar_material(ultimos, ignorados, args.concorrencia)
     LOGGER.info("Salvo: %s", out_path)
+    LOGGER.info(cache_padrao().resumo())
 
 
 if __name__ == "__main__":
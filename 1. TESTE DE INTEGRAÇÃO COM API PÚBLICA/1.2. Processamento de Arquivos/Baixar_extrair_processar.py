@@ -1,19 +1,42 @@
 from __future__ import annotations
 
+import argparse
+import codecs
 import csv
+import hashlib
+import io
 import json
 import logging
+import pickle
+import queue
 import re
+import shutil
+import sys
+import tempfile
+import threading
 import time
 import unicodedata
 import zipfile
-from dataclasses import dataclass
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
-from pathlib import Path
-from typing import Dict, Iterator, List, Optional, Tuple
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-import requests
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+
+# Módulos compartilhados entre os testes (pasta Compartilhado/ na raiz do repositório)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Cache_http import cache_padrao  # noqa: E402
+from Cache_linhas import CacheLinhas, ChaveLinhas, GravadorLinhas, cache_linhas_padrao  # noqa: E402
+from Plano_contas import AcumuladorContas, caminho_rollup, juntar_contas, rollup_contas, salvar_rollup  # noqa: E402
+from Valores_decimais import PontoFixo, centavos_half_up, para_ponto_fixo, somar_por_grupo  # noqa: E402
 
 def formato_dinheiro(v: Decimal) -> str:
     v = v.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
@@ -25,6 +48,40 @@ LOGGER = logging.getLogger("teste1.2")
 
 MANIFEST_1_1_FILENAME = "Ultimos_3_trimestres.json"
 CHUNK_SIZE_CSV = 200_000
+# A passada do índice de contas lê só duas colunas: chunks maiores, mesma memória
+CHUNK_SIZE_INDICE = 1_000_000
+# XLSX: linhas de uma planilha guardadas em memória até o índice dela ficar pronto; acima disso vão para um
+# temporário em disco (ver com_indice)
+LINHAS_INDICE_EM_MEMORIA = 1_000_000
+# Descrições distintas guardadas já normalizadas (elas se repetem muito entre chunks e arquivos)
+TAMANHO_CACHE_TEXTOS = 65_536
+EXTENSOES_TABULARES = (".csv", ".txt", ".xlsx")
+AMOSTRA_ENCODING_BYTES = 1024 * 1024
+# Textos que o pd.read_excel(dtype=str) trata como vazio (os na_values padrão do pandas), mais os códigos de erro do Excel
+NA_PADRAO_PANDAS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+VAZIOS_XLSX = NA_PADRAO_PANDAS | frozenset(ERROR_CODES)
+
+# Mudou a regra de agregação? Incrementa para invalidar os CSVs já gerados.
+VERSAO_PROCESSAMENTO = 4
+# Mudou a leitura (projeção, encoding, XLSX)? Incrementa para não reaproveitar o cache de linhas.
+VERSAO_LEITURA = 1
+
+# Colunas do cache de linhas -> nomes que escolher_colunas reconhece na releitura
+COLUNAS_CACHE = {"reg_ans": "REG_ANS", "conta": "CD_CONTA_CONTABIL", "descricao": "DESCRICAO", "valor": "VL_SALDO_FINAL"}
+
+# Downloads simultâneos (ZIPs de todos os trimestres) e faixas por ZIP grande
+DOWNLOADS_SIMULTANEOS = 4
+PARTES_POR_ZIP = 1
+
+# Processos lendo/agregando arquivos ao mesmo tempo (1 = tudo no processo principal)
+JOBS_PADRAO = 1
+
+# Trimestres parados na fila entre um estágio do pipeline e o próximo. Fila cheia segura o estágio de trás
+# (backpressure): o download não se adianta mais que isso em relação ao parse, nem em disco nem em memória.
+FILA_TRIMESTRES = 1
 
 
 @dataclass(frozen=True, order=True)
@@ -36,6 +93,120 @@ class TrimestreRef:
         return f"{self.trimestre}T{self.ano}"
 
 
+@dataclass(frozen=True)
+class IndiceContas:
+    """Quem tem a conta 41 (por REG_ANS) no arquivo inteiro, não só no chunk."""
+    reg_com_41: FrozenSet[str]
+
+
+@dataclass(frozen=True)
+class ArquivoTabular:
+    """CSV/TXT/XLSX a processar: solto no disco (membro=None) ou membro de um ZIP, lido sem extrair. sha256_zip (conteúdo do ZIP) é a chave no cache de linhas."""
+    path: Path
+    membro: Optional[str] = None
+    sha256_zip: Optional[str] = None
+
+    @property
+    def nome(self) -> str:
+        return PurePosixPath(self.membro).name if self.membro else self.path.name
+
+    @property
+    def ext(self) -> str:
+        return PurePosixPath(self.nome).suffix.lower()
+
+
+@dataclass(frozen=True)
+class ParcialAgregado:
+    """Somas por REG_ANS em arrays (valor = soma / 10**escala), para voltar barato de um processo filho. O que não cabe em int64, ou não é finito, fica em extras como Decimal."""
+    reg_ans: np.ndarray      # str
+    soma: np.ndarray         # int64
+    escala: np.ndarray       # int64, casas decimais de cada soma
+    extras: Dict[str, Decimal] = field(default_factory=dict)
+
+    @classmethod
+    def de_pares(cls, pares: Dict[str, Tuple[int, int]], extras: Dict[str, Decimal]) -> ParcialAgregado:
+        regs: List[str] = []
+        somas: List[int] = []
+        escalas: List[int] = []
+        extras = dict(extras)
+        for reg, (soma, escala) in pares.items():
+            if -2 ** 63 <= soma < 2 ** 63:
+                regs.append(reg)
+                somas.append(soma)
+                escalas.append(escala)
+            else:
+                d = Decimal(f"{soma}E{-escala}")
+                extras[reg] = extras[reg] + d if reg in extras else d
+        return cls(
+            reg_ans=np.array(regs, dtype=str),
+            soma=np.array(somas, dtype=np.int64),
+            escala=np.array(escalas, dtype=np.int64),
+            extras=extras,
+        )
+
+    @classmethod
+    def de_somas(cls, somas: Dict[str, Decimal]) -> ParcialAgregado:
+        pares: Dict[str, Tuple[int, int]] = {}
+        extras: Dict[str, Decimal] = {}
+        for reg, v in somas.items():
+            if not v.is_finite():
+                extras[reg] = v
+                continue
+            sinal, digitos, expoente = v.as_tuple()
+            m = int("".join(map(str, digitos)))
+            if expoente > 0:
+                m, expoente = m * 10 ** expoente, 0
+            pares[reg] = (-m if sinal else m, -expoente)
+        return cls.de_pares(pares, extras)
+
+    def para_somas(self) -> Dict[str, Decimal]:
+        """Volta para o dict de processar_trimestre (mesmos valores e casas decimais de somar os Decimals)."""
+        out = {
+            reg: Decimal(soma).scaleb(-escala)
+            for reg, soma, escala in zip(self.reg_ans.tolist(), self.soma.tolist(), self.escala.tolist())
+        }
+        for reg, d in self.extras.items():
+            out[reg] = out.get(reg, Decimal("0")) + d
+        return out
+
+
+@dataclass
+class ResultadoArquivo:
+    """O que processar_arquivo devolve: a soma parcial e os registros de erro/encoding do arquivo, na ordem em que aconteceram."""
+    parcial: ParcialAgregado
+    erros: List[Dict[str, str]]
+    encodings: List[Dict[str, Any]]
+    segundos: float = 0.0
+    cache: Optional[str] = None     # "hit"/"miss" no cache de linhas; None = fora do cache
+    contas: Optional[pd.DataFrame] = None   # soma por (reg_ans, conta) de todas as linhas, para o rollup
+
+
+@dataclass
+class TrimestreNoPipeline:
+    """Trimestre pendente passando pelos estágios do pipeline. Os ZIPs chegam com tamanho/sha256 novos, mas quem grava no manifesto é só a thread principal (a mesma que o serializa)."""
+    item: Dict[str, Any]
+    zips: List[Dict[str, Any]] = field(default_factory=list)
+    atualizado: bool = False     # conteúdo dos ZIPs igual ao da última saída: pula o parse
+    arquivos: List[ArquivoTabular] = field(default_factory=list)
+    erros: List[Dict[str, str]] = field(default_factory=list)
+    falha: Optional[BaseException] = None
+
+
+@dataclass
+class EstagioPipeline:
+    """Tempo de um estágio: trabalhando, esperando entrada (fila de trás vazia) e bloqueado pela fila da frente cheia."""
+    nome: str
+    capacidade: int = 1
+    ocupado: float = 0.0
+    ocioso: float = 0.0
+    bloqueado: float = 0.0
+
+    def resumo(self, parede: float) -> str:
+        uso = self.ocupado / (parede * self.capacidade) if parede > 0 else 0.0
+        return (f"  {self.nome:<13} uso {uso:6.1%} | ocupado {self.ocupado:7.1f}s | "
+                f"esperando entrada {self.ocioso:7.1f}s | bloqueado (fila cheia) {self.bloqueado:7.1f}s")
+
+
 # =========================
 # Pastas
 # =========================
@@ -63,6 +234,10 @@ def pasta_saida() -> Path:
     return pasta_dados() / "Saída"
 
 
+def pasta_contas() -> Path:
+    return pasta_dados() / "Contas"
+
+
 # =========================
 # Logging
 # =========================
@@ -133,26 +308,36 @@ def despesa_eventos_sinistros(texto: str) -> bool:
     return False
 
 
+@lru_cache(maxsize=TAMANHO_CACHE_TEXTOS)
+def normalizar_texto_cache(s: str) -> str:
+    return normalizar_texto(s)
+
+
+def marcar_termos(s: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """ Por linha: (tem EVENTO/SINISTRO, tem RECEITA). Cada texto distinto é normalizado uma vez só (factorize + cache) e o resultado volta para as linhas pelos códigos."""
+    codigos, unicos = pd.factorize(s.fillna("").astype(str))
+    normalizados = pd.Series([normalizar_texto_cache(u) for u in unicos], dtype=object)
+    evento = normalizados.str.contains("EVENTO|SINISTRO", regex=True).to_numpy(dtype=bool)
+    receita = normalizados.str.contains("RECEITA", regex=False).to_numpy(dtype=bool)
+    return evento[codigos], receita[codigos]
+
+
 # =========================
 # I/O
 # =========================
-def baixar_arquivo(url: str, destino: Path, timeout_s: int = 60) -> None:
-    destino.parent.mkdir(parents=True, exist_ok=True)
-    tmp = destino.with_suffix(destino.suffix + ".part")
+def verificar_zip(path: Path) -> None:
+    """Abre o diretório central do ZIP: arquivo truncado ou corrompido levanta BadZipFile."""
+    with zipfile.ZipFile(path, "r") as zf:
+        if not zf.infolist():
+            raise zipfile.BadZipFile(f"ZIP vazio: {path.name}")
 
-    if destino.exists():
-        return
 
+def baixar_arquivo(url: str, destino: Path, timeout_s: int = 60, partes: int = PARTES_POR_ZIP) -> None:
+    """Baixa via cache HTTP: se o ZIP já está no cache, custa só um 304. Uma nova tentativa continua do .part (Range) em vez de recomeçar do zero, e o ZIP só é aceito se bater com o Content-Length e tiver diretório central válido."""
     erro: Optional[Exception] = None
     for tentativa in range(1, 6):
         try:
-            with requests.get(url, stream=True, timeout=timeout_s) as resp:
-                resp.raise_for_status()
-                with open(tmp, "wb") as f:
-                    for chunk in resp.item_content(chunk_size=1024 * 1024):
-                        if chunk:
-                            f.write(chunk)
-            tmp.replace(destino)
+            cache_padrao().baixar(url, destino, timeout_s=timeout_s, partes=partes, verificar=verificar_zip)
             return
         except Exception as e:
             erro = e
@@ -162,6 +347,21 @@ def baixar_arquivo(url: str, destino: Path, timeout_s: int = 60) -> None:
     raise RuntimeError(f"Falha ao baixar {url}: {erro}") from erro
 
 
+def membro_seguro(nome: str) -> bool:
+    """Recusa caminho absoluto, letra de drive e '..' (zip slip)."""
+    nome = nome.replace("\\", "/")
+    partes = PurePosixPath(nome).parts
+    return bool(partes) and not nome.startswith("/") and ".." not in partes and ":" not in partes[0]
+
+
+def membros_tabulares(zf: zipfile.ZipFile) -> Iterator[zipfile.ZipInfo]:
+    for info in zf.infolist():
+        if info.is_dir() or not membro_seguro(info.filename):
+            continue
+        if PurePosixPath(info.filename).suffix.lower() in EXTENSOES_TABULARES:
+            yield info
+
+
 def extrair_zip_seguro(zip_path: Path, destino_dir: Path) -> None:
     destino_dir.mkdir(parents=True, exist_ok=True)
     with zipfile.ZipFile(zip_path, "r") as zf:
@@ -175,7 +375,7 @@ def extrair_zip_seguro(zip_path: Path, destino_dir: Path) -> None:
 
             alvo.parent.mkdir(parents=True, exist_ok=True)
             with zf.open(info, "r") as src, open(alvo, "wb") as dst:
-                dst.write(src.read())
+                shutil.copyfileobj(src, dst, length=1024 * 1024)
 
 
 # =========================
@@ -190,51 +390,370 @@ def ler_documento() -> Dict:
         return json.load(f)
 
 
-def item_arquivos_tabulares(root: Path) -> Iterator[Path]:
+def salvar_documento(manifesto: Dict) -> Path:
+    path = pasta_documentos() / MANIFEST_1_1_FILENAME
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    tmp.replace(path)
+    return path
+
+
+def sha256_arquivo(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def zips_do_item(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Entradas de ZIP do manifesto (manifestos antigos só têm zip_urls)."""
+    if item.get("zips"):
+        return item["zips"]
+    return [{"url": u} for u in item.get("zip_urls", [])]
+
+
+def caminho_csv_intermediario(tref: TrimestreRef) -> Path:
+    return pasta_normal() / f"despesas_eventos_sinistros_{tref.rotulo()}.csv"
+
+
+def saida_atualizada(item: Dict[str, Any], tref: TrimestreRef) -> bool:
+    """ True se o CSV do trimestre já existe, bate com a impressão digital gravada e foi gerado (nesta versão do código) a partir exatamente dos ZIPs do manifesto. O rollup de contas do trimestre também tem que existir."""
+    saida = item.get("saida")
+    if not saida or saida.get("versao") != VERSAO_PROCESSAMENTO:
+        return False
+
+    zips_sha = {z["url"]: z.get("sha256") for z in zips_do_item(item)}
+    if any(sha is None for sha in zips_sha.values()) or saida.get("zips") != zips_sha:
+        return False
+
+    if not caminho_rollup(pasta_contas(), tref.ano, tref.trimestre).is_file():
+        return False
+
+    csv_path = caminho_csv_intermediario(tref)
+    return csv_path.is_file() and sha256_arquivo(csv_path) == saida.get("sha256")
+
+
+def item_arquivos_tabulares(root: Path) -> Iterator[ArquivoTabular]:
     for p in root.rglob("*"):
-        if p.is_file() and p.suffix.lower() in (".csv", ".txt", ".xlsx"):
-            yield p
+        if p.is_file() and p.suffix.lower() in EXTENSOES_TABULARES:
+            yield ArquivoTabular(p)
+
 
+def item_arquivos_zip(zip_path: Path, sha256_zip: Optional[str] = None) -> List[ArquivoTabular]:
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        return [ArquivoTabular(zip_path, info.filename, sha256_zip) for info in membros_tabulares(zf)]
+
+
+@contextmanager
+def abrir_binario(arquivo: ArquivoTabular) -> Iterator[BinaryIO]:
+    """Stream de bytes do arquivo; membro de ZIP é descompactado sob demanda, sem ir para o disco."""
+    if arquivo.membro is None:
+        with open(arquivo.path, "rb") as f:
+            yield f
+    else:
+        with zipfile.ZipFile(arquivo.path, "r") as zf, zf.open(arquivo.membro, "r") as f:
+            yield f
 
-def item_csv_chunks(path: Path, chunksize: int) -> Iterator[pd.DataFrame]:
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        head = "".join([f.readline() for _ in range(8)])
-    sep = detectar_delimitador(head)
 
+def detectar_encoding(amostra: bytes) -> str:
+    """UTF-8 se a amostra decodifica (um caractere cortado no fim não conta), senão latin1."""
     try:
-        yield from pd.read_csv(
-            path,
-            sep=sep,
-            dtype=str,
-            chunksize=chunksize,
-            encoding="utf-8",
-            engine="python",
-            on_bad_lines="skip",
-        )
+        codecs.utf_8_decode(amostra, "strict", False)
+        return "utf-8"
     except UnicodeDecodeError:
+        return "latin1"
+
+
+class DecodificadorAdaptativo(io.TextIOBase):
+    """ Stream de texto sobre os bytes do arquivo. Começa em UTF-8 e, no primeiro byte inválido, passa para latin1 dali em diante, sem voltar ao início: cada byte é decodificado (e cada linha agregada) uma vez só."""
+
+    def __init__(self, raw: BinaryIO, encoding: str):
+        self.raw = raw
+        self.encoding_atual = encoding
+        self.troca_no_byte: Optional[int] = None
+        self._pendente = b""   # fim de um caractere UTF-8 cortado entre blocos
+        self._lidos = 0
+        self._sobra = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def _decodificar(self, dados: bytes, final: bool) -> str:
+        if self.encoding_atual != "utf-8":
+            return dados.decode(self.encoding_atual)
+
+        # posição no arquivo do primeiro byte de pendente + dados (_lidos já inclui dados)
+        inicio = self._lidos - len(dados) - len(self._pendente)
+        dados = self._pendente + dados
+        try:
+            texto, usados = codecs.utf_8_decode(dados, "strict", final)
+        except UnicodeDecodeError as e:
+            self.troca_no_byte = inicio + e.start
+            self.encoding_atual = "latin1"
+            self._pendente = b""
+            return dados[:e.start].decode("utf-8") + dados[e.start:].decode("latin1")
+
+        self._pendente = dados[usados:]
+        return texto
+
+    def read(self, n: Optional[int] = -1) -> str:
+        # lê ~n bytes por chamada e devolve até n caracteres (menos só no fim do arquivo),
+        # sem manter um buffer grande de texto
+        tamanho = -1 if n is None or n < 0 else max(n, 4)
+        texto = self._sobra
+        while not texto or tamanho < 0:
+            dados = self.raw.read(tamanho)
+            self._lidos += len(dados)
+            texto += self._decodificar(dados, final=not dados)
+            if not dados:
+                break
+
+        if tamanho >= 0 and len(texto) > n:
+            texto, self._sobra = texto[:n], texto[n:]
+        else:
+            self._sobra = ""
+        return texto
+
+
+def ler_cabecalho_csv(arquivo: ArquivoTabular) -> Tuple[str, List[str], str]:
+    """Lê só o começo do arquivo: delimitador, nomes das colunas e encoding provável."""
+    with abrir_binario(arquivo) as f:
+        amostra = f.read(AMOSTRA_ENCODING_BYTES)
+    encoding = detectar_encoding(amostra)
+    linhas = amostra[:64 * 1024].decode(encoding, errors="replace").splitlines()
+    sep = detectar_delimitador("\n".join(linhas[:8]))
+    colunas = next(csv.reader(linhas[:1], delimiter=sep), [])
+    return sep, colunas, encoding
+
+
+def colunas_projetadas(colunas: List[str]) -> Optional[Callable[[str], bool]]:
+    """ usecols para ler só REG_ANS, conta, descrição e valor. None (lê tudo) quando falta alguma obrigatória, para agregar_normalizado registrar o erro ou cair na heurística com as colunas de texto."""
+    cols = escolher_colunas_nomes(colunas)
+    if not cols["reg_ans"] or not cols["valor"] or not cols["descricao"]:
+        return None
+
+    alvo = {normalizar_coluna(c) for k, c in cols.items() if c and k != "data"}
+    # compara normalizado: o nome que o pandas vê pode vir com BOM ou espaços
+    return lambda c: normalizar_coluna(c) in alvo
+
+
+def csv_chunks_c(
+    arquivo: ArquivoTabular,
+    sep: str,
+    encoding: str,
+    chunksize: int,
+    usecols: Optional[Callable[[str], bool]],
+    registro: Dict[str, Any],
+) -> Iterator[pd.DataFrame]:
+    """ Engine C com projeção de colunas. Se o arquivo estiver malformado a ponto de o C desistir antes do primeiro chunk, relê com a engine python (mais tolerante), com todas as colunas. Em registro ficam o encoding final e o byte onde houve troca UTF-8 -> latin1."""
+    rendeu = False
+    try:
+        with abrir_binario(arquivo) as raw:
+            f = DecodificadorAdaptativo(raw, encoding)
+            for chunk in pd.read_csv(
+                f,
+                sep=sep,
+                dtype=str,
+                chunksize=chunksize,
+                engine="c",
+                usecols=usecols,
+                on_bad_lines="skip",
+            ):
+                rendeu = True
+                registro.update(encoding=f.encoding_atual, troca_no_byte=f.troca_no_byte)
+                yield chunk
+            registro.update(encoding=f.encoding_atual, troca_no_byte=f.troca_no_byte)
+        return
+    except pd.errors.ParserError:
+        # depois de algum chunk já agregado, reler duplicaria valores
+        if rendeu:
+            raise
+
+    LOGGER.info("    Engine C falhou em %s, relendo com a engine python", arquivo.nome)
+    with abrir_binario(arquivo) as raw:
+        f = DecodificadorAdaptativo(raw, encoding)
         yield from pd.read_csv(
-            path,
+            f,
             sep=sep,
             dtype=str,
             chunksize=chunksize,
-            encoding="latin1",
             engine="python",
             on_bad_lines="skip",
         )
+        registro.update(encoding=f.encoding_atual, troca_no_byte=f.troca_no_byte)
+
+
+def item_csv_chunks(
+    arquivo: ArquivoTabular,
+    chunksize: int,
+    encodings: Optional[List[Dict[str, Any]]] = None,
+    cabecalho: Optional[Tuple[str, List[str], str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """Chunks do CSV lidos numa passada só. Se encodings for passado, recebe um registro do encoding usado no arquivo. cabecalho: o de ler_cabecalho_csv, se quem chama já leu."""
+    sep, colunas, encoding = cabecalho or ler_cabecalho_csv(arquivo)
+    usecols = colunas_projetadas(colunas)
+
+    registro: Dict[str, Any] = {"arquivo": arquivo.nome, "amostra": encoding, "encoding": encoding, "troca_no_byte": None}
+    if encodings is not None:
+        encodings.append(registro)
+
+    yield from csv_chunks_c(arquivo, sep, encoding, chunksize, usecols, registro)
+
+    if registro["troca_no_byte"] is not None:
+        LOGGER.info("    %s: UTF-8 inválido a partir do byte %d, resto lido como latin1",
+                    arquivo.nome, registro["troca_no_byte"])
+
+
+def indexar_contas_df(df: pd.DataFrame, reg_col: Optional[str], conta_col: Optional[str]) -> IndiceContas:
+    if not reg_col or not conta_col or reg_col not in df.columns or conta_col not in df.columns:
+        return IndiceContas(frozenset())
+
+    conta = df[conta_col].fillna("").astype(str).str.strip()
+    reg_ans = df.loc[conta == "41", reg_col].fillna("").astype(str).str.strip()
+    return IndiceContas(frozenset(reg_ans.unique()))
+
+
+def indexar_contas(arquivo: ArquivoTabular, cabecalho: Tuple[str, List[str], str]) -> IndiceContas:
+    """ Passada barata antes da agregação: lê do stream (membro do ZIP ou arquivo solto) só REG_ANS e conta, com a engine C. Assim a regra da conta 41 é decidida por arquivo e por operadora, e não muda conforme onde caem os limites dos chunks. Nada vai para o disco."""
+    sep, colunas, encoding = cabecalho
+    cols = escolher_colunas_nomes(colunas)
+    if not cols["reg_ans"] or not cols["conta"]:
+        return IndiceContas(frozenset())
+
+    reg_norm = normalizar_coluna(cols["reg_ans"])
+    conta_norm = normalizar_coluna(cols["conta"])
+    reg_com_41: set = set()
+    for chunk in csv_chunks_c(arquivo, sep, encoding, CHUNK_SIZE_INDICE,
+                              lambda c: normalizar_coluna(c) in (reg_norm, conta_norm), {}):
+        nomes = {normalizar_coluna(c): c for c in chunk.columns}
+        reg_com_41 |= indexar_contas_df(chunk, nomes.get(reg_norm), nomes.get(conta_norm)).reg_com_41
+    return IndiceContas(frozenset(reg_com_41))
+
+
+def com_indice(chunks: Iterable[pd.DataFrame]) -> Iterator[Tuple[pd.DataFrame, IndiceContas]]:
+    """ Os chunks de uma planilha XLSX de volta, cada um com o índice de contas da planilha inteira. Diferente do CSV, não há passada barata: o openpyxl interpreta o XML da planilha inteira mesmo para duas colunas, e é isso que custa. Então a planilha é lida uma vez, os chunks ficam guardados enquanto o índice é montado e voltam já com o índice pronto."""
+    reg_com_41: set = set()
+    guardados: List[pd.DataFrame] = []
+    linhas = 0
+    with tempfile.TemporaryFile() as spool:
+        n_spool = 0
+        for chunk in chunks:
+            cols = escolher_colunas_nomes(list(chunk.columns))
+            reg_com_41 |= indexar_contas_df(chunk, cols["reg_ans"], cols["conta"]).reg_com_41
+            linhas += len(chunk)
+            # Até LINHAS_INDICE_EM_MEMORIA, em memória: o caso comum (planilhas da ANS são pequenas; os trimestres
+            # grandes vêm em CSV) não escreve nada em disco. Acima disso, o pickle de colunas object fica maior que
+            # o próprio XLSX descompactado, mas é escrito e lido uma vez só, bem mais barato que interpretar o XML
+            # de novo; a memória fica limitada.
+            if linhas <= LINHAS_INDICE_EM_MEMORIA:
+                guardados.append(chunk)
+            else:
+                pickle.dump(chunk, spool, protocol=pickle.HIGHEST_PROTOCOL)
+                n_spool += 1
+
+        indice = IndiceContas(frozenset(reg_com_41))
+        for chunk in guardados:
+            yield chunk, indice
+        guardados.clear()
+        spool.seek(0)
+        for _ in range(n_spool):
+            yield pickle.load(spool), indice
+
+
+def valor_celula_xlsx(v: Any) -> Any:
+    """Célula do openpyxl (values_only) como o pd.read_excel(dtype=str) entregava: texto, número inteiro sem ".0" e vazio/NA/erro como NaN."""
+    if v is None:
+        return np.nan
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    texto = str(v)
+    return np.nan if texto in VAZIOS_XLSX else texto
+
+
+def nomes_colunas_xlsx(cabecalho: Tuple[Any, ...]) -> List[str]:
+    """Nomes de coluna como o pandas dá: célula vazia vira "Unnamed: i" e repetidos ganham ".1", ".2"..."""
+    nomes: List[str] = []
+    vistos: Dict[str, int] = {}
+    for i, v in enumerate(cabecalho):
+        nome = f"Unnamed: {i}" if v is None or v == "" else str(int(v) if isinstance(v, float) and v.is_integer() else v)
+        if nome in vistos:
+            k = vistos[nome]
+            while f"{nome}.{k}" in vistos:
+                k += 1
+            vistos[nome] = k + 1
+            nome = f"{nome}.{k}"
+        vistos.setdefault(nome, 1)
+        nomes.append(nome)
+    return nomes
+
+
+@contextmanager
+def abrir_xlsx(arquivo: ArquivoTabular) -> Iterator[Any]:
+    """Caminho ou arquivo aberto para o openpyxl. XLSX é um ZIP também: o openpyxl precisa de acesso aleatório, então o membro vai para um arquivo temporário (em disco, não em memória)."""
+    if arquivo.membro is None:
+        yield arquivo.path
+        return
+    with tempfile.TemporaryFile() as tmp:
+        with abrir_binario(arquivo) as src:
+            shutil.copyfileobj(src, tmp, length=1024 * 1024)
+        tmp.seek(0)
+        yield tmp
+
+
+def xlsx_chunks(planilha: Any, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Uma planilha (openpyxl read_only) em DataFrames de até chunksize linhas, só com as colunas de colunas_projetadas (como o usecols do CSV). Linhas totalmente vazias ficam de fora."""
+    linhas = (
+        linha for linha in planilha.iter_rows(values_only=True)
+        if any(v is not None and v != "" for v in linha)
+    )
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        return
 
-
-def item_xlsx_frames(path: Path) -> Iterator[pd.DataFrame]:
-    xls = pd.ExcelFile(path, engine="openpyxl")
-    for sheet in xls.sheet_names:
-        df = pd.read_excel(xls, sheet_name=sheet, dtype=str, engine="openpyxl")
-        yield df
+    nomes = nomes_colunas_xlsx(cabecalho)
+    filtro = colunas_projetadas(nomes)
+    idx = [i for i, nome in enumerate(nomes) if filtro is None or filtro(nome)]
+    if not idx:
+        return
+    colunas = [nomes[i] for i in idx]
+
+    bloco: List[List[Any]] = []
+    for linha in linhas:
+        n = len(linha)
+        bloco.append([valor_celula_xlsx(linha[i]) if i < n else np.nan for i in idx])
+        if len(bloco) >= chunksize:
+            yield pd.DataFrame(bloco, columns=colunas, dtype=object)
+            bloco = []
+    if bloco:
+        yield pd.DataFrame(bloco, columns=colunas, dtype=object)
+
+
+def item_xlsx_frames(
+    arquivo: ArquivoTabular,
+    chunksize: int = CHUNK_SIZE_CSV,
+) -> Iterator[Tuple[pd.DataFrame, IndiceContas]]:
+    """Chunks de cada planilha, com as mesmas colunas projetadas do CSV, junto com o índice de contas da planilha (a regra da 41 era decidida na planilha inteira e continua assim). Em stream (openpyxl read_only): a memória depende do chunksize, não do tamanho da planilha."""
+    with abrir_xlsx(arquivo) as origem:
+        # read_only: as linhas vêm do XML sob demanda, sem montar a planilha em memória
+        wb = load_workbook(origem, read_only=True, data_only=True, keep_links=False)
+        try:
+            for planilha in wb.worksheets:
+                yield from com_indice(xlsx_chunks(planilha, chunksize))
+        finally:
+            wb.close()
 
 
 # =========================
 # Detecção de colunas (CORRIGIDO)
 # =========================
 def escolher_colunas(df: pd.DataFrame) -> Dict[str, Optional[str]]:
-    orig_cols = [str(c) for c in df.columns]
+    return escolher_colunas_nomes(list(df.columns))
+
+
+def escolher_colunas_nomes(colunas: List[Any]) -> Dict[str, Optional[str]]:
+    orig_cols = [str(c) for c in colunas]
     norm_map = {c: normalizar_coluna(c) for c in orig_cols}
     inv = {v: k for k, v in norm_map.items()}
 
@@ -258,15 +777,22 @@ def filtrar_eventos_sinistros(df: pd.DataFrame, descricao_col: Optional[str]) ->
         return pd.Series([], dtype=bool)
 
     if descricao_col and descricao_col in df.columns:
-        s = df[descricao_col].fillna("").astype(str)
-        return s.map(despesa_eventos_sinistros)
+        evento, receita = marcar_termos(df[descricao_col])
+        return pd.Series(evento & ~receita, index=df.index)
 
     cols_texto = [c for c in df.columns if df[c].dtype == "object"][:8]
     if not cols_texto:
         return pd.Series([False] * len(df), dtype=bool)
 
-    joined = df[cols_texto].fillna("").astype(str).agg(" ".join, axis=1)
-    return joined.map(despesa_eventos_sinistros)
+    # Mesmo resultado de classificar as colunas juntadas com " ": os termos não têm espaço,
+    # então basta combinar o resultado de cada coluna
+    evento = np.zeros(len(df), dtype=bool)
+    receita = np.zeros(len(df), dtype=bool)
+    for c in cols_texto:
+        e, r = marcar_termos(df[c])
+        evento |= e
+        receita |= r
+    return pd.Series(evento & ~receita, index=df.index)
 
 
 def agregar_normalizado(
@@ -274,8 +800,10 @@ def agregar_normalizado(
     tref: TrimestreRef,
     erros: List[Dict[str, str]],
     origem: str,
+    indice: Optional[IndiceContas] = None,
+    pf: Optional[PontoFixo] = None,
 ) -> Dict[str, Decimal]:
-    """ Agrega: REG_ANS -> soma(valor) para despesas de Eventos/Sinistros. Regra anti-double-count: Se existir CD_CONTA_CONTABIL == "41", usa APENAS essa conta (total). Senão, cai para heurística por DESCRICAO."""
+    """ Agrega: REG_ANS -> soma(valor) para despesas de Eventos/Sinistros. Regra anti-double-count: operadora que tem CD_CONTA_CONTABIL == "41" no arquivo usa APENAS essa conta (total). As demais caem para heurística por DESCRICAO. indice diz quem tem a 41 no arquivo inteiro; sem ele, vale o próprio df. pf é a coluna de valor do df inteiro já em ponto fixo (valores_do_chunk); sem ele, só as linhas filtradas são convertidas."""
     if df.empty:
         return {}
 
@@ -295,92 +823,234 @@ def agregar_normalizado(
         })
         return {}
 
-    # Máscara base (EVENTO/SINISTRO)
-    mask = filtrar_eventos_sinistros(df, desc_col)
+    if indice is None:
+        indice = indexar_contas_df(df, reg_col, conta_col)
 
-    # Anti double-count: se existir conta 41, fica só nela
+    reg_todas = df[reg_col].fillna("").astype(str).str.strip()
     conta = None
     if conta_col and conta_col in df.columns:
         conta = df[conta_col].fillna("").astype(str).str.strip()
 
-    mask_desc = filtrar_eventos_sinistros(df, desc_col)
+    # Anti double-count: operadora com conta 41 no arquivo fica SÓ nela (não depende de texto)
+    usa_41 = reg_todas.isin(indice.reg_com_41) if conta is not None else pd.Series(False, index=df.index)
+    mask = usa_41 & (conta == "41") if conta is not None else usa_41.copy()
 
-    # Se existe 41, usa SÓ ela (não depende de texto)
-    if conta is not None and (conta == "41").any():
-        mask = (conta == "41")
-    else:
-        # Senão, usa heurística por descrição e restringe ao bloco de contas relevante
-        mask = mask_desc
-        if conta is not None:
-            mask = mask & conta.str.match(r"^[47]")
+    # As outras: heurística por descrição, restrita ao bloco de contas relevante.
+    # O texto só é avaliado nessas linhas.
+    resto = ~usa_41
+    if conta is not None:
+        resto &= conta.str.match(r"^[47]")
+    if bool(resto.any()):
+        mask[resto] = filtrar_eventos_sinistros(df.loc[resto], desc_col).to_numpy(dtype=bool)
 
-    if mask is None or not bool(mask.any()):
+    if not bool(mask.any()):
         return {}
 
-    sub = df.loc[mask, [reg_col, valor_col]].copy()
-    sub["REG_ANS"] = sub[reg_col].fillna("").astype(str).str.strip()
-    sub["VAL_DEC"] = sub[valor_col].map(analisar_decimal_br)
+    sub = df.loc[mask, [reg_col, valor_col]]
+    reg_ans = reg_todas[mask]
+
+    # Soma em inteiros (ponto fixo) por REG_ANS: exata, sem um Decimal por linha
+    pf = para_ponto_fixo(sub[valor_col], formato="br") if pf is None else pf.linhas(mask)
+    out: Dict[str, Decimal] = {str(k): v for k, v in somar_por_grupo(reg_ans, pf).items()}
 
-    # Remove valores inválidos
-    inval = sub["VAL_DEC"].isna()
+    # O que não é "[-]1.234,56" simples (vazio, lixo, expoente, muitas casas) vai pelo Decimal de antes
+    resto_raw = sub.loc[~pf.ok, valor_col]
+    resto = resto_raw.map(analisar_decimal_br)
+    inval = resto.isna()
     if bool(inval.any()):
         erros.append({
             "tipo": "valor_invalido",
             "ano": str(tref.ano),
             "trimestre": str(tref.trimestre),
-            "detalhe": f"{Path(origem).name} | exemplos_raw={sub.loc[inval, valor_col].head(3).tolist()}",
+            "detalhe": f"{Path(origem).name} | exemplos_raw={resto_raw[inval].head(3).tolist()}",
         })
-        sub = sub.loc[~inval]
 
-    if sub.empty:
-        return {}
+    for reg, val in zip(reg_ans[~pf.ok][~inval], resto[~inval]):
+        reg = str(reg)
+        out[reg] = out[reg] + val if reg in out else val
+
+    return out
 
-    # Groupby (bem mais rápido que iterrows)
-    g = sub.groupby("REG_ANS")["VAL_DEC"].sum()
 
-    out: Dict[str, Decimal] = {}
-    for reg_ans, val in g.items():
-        out[str(reg_ans)] = Decimal(str(val))
+def valores_do_chunk(df: pd.DataFrame) -> Optional[PontoFixo]:
+    """A coluna de valor do chunk em ponto fixo, convertida uma vez para a agregação e para o rollup. None se não há coluna de valor."""
+    valor_col = escolher_colunas(df)["valor"]
+    if df.empty or not valor_col:
+        return None
+    return para_ponto_fixo(df[valor_col], formato="br")
+
 
+def centavos_linhas(valores: pd.Series, pf: Optional[PontoFixo] = None) -> pd.Series:
+    """Valor de cada linha em centavos (ROUND_HALF_UP), Int64 com nulo onde não há número. O que foge do formato simples vai pelo analisar_decimal_br. pf: valores já convertidos."""
+    pf = para_ponto_fixo(valores, formato="br") if pf is None else pf
+    out = centavos_half_up(pf).astype("Int64").where(pf.ok)
+    if not bool(pf.ok.all()):
+        def centavos(d: Optional[Decimal]) -> Optional[int]:
+            if d is None or not d.is_finite():
+                return None
+            c = int(d.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP).scaleb(2))
+            return c if -2 ** 63 < c < 2 ** 63 else None
+
+        out[~pf.ok] = pd.array(valores[~pf.ok].map(analisar_decimal_br).map(centavos).tolist(), dtype="Int64")
     return out
 
 
-def processar_trimestre(
-    extract_dir: Path,
+def acumular_contas(df: pd.DataFrame, contas: AcumuladorContas, pf: Optional[PontoFixo] = None) -> None:
+    """Soma por (REG_ANS, conta) de todas as linhas do chunk, sem filtro de despesa: base do rollup do plano de contas. pf: a coluna de valor já convertida (valores_do_chunk)."""
+    cols = escolher_colunas(df)
+    if df.empty or not cols["reg_ans"] or not cols["conta"] or not cols["valor"]:
+        return
+    reg_ans = df[cols["reg_ans"]].fillna("").astype(str).str.strip()
+    conta = df[cols["conta"]].fillna("").astype(str).str.strip()
+    contas.adicionar(reg_ans, conta, centavos_linhas(df[cols["valor"]], pf))
+
+
+def linhas_brutas(arquivo: ArquivoTabular, encodings: List[Dict[str, Any]]) -> Iterator[Tuple[pd.DataFrame, IndiceContas]]:
+    """Chunks lidos do arquivo original, cada um com o índice de contas que vale para ele."""
+    if arquivo.ext in (".csv", ".txt"):
+        cabecalho = ler_cabecalho_csv(arquivo)
+        indice = indexar_contas(arquivo, cabecalho)
+        for chunk in item_csv_chunks(arquivo, CHUNK_SIZE_CSV, encodings, cabecalho):
+            yield chunk, indice
+    elif arquivo.ext == ".xlsx":
+        yield from item_xlsx_frames(arquivo)
+
+
+def passar_pelo_cache(
+    gravador: GravadorLinhas,
+    fonte: Iterator[Tuple[pd.DataFrame, IndiceContas]],
+) -> Iterator[Tuple[pd.DataFrame, IndiceContas]]:
+    """Grava cada chunk no cache de linhas no caminho para a agregação. Um índice novo (outra planilha) abre uma nova parte."""
+    partes: List[List[str]] = []
+    ultimo: Optional[IndiceContas] = None
+    for chunk, indice in fonte:
+        if not gravador.cancelado:
+            cols = escolher_colunas(chunk)
+            if not cols["reg_ans"] or not cols["valor"] or not cols["descricao"]:
+                # sem a projeção o agregador olha todas as colunas de texto: não cabe no cache
+                gravador.cancelar()
+            else:
+                if indice is not ultimo:
+                    partes.append(sorted(indice.reg_com_41))
+                    ultimo = indice
+                presentes = [k for k in COLUNAS_CACHE if cols[k]]
+                gravador.gravar(pd.DataFrame({k: chunk[cols[k]] for k in presentes}), parte=len(partes) - 1)
+        yield chunk, indice
+    gravador.meta["reg_com_41"] = partes
+
+
+def linhas_do_cache(
+    cache: CacheLinhas,
+    chave: ChaveLinhas,
+    meta: Dict[str, Any],
+) -> Iterator[Tuple[pd.DataFrame, IndiceContas]]:
+    """Os mesmos chunks de linhas_brutas, relidos do Parquet (mesmos limites, mesmas colunas, mesmo índice por parte)."""
+    indices = [IndiceContas(frozenset(regs)) for regs in meta["reg_com_41"]]
+    for df, parte in cache.frames(chave):
+        yield df.rename(columns=COLUNAS_CACHE), indices[parte]
+
+
+def processar_arquivo(
+    arquivo: ArquivoTabular,
     tref: TrimestreRef,
-    erros: List[Dict[str, str]]
-) -> Dict[str, Decimal]:
+    cache: Optional[CacheLinhas] = None,
+) -> ResultadoArquivo:
+    """Agrega um arquivo de um trimestre. É a unidade de trabalho do --jobs: roda em processo filho e não mexe em nada compartilhado. Com cache, membros de ZIP já lidos vêm do Parquet, e os novos são gravados lá enquanto são agregados. Na mesma passada soma todas as contas por operadora, para o rollup."""
+    t0 = time.perf_counter()
     total: Dict[str, Decimal] = {}
+    contas = AcumuladorContas()
+    erros: List[Dict[str, str]] = []
+    encodings: List[Dict[str, Any]] = []
+    uso_cache: Optional[str] = None
+
+    def somar(fonte: Iterator[Tuple[pd.DataFrame, IndiceContas]]) -> None:
+        for chunk, indice in fonte:
+            # o valor é convertido uma vez e serve às duas somas
+            pf = valores_do_chunk(chunk)
+            part = agregar_normalizado(chunk, tref, erros, origem=arquivo.nome, indice=indice, pf=pf)
+            for k, v in part.items():
+                total[k] = total.get(k, Decimal("0")) + v
+            acumular_contas(chunk, contas, pf)
+
+    chave = None
+    if cache is not None and arquivo.membro and arquivo.sha256_zip:
+        chave = ChaveLinhas(tref.ano, tref.trimestre, arquivo.sha256_zip, arquivo.membro, VERSAO_LEITURA)
 
-    for arquivo in item_arquivos_tabulares(extract_dir):
-        ext = arquivo.suffix.lower()
-        try:
-            if ext in (".csv", ".txt"):
-                for chunk in item_csv_chunks(arquivo, CHUNK_SIZE_CSV):
-                    part = agregar_normalizado(chunk, tref, erros, origem=str(arquivo))
-                    for k, v in part.items():
-                        total[k] = total.get(k, Decimal("0")) + v
-
-            elif ext == ".xlsx":
-                for frame in item_xlsx_frames(arquivo):
-                    part = agregar_normalizado(frame, tref, erros, origem=str(arquivo))
-                    for k, v in part.items():
-                        total[k] = total.get(k, Decimal("0")) + v
+    try:
+        meta = cache.meta(chave) if chave else None
+        if meta is not None:
+            uso_cache = "hit"
+            encodings.extend(meta.get("encodings", []))
+            somar(linhas_do_cache(cache, chave, meta))
+        elif chave is not None:
+            uso_cache = "miss"
+            with cache.gravando(chave, arquivo.nome) as gravador:
+                somar(passar_pelo_cache(gravador, linhas_brutas(arquivo, encodings)))
+                gravador.meta["encodings"] = encodings
+        else:
+            somar(linhas_brutas(arquivo, encodings))
+
+    except Exception as e:
+        erros.append({
+            "tipo": "erro_leitura_arquivo",
+            "ano": str(tref.ano),
+            "trimestre": str(tref.trimestre),
+            "detalhe": f"{arquivo.nome} | {e}",
+        })
 
-        except Exception as e:
-            erros.append({
-                "tipo": "erro_leitura_arquivo",
-                "ano": str(tref.ano),
-                "trimestre": str(tref.trimestre),
-                "detalhe": f"{arquivo.name} | {e}",
-            })
+    return ResultadoArquivo(
+        ParcialAgregado.de_somas(total), erros, encodings, time.perf_counter() - t0, uso_cache, contas.resultado()
+    )
+
+
+def juntar_parciais(partes: Iterable[ParcialAgregado]) -> ParcialAgregado:
+    """Soma exata de parciais. Associativa e comutativa: agrupar ou reordenar só muda a ordem das chaves."""
+    pares: Dict[str, Tuple[int, int]] = {}
+    extras: Dict[str, Decimal] = {}
+    for p in partes:
+        for reg, soma, escala in zip(p.reg_ans.tolist(), p.soma.tolist(), p.escala.tolist()):
+            if reg in pares:
+                soma0, escala0 = pares[reg]
+                e = max(escala0, escala)
+                pares[reg] = (soma0 * 10 ** (e - escala0) + soma * 10 ** (e - escala), e)
+            else:
+                pares[reg] = (soma, escala)
+        for reg, d in p.extras.items():
+            extras[reg] = extras[reg] + d if reg in extras else d
+    return ParcialAgregado.de_pares(pares, extras)
+
+
+def juntar_resultados(
+    resultados: Iterable[ResultadoArquivo],
+    erros: List[Dict[str, str]],
+    encodings: Optional[List[Dict[str, Any]]] = None,
+    contas: Optional[List[pd.DataFrame]] = None,
+) -> Dict[str, Decimal]:
+    """Junta os resultados na ordem dos arquivos: erros e encodings saem iguais com ou sem --jobs. As somas por conta de cada arquivo vão para contas, se passado."""
+    parciais = []
+    for r in resultados:
+        parciais.append(r.parcial)
+        erros.extend(r.erros)
+        if encodings is not None:
+            encodings.extend(r.encodings)
+        if contas is not None and r.contas is not None:
+            contas.append(r.contas)
+    return juntar_parciais(parciais).para_somas()
 
-    return total
+
+def processar_trimestre(
+    arquivos: Iterable[ArquivoTabular],
+    tref: TrimestreRef,
+    erros: List[Dict[str, str]],
+    encodings: Optional[List[Dict[str, Any]]] = None,
+    cache: Optional[CacheLinhas] = None,
+) -> Dict[str, Decimal]:
+    return juntar_resultados((processar_arquivo(a, tref, cache) for a in arquivos), erros, encodings)
 
 
 def salvar_csv_intermediario(tref: TrimestreRef, agg: Dict[str, Decimal]) -> Path:
     pasta_normal().mkdir(parents=True, exist_ok=True)
-    out_path = pasta_normal() / f"despesas_eventos_sinistros_{tref.rotulo()}.csv"
+    out_path = caminho_csv_intermediario(tref)
 
     with open(out_path, "w", encoding="utf-8", newline="") as f:
         w = csv.writer(f, delimiter=";")
@@ -406,8 +1076,297 @@ def salvar_relatorio_erros(erros: List[Dict[str, str]]) -> Path:
     return out_path
 
 
+def salvar_relatorio_encodings(encodings: List[Dict[str, Any]]) -> Path:
+    pasta_documentos().mkdir(parents=True, exist_ok=True)
+    out_path = pasta_documentos() / "relatorio_encodings.csv"
+
+    campos = ["ano", "trimestre", "arquivo", "amostra", "encoding", "troca_no_byte"]
+    with open(out_path, "w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=campos)
+        w.writeheader()
+        for e in encodings:
+            w.writerow({c: "" if e.get(c) is None else e[c] for c in campos})
+
+    return out_path
+
+
+def tref_do_item(item: Dict[str, Any]) -> TrimestreRef:
+    return TrimestreRef(ano=int(item["ano"]), trimestre=int(item["trimestre"]))
+
+
+def destino_zip(tref: TrimestreRef, url: str) -> Path:
+    return pasta_extraido() / tref.rotulo() / url.split("/")[-1]
+
+
+def baixar_zip(z: Dict[str, Any], destino: Path, partes: int) -> Dict[str, Any]:
+    """Baixa um ZIP do manifesto e devolve uma cópia da entrada com tamanho/sha256 atualizados."""
+    baixar_arquivo(z["url"], destino, partes=partes)
+    LOGGER.info("  Baixado: %s/%s", destino.parent.name, destino.name)
+    return dict(z, tamanho=destino.stat().st_size, sha256=sha256_arquivo(destino))
+
+
+def preparar_item(item: Dict[str, Any], extrair: bool) -> Tuple[List[ArquivoTabular], List[Dict[str, str]]]:
+    """Arquivos tabulares de um trimestre (ZIPs já baixados): membros lidos direto dos ZIPs ou, com extrair=True, descompactados antes em Dados/Extraído. Devolve também os erros de ZIP."""
+    tref = tref_do_item(item)
+    trimestre_dir = pasta_extraido() / tref.rotulo()
+    sha_por_zip = {destino_zip(tref, z["url"]): z.get("sha256") for z in zips_do_item(item)}
+
+    erros: List[Dict[str, str]] = []
+    arquivos: List[ArquivoTabular] = []
+
+    for zp, sha in sha_por_zip.items():
+        try:
+            if extrair:
+                LOGGER.info("  Extraindo: %s/%s", trimestre_dir.name, zp.name)
+                extrair_zip_seguro(zp, trimestre_dir)
+            else:
+                LOGGER.info("  Lendo direto do ZIP: %s/%s", trimestre_dir.name, zp.name)
+                arquivos.extend(item_arquivos_zip(zp, sha))
+        except Exception as e:
+            erros.append({
+                "tipo": "erro_extracao_zip",
+                "ano": str(tref.ano),
+                "trimestre": str(tref.trimestre),
+                "detalhe": f"{zp.name} | {e}",
+            })
+
+    if extrair:
+        arquivos = list(item_arquivos_tabulares(trimestre_dir))
+    return arquivos, erros
+
+
+def concluir_item(
+    item: Dict[str, Any],
+    agg: Dict[str, Decimal],
+    erros: List[Dict[str, str]],
+    encodings: List[Dict[str, Any]],
+    contas: List[pd.DataFrame],
+) -> None:
+    """Salva o CSV intermediário e o rollup de contas do trimestre e registra a saída em item["saida"]."""
+    tref = tref_do_item(item)
+    for e in encodings:
+        e.update(ano=str(tref.ano), trimestre=str(tref.trimestre))
+
+    total_valor = sum(agg.values(), Decimal("0"))
+    LOGGER.info("  Operadoras agregadas: %d", len(agg))
+    LOGGER.info("  Total de despesas (Eventos/Sinistros) no trimestre: R$ %s\n", formato_dinheiro(total_valor))
+
+    out_csv = salvar_csv_intermediario(tref, agg)
+    LOGGER.info("  Salvo: %s", out_csv.name)
+
+    rollup = rollup_contas(juntar_contas(contas))
+    out_contas = salvar_rollup(rollup, pasta_contas(), tref.ano, tref.trimestre)
+    LOGGER.info("  Rollup de contas: %d prefixos em %d operadoras -> %s\n",
+                rollup["prefixo"].nunique(), rollup["reg_ans"].nunique(),
+                out_contas.relative_to(pasta_dados()).as_posix())
+
+    item["saida"] = {
+        "arquivo": out_csv.name,
+        "sha256": sha256_arquivo(out_csv),
+        "versao": VERSAO_PROCESSAMENTO,
+        "zips": {z["url"]: z["sha256"] for z in zips_do_item(item)},
+        "erros": erros,
+        "encodings": encodings,
+    }
+
+
+def estagio_download(
+    pendentes: List[Dict[str, Any]],
+    saida: queue.Queue,
+    estagio: EstagioPipeline,
+    downloads: int,
+    partes: int,
+) -> None:
+    """Estágio 1: baixa os ZIPs de cada trimestre pendente, na ordem do manifesto (até `downloads` ao mesmo tempo)."""
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, downloads)) as executor:
+            for item in pendentes:
+                tref = tref_do_item(item)
+                t = TrimestreNoPipeline(item)
+                t0 = time.perf_counter()
+                try:
+                    t.zips = list(executor.map(
+                        lambda z: baixar_zip(z, destino_zip(tref, z["url"]), partes), zips_do_item(item)
+                    ))
+                except Exception as e:
+                    t.falha = e
+                estagio.ocupado += time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                saida.put(t)
+                estagio.bloqueado += time.perf_counter() - t0
+                if t.falha is not None:
+                    return
+    finally:
+        saida.put(None)
+
+
+def estagio_preparo(
+    entrada: queue.Queue,
+    saida: queue.Queue,
+    estagio: EstagioPipeline,
+    forcar: bool,
+    extrair: bool,
+) -> None:
+    """Estágio 2: confere o hash dos ZIPs novos e lista (ou extrai, com --extrair) os arquivos tabulares."""
+    try:
+        while True:
+            t0 = time.perf_counter()
+            t = entrada.get()
+            estagio.ocioso += time.perf_counter() - t0
+            if t is None:
+                return
+
+            t0 = time.perf_counter()
+            if t.falha is None:
+                try:
+                    # só metadados mudaram? o sha256 recém-calculado decide
+                    t.atualizado = not forcar and saida_atualizada({**t.item, "zips": t.zips}, tref_do_item(t.item))
+                    if not t.atualizado:
+                        t.arquivos, t.erros = preparar_item({**t.item, "zips": t.zips}, extrair)
+                except Exception as e:
+                    t.falha = e
+            estagio.ocupado += time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            saida.put(t)
+            estagio.bloqueado += time.perf_counter() - t0
+    finally:
+        saida.put(None)
+
+
+def resultado_pronto(valor: ResultadoArquivo) -> Future:
+    fut: Future = Future()
+    fut.set_result(valor)
+    return fut
+
+
+def executar_pipeline(
+    ultimos: List[Dict[str, Any]],
+    manifesto: Dict,
+    forcar: bool,
+    extrair: bool,
+    downloads: int,
+    partes: int,
+    jobs: int,
+    cache: Optional[CacheLinhas] = None,
+) -> List[Dict[str, str]]:
+    """Download -> preparo -> parse em estágios sobrepostos, ligados por filas de FILA_TRIMESTRES: o trimestre N+1 baixa enquanto o N é processado. O parse roda na thread principal ou, com jobs > 1, num pool de processos por (trimestre, arquivo). Os trimestres são fechados na ordem do manifesto, com erros e encodings na ordem dos arquivos. Retorna os erros de todos os trimestres."""
+    pendentes = [item for item in ultimos if forcar or not saida_atualizada(item, tref_do_item(item))]
+    ids_pendentes = {id(item) for item in pendentes}
+
+    baixados: queue.Queue = queue.Queue(maxsize=FILA_TRIMESTRES)
+    preparados: queue.Queue = queue.Queue(maxsize=FILA_TRIMESTRES)
+    est_download = EstagioPipeline("download")
+    est_preparo = EstagioPipeline("preparo")
+    est_parse = EstagioPipeline("processamento", capacidade=jobs)
+
+    erros: List[Dict[str, str]] = []
+    em_voo: List[Tuple[TrimestreNoPipeline, List[Future]]] = []
+    uso_cache = {"hit": 0, "miss": 0}
+
+    def fechar(t: TrimestreNoPipeline, futuros: List[Future]) -> None:
+        LOGGER.info("Trimestre %s:", tref_do_item(t.item).rotulo())
+        if t.atualizado:
+            LOGGER.info("  Sem mudanças nos ZIPs desde a última execução. Pulando.\n")
+            erros.extend(t.item["saida"].get("erros", []))
+        else:
+            resultados = [f.result() for f in futuros]
+            est_parse.ocupado += sum(r.segundos for r in resultados)
+            for r in resultados:
+                if r.cache:
+                    uso_cache[r.cache] += 1
+            encodings: List[Dict[str, Any]] = []
+            contas: List[pd.DataFrame] = []
+            agg = juntar_resultados(resultados, t.erros, encodings, contas)
+            concluir_item(t.item, agg, t.erros, encodings, contas)
+            erros.extend(t.erros)
+        if id(t.item) in ids_pendentes:
+            # grava a cada trimestre: se cair no meio, o que já foi feito não se perde
+            salvar_documento(manifesto)
+
+    def fechar_prontos(limite: int) -> None:
+        while em_voo and (len(em_voo) > limite or all(f.done() for f in em_voo[0][1])):
+            fechar(*em_voo.pop(0))
+
+    if pendentes:
+        LOGGER.info("Baixando %d ZIPs (%d simultâneos)...", sum(len(zips_do_item(i)) for i in pendentes), downloads)
+
+    inicio = time.perf_counter()
+    with (ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else nullcontext()) as pool:
+        if pool is not None:
+            # fork com threads rodando pode herdar locks presos: os processos sobem antes dos estágios
+            pool.submit(int).result()
+
+        threading.Thread(
+            target=estagio_download, args=(pendentes, baixados, est_download, downloads, partes), daemon=True
+        ).start()
+        threading.Thread(
+            target=estagio_preparo, args=(baixados, preparados, est_preparo, forcar, extrair), daemon=True
+        ).start()
+
+        for item in ultimos:
+            if id(item) not in ids_pendentes:
+                em_voo.append((TrimestreNoPipeline(item, atualizado=True), []))
+                fechar_prontos(jobs)
+                continue
+
+            t0 = time.perf_counter()
+            while True:
+                try:
+                    t = preparados.get(timeout=0.5)
+                    break
+                except queue.Empty:
+                    fechar_prontos(jobs)   # enquanto espera, fecha o que o pool já terminou
+            est_parse.ocioso += time.perf_counter() - t0
+
+            if t is None:
+                raise RuntimeError(f"Pipeline terminou antes do trimestre {tref_do_item(item).rotulo()}.")
+            if t.falha is not None:
+                raise t.falha
+            item["zips"] = t.zips
+
+            tref = tref_do_item(item)
+            if t.atualizado:
+                futuros: List[Future] = []
+            elif pool is None:
+                futuros = [resultado_pronto(processar_arquivo(a, tref, cache)) for a in t.arquivos]
+            else:
+                futuros = [pool.submit(processar_arquivo, a, tref, cache) for a in t.arquivos]
+            em_voo.append((t, futuros))
+            fechar_prontos(jobs)
+
+        fechar_prontos(0)
+    parede = time.perf_counter() - inicio
+
+    LOGGER.info("Pipeline: %.1fs", parede)
+    for est in (est_download, est_preparo, est_parse):
+        LOGGER.info(est.resumo(parede))
+    if cache is not None:
+        LOGGER.info(cache.resumo(uso_cache["hit"], uso_cache["miss"]))
+    return erros
+
+
+def ler_argumentos() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Baixa, extrai e agrega os trimestres do manifesto da etapa 1.1.")
+    parser.add_argument("--forcar", action="store_true",
+                        help="reprocessa todos os trimestres, mesmo os que não mudaram")
+    parser.add_argument("--downloads", type=int, default=DOWNLOADS_SIMULTANEOS,
+                        help="ZIPs baixados ao mesmo tempo")
+    parser.add_argument("--partes", type=int, default=PARTES_POR_ZIP,
+                        help="faixas paralelas (HTTP Range) por ZIP grande")
+    parser.add_argument("--extrair", action="store_true",
+                        help="descompacta os ZIPs em Dados/Extraído antes de processar (padrão: lê direto do ZIP)")
+    parser.add_argument("--jobs", type=int, default=JOBS_PADRAO,
+                        help="processos lendo/agregando arquivos ao mesmo tempo (padrão: 1, sem pool)")
+    parser.add_argument("--sem-cache-linhas", action="store_true",
+                        help="não lê nem grava o cache Parquet das linhas já lidas (Compartilhado/Cache/linhas)")
+    return parser.parse_args()
+
+
 def main() -> None:
     configurar_logging()
+    args = ler_argumentos()
 
     pasta_extraido().mkdir(parents=True, exist_ok=True)
     pasta_normal().mkdir(parents=True, exist_ok=True)
@@ -420,53 +1379,23 @@ def main() -> None:
 
     LOGGER.info("Processando %d trimestres...\n", len(ultimos))
 
-    erros: List[Dict[str, str]] = []
-
-    for item in ultimos:
-        ano = int(item["ano"])
-        tri = int(item["trimestre"])
-        urls: List[str] = list(item.get("zip_urls", []))
+    cache = None
+    if not args.sem_cache_linhas:
+        cache = cache_linhas_padrao()
+        cache.limpar()   # idade/tamanho: o limite pode ter mudado desde a última execução
 
-        tref = TrimestreRef(ano=ano, trimestre=tri)
-        rotulo = tref.rotulo()
-
-        LOGGER.info("Trimestre %s:", rotulo)
-
-        trimestre_dir = pasta_extraido() / rotulo
-        trimestre_dir.mkdir(parents=True, exist_ok=True)
-
-        zip_paths: List[Path] = []
-        for url in urls:
-            nome = url.split("/")[-1]
-            destino = trimestre_dir / nome
-            LOGGER.info("  Baixando: %s", nome)
-            baixar_arquivo(url, destino)
-            zip_paths.append(destino)
-
-        for zp in zip_paths:
-            LOGGER.info("  Extraindo: %s", zp.name)
-            try:
-                extrair_zip_seguro(zp, trimestre_dir)
-            except Exception as e:
-                erros.append({
-                    "tipo": "erro_extracao_zip",
-                    "ano": str(ano),
-                    "trimestre": str(tri),
-                    "detalhe": f"{zp.name} | {e}",
-                })
-
-        LOGGER.info("  Processando arquivos...")
-        agg = processar_trimestre(trimestre_dir, tref, erros)
-
-        total_valor = sum(agg.values(), Decimal("0"))
-        LOGGER.info("  Operadoras agregadas: %d", len(agg))
-        LOGGER.info("  Total de despesas (Eventos/Sinistros) no trimestre: R$ %s\n", formato_dinheiro(total_valor))
-
-        out_csv = salvar_csv_intermediario(tref, agg)
-        LOGGER.info("  Salvo: %s\n", out_csv.name)
+    erros = executar_pipeline(
+        ultimos, manifesto,
+        forcar=args.forcar, extrair=args.extrair,
+        downloads=args.downloads, partes=args.partes, jobs=max(1, args.jobs), cache=cache,
+    )
 
     rel = salvar_relatorio_erros(erros)
     LOGGER.info("Relatório de erros: %s", rel.name)
+    # trimestre pulado não relê os arquivos: o registro vem do manifesto
+    rel = salvar_relatorio_encodings([e for item in ultimos for e in item.get("saida", {}).get("encodings", [])])
+    LOGGER.info("Relatório de encodings: %s", rel.name)
+    LOGGER.info(cache_padrao().resumo())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import openpyxl
+import pandas as pd
+
+import Baixar_extrair_processar as proc
+from Benchmark_extracao import gerar_zip
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Cache_linhas import CacheLinhas  # noqa: E402
+
+CONTAS = [("41", "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS"), ("411", "EVENTOS INDENIZÁVEIS LÍQUIDOS"),
+          ("31", "CONTRAPRESTAÇÕES EFETIVAS"), ("46", "DESPESAS ADMINISTRATIVAS")]
+
+
+def gerar_xlsx_misto(path: Path, linhas: int, seed: int = 7) -> None:
+    """ XLSX em que as planilhas não têm as mesmas colunas: Plan1 tem CD_CONTA_CONTABIL (regra da 41), Plan2 não tem (tudo pela heurística da descrição). Foi o caso que a releitura do cache errava quando guardava uma lista de colunas só para o arquivo inteiro."""
+    rnd = random.Random(seed)
+    wb = openpyxl.Workbook()
+    plan1 = wb.active
+    plan1.title = "Plan1"
+    plan1.append(["DATA", "REG_ANS", "CD_CONTA_CONTABIL", "DESCRICAO", "VL_SALDO_FINAL"])
+    plan2 = wb.create_sheet("Plan2")
+    plan2.append(["DATA", "REG_ANS", "DESCRICAO", "VL_SALDO_FINAL"])
+    for _ in range(linhas):
+        conta, desc = rnd.choice(CONTAS)
+        valor = f"{rnd.randint(0, 10_000_000)},{rnd.randint(0, 99):02d}"
+        plan1.append(["2025-01-01", str(rnd.randint(300000, 300200)), conta, desc, valor])
+        plan2.append(["2025-01-01", str(rnd.randint(300000, 300200)), desc, valor])
+    wb.save(path)
+
+
+def processar(zip_path: Path, cache: Optional[CacheLinhas]) -> Tuple[float, List[Any]]:
+    tref = proc.TrimestreRef(ano=2025, trimestre=1)
+    t0 = time.perf_counter()
+    resultados = [proc.processar_arquivo(a, tref, cache) for a in proc.item_arquivos_zip(zip_path, proc.sha256_arquivo(zip_path))]
+    segundos = time.perf_counter() - t0
+    # o que tem que sair igual com e sem cache: somas, erros e somas por conta
+    return segundos, [
+        (r.parcial.para_somas(), r.erros, None if r.contas is None else r.contas.to_dict(), r.cache)
+        for r in resultados
+    ]
+
+
+def sem_uso_cache(resultado: List[Any]) -> List[Any]:
+    return [r[:3] for r in resultado]
+
+
+def limpar_durante_gravacao(pasta: Path) -> bool:
+    """ limpar() de outro processo no meio de uma gravação (aqui, outra instância) não pode levar o temporário nem a pasta da entrada que está sendo gravada."""
+    gravando, outro = CacheLinhas(pasta), CacheLinhas(pasta)
+    chave = proc.ChaveLinhas(2025, 1, "f" * 64, "x.csv", proc.VERSAO_LEITURA)
+    linhas = pd.DataFrame({"reg_ans": ["1"], "conta": ["41"], "descricao": ["EVENTOS"], "valor": ["1,00"]})
+    with gravando.gravando(chave, "x.csv") as gravador:
+        gravador.gravar(linhas, parte=0)
+        outro.limpar()
+        gravador.meta["reg_com_41"] = [["1"]]
+    return gravando.meta(chave) is not None and len(list(gravando.frames(chave))) == 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Confere e mede a agregação sem cache, gravando no cache de linhas e relendo dele.")
+    parser.add_argument("--mb", type=int, default=64, help="tamanho do CSV sintético")
+    parser.add_argument("--linhas-xlsx", type=int, default=20_000, help="linhas por planilha do XLSX sintético")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_cache_linhas_") as tmp:
+        tmp = Path(tmp)
+        xlsx = tmp / "misto.xlsx"
+        gerar_xlsx_misto(xlsx, args.linhas_xlsx)
+        zip_xlsx = tmp / "xlsx.zip"
+        with zipfile.ZipFile(zip_xlsx, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(xlsx, "dados/misto.xlsx")
+        zip_csv = tmp / "csv.zip"
+        gerar_zip(zip_csv, args.mb)
+
+        iguais = True
+        for nome, zip_path in (("XLSX, planilhas com colunas diferentes", zip_xlsx), (f"CSV {args.mb} MB", zip_csv)):
+            cache = CacheLinhas(tmp / f"cache_{zip_path.stem}")
+            tempos: Dict[str, float] = {}
+            tempos["sem cache"], base = processar(zip_path, None)
+            tempos["miss (grava)"], miss = processar(zip_path, cache)
+            tempos["hit (relê)"], hit = processar(zip_path, cache)
+            ok = (sem_uso_cache(miss) == sem_uso_cache(base) == sem_uso_cache(hit)
+                  and all(r[3] == "hit" for r in hit))
+            iguais &= ok
+            print(f"{nome}:")
+            for modo, s in tempos.items():
+                print(f"  {modo:<14} {s:8.2f}s")
+            print(f"  resultados iguais: {ok}\n")
+
+        concorrente = limpar_durante_gravacao(tmp / "cache_concorrente")
+        print(f"Gravação sobrevive a limpar() concorrente: {concorrente}")
+        print(f"\nTudo igual: {iguais and concorrente}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+import Baixar_extrair_processar as proc
+
+# Descrições no estilo das demonstrações contábeis: poucas centenas de textos distintos
+BASE_DESCRICOES = [
+    "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS DE ASSISTÊNCIA A SAÚDE MEDICO HOSPITALAR",
+    "EVENTOS INDENIZÁVEIS LÍQUIDOS / SINISTROS RETIDOS",
+    "Eventos/Sinistros Conhecidos ou Avisados",
+    "RECUPERAÇÃO DE EVENTOS/SINISTROS - RECEITA",
+    "CONTRAPRESTAÇÕES EFETIVAS DE PLANO DE ASSISTÊNCIA À SAÚDE",
+    "DESPESAS ADMINISTRATIVAS",
+    "Variação da Provisão de Eventos Ocorridos e Não Avisados",
+    "RECEITAS COM OPERAÇÕES DE ASSISTÊNCIA À SAÚDE",
+    "TRIBUTOS DIRETOS DE OPERAÇÕES COM PLANOS DE ASSISTÊNCIA À SAÚDE",
+    "OUTRAS DESPESAS OPERACIONAIS",
+]
+
+
+def gerar_coluna(linhas: int, distintas: int, seed: int = 42) -> pd.Series:
+    rnd = random.Random(seed)
+    textos = [f"{rnd.choice(BASE_DESCRICOES)} {i:04d}" for i in range(distintas)]
+    idx = np.random.default_rng(seed).integers(0, distintas, size=linhas)
+    return pd.Series(np.array(textos, dtype=object)[idx])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Classificador Eventos/Sinistros: por linha (antigo) x por texto distinto.")
+    parser.add_argument("--linhas", type=int, default=10_000_000)
+    parser.add_argument("--distintas", type=int, default=500)
+    args = parser.parse_args()
+
+    s = gerar_coluna(args.linhas, args.distintas)
+    df = pd.DataFrame({"DESCRICAO": s})
+    print(f"{args.linhas:_} linhas, {args.distintas} descrições distintas\n".replace("_", "."))
+
+    proc.normalizar_texto_cache.cache_clear()
+    t0 = time.perf_counter()
+    novo = proc.filtrar_eventos_sinistros(df, "DESCRICAO")
+    t_novo = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    antigo = s.fillna("").astype(str).map(proc.despesa_eventos_sinistros)
+    t_antigo = time.perf_counter() - t0
+
+    print(f"Por linha (map):         {t_antigo:8.2f}s")
+    print(f"Por texto distinto:      {t_novo:8.2f}s")
+    print(f"Ganho: {t_antigo / t_novo:.0f}x | resultados iguais: {bool((antigo.to_numpy(dtype=bool) == novo.to_numpy()).all())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import Baixar_extrair_processar as proc
+
+MODOS = ("extrair_antigo", "extrair", "zip")
+
+
+def gerar_zip(path: Path, tamanho_mb: int, seed: int = 42) -> None:
+    """ZIP com um CSV no layout da ANS até atingir tamanho_mb descompactado."""
+    rnd = random.Random(seed)
+    contas = [("41", "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS"), ("411", "EVENTOS INDENIZÁVEIS LÍQUIDOS"),
+              ("31", "CONTRAPRESTAÇÕES EFETIVAS"), ("46", "DESPESAS ADMINISTRATIVAS")]
+    linhas = []
+    for _ in range(50_000):
+        conta, desc = rnd.choice(contas)
+        valor = f"{rnd.randint(0, 10_000_000)},{rnd.randint(0, 99):02d}"
+        linhas.append(f'"2025-01-01";"{rnd.randint(300000, 420000)}";"{conta}";"{desc}";"0";"{valor}"\n')
+    bloco = "".join(linhas).encode("utf-8")
+
+    alvo = tamanho_mb * 1024 * 1024
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        with zf.open("1T2025.csv", "w", force_zip64=True) as dst:
+            dst.write(b"DATA;REG_ANS;CD_CONTA_CONTABIL;DESCRICAO;VL_SALDO_INICIAL;VL_SALDO_FINAL\n")
+            escrito = 0
+            while escrito < alvo:
+                dst.write(bloco)
+                escrito += len(bloco)
+
+
+def extrair_lendo_tudo(zip_path: Path, destino_dir: Path) -> None:
+    """Comportamento anterior de extrair_zip_seguro: membro inteiro em memória."""
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        for info in zf.infolist():
+            with zf.open(info, "r") as src, open(destino_dir / info.filename, "wb") as dst:
+                dst.write(src.read())
+
+
+def rodar_modo(modo: str, zip_path: Path) -> None:
+    """Executa um modo neste processo e imprime tempo e pico de RSS em JSON."""
+    tref = proc.TrimestreRef(ano=2025, trimestre=1)
+    erros: list = []
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="bench_extracao_") as tmp:
+        destino = Path(tmp)
+        if modo == "zip":
+            arquivos = proc.item_arquivos_zip(zip_path)
+        else:
+            if modo == "extrair_antigo":
+                extrair_lendo_tudo(zip_path, destino)
+            else:
+                proc.extrair_zip_seguro(zip_path, destino)
+            arquivos = list(proc.item_arquivos_tabulares(destino))
+        agg = proc.processar_trimestre(arquivos, tref, erros)
+    segundos = time.perf_counter() - t0
+
+    pico_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+    total = sum(agg.values(), proc.Decimal("0"))
+    print(json.dumps({"modo": modo, "segundos": segundos, "pico_rss_mb": pico_mb, "total": str(total)}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compara extrair para o disco x ler direto do ZIP (tempo e pico de RSS).")
+    parser.add_argument("--mb", type=int, default=1024, help="tamanho do CSV descompactado dentro do ZIP")
+    parser.add_argument("--zip", type=Path, help="usa um ZIP existente em vez de gerar")
+    parser.add_argument("--modo", choices=MODOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.modo:
+        rodar_modo(args.modo, args.zip)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench_zip_") as tmp:
+        zip_path = args.zip
+        if zip_path is None:
+            zip_path = Path(tmp) / "sintetico.zip"
+            print(f"Gerando ZIP sintético ({args.mb} MB descompactado)...")
+            gerar_zip(zip_path, args.mb)
+        print(f"ZIP: {zip_path.stat().st_size / 1024 / 1024:.0f} MB compactado\n")
+
+        # cada modo num processo novo, para o pico de RSS não vazar de um para o outro
+        resultados = []
+        for modo in MODOS:
+            saida = subprocess.run(
+                [sys.executable, __file__, "--modo", modo, "--zip", str(zip_path)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            r = json.loads(saida.strip().splitlines()[-1])
+            resultados.append(r)
+            print(f"{modo:<15} {r['segundos']:8.1f}s   pico RSS {r['pico_rss_mb']:8.0f} MB")
+
+    print(f"\nTotais iguais: {len({r['total'] for r in resultados}) == 1}")
+
+
+if __name__ == "__main__":
+    main()
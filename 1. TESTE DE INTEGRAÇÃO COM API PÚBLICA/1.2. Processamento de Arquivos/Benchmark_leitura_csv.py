@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+import pandas as pd
+
+import Baixar_extrair_processar as proc
+from Benchmark_extracao import gerar_zip
+
+
+def chunks_engine_python(arquivo: proc.ArquivoTabular, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Leitura anterior: engine python, todas as colunas."""
+    sep, _, _ = proc.ler_cabecalho_csv(arquivo)
+    try:
+        with proc.abrir_binario(arquivo) as f:
+            yield from pd.read_csv(f, sep=sep, dtype=str, chunksize=chunksize, encoding="utf-8",
+                                   engine="python", on_bad_lines="skip")
+    except UnicodeDecodeError:
+        with proc.abrir_binario(arquivo) as f:
+            yield from pd.read_csv(f, sep=sep, dtype=str, chunksize=chunksize, encoding="latin1",
+                                   engine="python", on_bad_lines="skip")
+
+
+def arquivos_de(paths: List[Path]) -> List[proc.ArquivoTabular]:
+    arquivos: List[proc.ArquivoTabular] = []
+    for p in paths:
+        if p.suffix.lower() == ".zip":
+            arquivos.extend(a for a in proc.item_arquivos_zip(p) if a.ext in (".csv", ".txt"))
+        else:
+            arquivos.append(proc.ArquivoTabular(p))
+    return arquivos
+
+
+def medir(
+    arquivos: List[proc.ArquivoTabular],
+    leitor: Callable[[proc.ArquivoTabular, int], Iterator[pd.DataFrame]],
+) -> Dict[str, object]:
+    """Tempo só de parse (sem agregar) e, à parte, o total agregado para conferir que nada mudou."""
+    tref = proc.TrimestreRef(ano=2025, trimestre=1)
+    linhas = 0
+    segundos = 0.0
+    total = Decimal("0")
+    for arquivo in arquivos:
+        t0 = time.perf_counter()
+        chunks = list(leitor(arquivo, proc.CHUNK_SIZE_CSV))
+        segundos += time.perf_counter() - t0
+        for chunk in chunks:
+            linhas += len(chunk)
+            total += sum(proc.agregar_normalizado(chunk, tref, [], origem=arquivo.nome).values(), Decimal("0"))
+    return {"segundos": segundos, "linhas": linhas, "total": total}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compara a leitura CSV antiga (engine python) com a nova (engine C + usecols).")
+    parser.add_argument("arquivos", nargs="*", type=Path,
+                        help="ZIPs/CSVs da ANS (padrão: os ZIPs baixados em Dados/Extraído; sem eles, um ZIP sintético)")
+    parser.add_argument("--mb", type=int, default=256, help="tamanho do CSV sintético, se for gerado")
+    args = parser.parse_args()
+
+    paths = args.arquivos or sorted(proc.pasta_extraido().glob("*/*.zip"))
+    with tempfile.TemporaryDirectory(prefix="bench_csv_") as tmp:
+        if not paths:
+            sintetico = Path(tmp) / "sintetico.zip"
+            print(f"Nenhum ZIP em {proc.pasta_extraido()}: gerando um sintético de {args.mb} MB")
+            gerar_zip(sintetico, args.mb)
+            paths = [sintetico]
+
+        arquivos = arquivos_de(paths)
+        print(f"Arquivos: {len(arquivos)} ({', '.join(a.nome for a in arquivos)})\n")
+
+        antigo = medir(arquivos, chunks_engine_python)
+        novo = medir(arquivos, proc.item_csv_chunks)
+
+    for nome, r in (("python (antigo)", antigo), ("C + usecols", novo)):
+        print(f"{nome:<16} {r['segundos']:8.2f}s   {r['linhas'] / r['segundos'] / 1e6:6.2f} M linhas/s")
+    print(f"\nGanho: {antigo['segundos'] / novo['segundos']:.1f}x")
+    print(f"Mesmas linhas: {antigo['linhas'] == novo['linhas']} | mesmos totais: {antigo['total'] == novo['total']}")
+
+
+if __name__ == "__main__":
+    main()
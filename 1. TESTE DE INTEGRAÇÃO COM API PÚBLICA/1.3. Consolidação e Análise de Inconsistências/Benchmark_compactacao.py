@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import Consolidar_e_gerar_zip  # noqa: F401  (coloca Compartilhado/ no sys.path)
+from Saida_compactada import blocos_csv, escrever_csv_compactado  # noqa: E402
+
+
+def gerar_consolidado(linhas: int, seed: int = 42) -> pd.DataFrame:
+    """Frame no formato do consolidado_despesas.csv: ~1.000 operadoras, 3 trimestres, valores em texto com 2 casas."""
+    rng = np.random.default_rng(seed)
+    reg = rng.integers(0, 1_000, size=linhas)
+    cnpj = (10_000_000_000_000 + reg * 7_919).astype(str)
+    razao = np.char.add("OPERADORA DE SAUDE ", reg.astype(str)).astype(object)
+    centavos = rng.integers(-10_000, 5_000_000_000, size=linhas)
+    valor = [f"{c // 100}.{c % 100:02d}" if c >= 0 else f"-{-c // 100}.{-c % 100:02d}" for c in centavos.tolist()]
+    return pd.DataFrame({
+        "CNPJ": cnpj, "RazaoSocial": razao, "Trimestre": (rng.integers(1, 4, size=linhas)).astype(str),
+        "Ano": "2025", "ValorDespesas": valor,
+    })
+
+
+def antigo(df: pd.DataFrame, pasta: Path) -> None:
+    """Caminho anterior da 1.3: grava o CSV e depois relê o arquivo para zipar."""
+    csv_path = pasta / "consolidado_despesas.csv"
+    df.to_csv(csv_path, sep=";", index=False, encoding="utf-8", quoting=csv.QUOTE_MINIMAL)
+    with zipfile.ZipFile(pasta / "consolidado_despesas.zip", "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.write(csv_path, arcname=csv_path.name)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CSV -> ZIP: gravar e reler (antigo) x uma passada, por formato e nível.")
+    parser.add_argument("--linhas", type=int, default=1_000_000)
+    parser.add_argument("--niveis", default="1,3,6,9", help="níveis de compressão, separados por vírgula")
+    args = parser.parse_args()
+
+    df = gerar_consolidado(args.linhas)
+    pasta = Path(tempfile.mkdtemp(prefix="bench_compactacao_"))
+    opcoes = dict(sep=";", encoding="utf-8", quoting=csv.QUOTE_MINIMAL)
+    try:
+        t0 = time.perf_counter()
+        antigo(df, pasta)
+        t_antigo = time.perf_counter() - t0
+        tamanho_csv = (pasta / "consolidado_despesas.csv").stat().st_size
+        referencia = (pasta / "consolidado_despesas.csv").read_bytes()
+        print(f"{args.linhas:_} linhas, CSV de {tamanho_csv / 1e6:.1f} MB\n".replace("_", "."))
+
+        t0 = time.perf_counter()
+        saidas = escrever_csv_compactado(df, pasta, "consolidado_despesas.csv", "consolidado_despesas.zip", **opcoes)
+        t_novo = time.perf_counter() - t0
+        iguais = saidas["csv"].read_bytes() == referencia \
+            and zipfile.ZipFile(saidas["zip"]).read("consolidado_despesas.csv") == referencia
+        t0 = time.perf_counter()
+        for _ in blocos_csv(df, **opcoes):
+            pass
+        t_texto = time.perf_counter() - t0
+        print(f"Só gerar o texto do CSV:           {t_texto:7.2f}s")
+        print(f"CSV + ZIP gravar e reler (antigo): {t_antigo:7.2f}s")
+        print(f"CSV + ZIP numa passada:            {t_novo:7.2f}s  | conteúdo igual: {iguais}\n")
+
+        print(f"{'formato':>8} {'nível':>6} {'tempo':>8} {'MB/s':>7} {'tamanho':>10} {'razão':>6}")
+        for formato in ("zip", "gz", "zst"):
+            for nivel in (int(x) for x in args.niveis.split(",")):
+                if formato == "zst" and nivel == 0:
+                    print(f"{formato:>8} {nivel:>6}   (zstd não tem nível 0)")
+                    continue
+                t0 = time.perf_counter()
+                saidas = escrever_csv_compactado(
+                    df, pasta, "x.csv", "x.zip" if formato == "zip" else None,
+                    extras=() if formato == "zip" else (formato,), nivel=nivel, gravar_csv=False, **opcoes,
+                )
+                dt = time.perf_counter() - t0
+                tamanho = saidas[formato].stat().st_size
+                print(f"{formato:>8} {nivel:>6} {dt:>7.2f}s {tamanho_csv / 1e6 / dt:>7.1f} "
+                      f"{tamanho / 1e6:>8.2f}MB {tamanho_csv / tamanho:>5.1f}x")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+import Consolidar_e_gerar_zip as consol
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Cadop import HistoricoCadop, snapshot_cadop  # noqa: E402
+
+CABECALHO_CADOP = "Registro_ANS;CNPJ;Razao_Social;Data_Registro_ANS;Data_Descredenciamento\n"
+# REG_ANS, trimestre, ano -> deve sair como reg_ans_cadop_cancelada?
+CASOS_CANCELAMENTO = [
+    ("100", "1T", "2025", False),   # cancelada em 2025-05-10, depois do 1T
+    ("100", "2T", "2025", True),    # ... e antes do fim do 2T
+    ("200", "1T", "2025", True),    # cancelada em 2024-12-01, antes do trimestre
+    ("300", "1T", "2025", False),   # registro antigo cancelado, registro novo ativo
+    ("400", "1T", "2025", False),   # cancelada depois do trimestre; registro novo ativo só depois dele
+    ("500", "1T", "2025", False),   # registro mais recente já cancelado, o anterior ainda valia
+    ("600", "1T", "2025", True),    # cancelada sem data de cancelamento
+]
+
+
+def gerar_merged(cnpjs: int, seed: int = 42) -> pd.DataFrame:
+    """Base já juntada com o CADOP: 3 trimestres por REG_ANS, ~1 em cada 20 CNPJs com mais de uma razão social."""
+    rng = np.random.default_rng(seed)
+    reg = np.arange(cnpjs * 2)
+    cnpj = reg // 2
+    razao = np.where((cnpj % 20 == 0) & (reg % 2 == 1), "OPERADORA B ", "OPERADORA A ") + cnpj.astype(str)
+    uma = pd.DataFrame({"REG_ANS": reg.astype(str), "CNPJ": cnpj.astype(str), "RazaoSocial": razao})
+    merged = pd.concat([uma] * 3, ignore_index=True)
+    return merged.iloc[rng.permutation(len(merged))].reset_index(drop=True)
+
+
+def por_cnpj_antigo(merged: pd.DataFrame) -> Dict[str, List[str]]:
+    """Laço anterior (sem o limite de 200): refiltra a base inteira para cada CNPJ ambíguo."""
+    tmp = merged.dropna(subset=["CNPJ", "RazaoSocial"])
+    nun = tmp.groupby("CNPJ")["RazaoSocial"].nunique()
+    return {
+        cnpj: sorted(tmp.loc[tmp["CNPJ"] == cnpj, "RazaoSocial"].unique().tolist())
+        for cnpj in nun[nun > 1].index.tolist()
+    }
+
+
+def conferir_cancelamentos() -> bool:
+    """ Cadastros de ativas e canceladas pequenos, passando pelo mesmo JOIN da consolidação: só é reg_ans_cadop_cancelada a operadora cancelada até o fim do trimestre. Cancelada depois do trimestre não conta."""
+    with tempfile.TemporaryDirectory(prefix="bench_cadop_") as tmp:
+        tmp = Path(tmp)
+        (tmp / "ativas.csv").write_text(CABECALHO_CADOP + "".join([
+            "300;33000000000300;OPERADORA 300 NOVA;2016-01-01;\n",
+            "400;44000000000400;OPERADORA 400 NOVA;2025-06-01;\n",
+        ]), encoding="utf-8")
+        (tmp / "canceladas.csv").write_text(CABECALHO_CADOP + "".join([
+            "100;11000000000100;OPERADORA 100;2010-01-01;2025-05-10\n",
+            "200;22000000000200;OPERADORA 200;2010-01-01;2024-12-01\n",
+            "300;33000000000300;OPERADORA 300;2010-01-01;2015-06-30\n",
+            "400;44000000000400;OPERADORA 400;2010-01-01;2025-05-01\n",
+            "500;55000000000500;OPERADORA 500;2010-01-01;2026-01-31\n",
+            "500;55000000000501;OPERADORA 500 FILIAL;2020-01-01;2021-12-31\n",
+            "600;66000000000600;OPERADORA 600;2010-01-01;\n",
+        ]), encoding="utf-8")
+        cadop = HistoricoCadop.de_snapshots(snapshot_cadop(tmp / "ativas.csv", pasta=tmp / "snap"),
+                                            snapshot_cadop(tmp / "canceladas.csv", pasta=tmp / "snap"))
+
+    validos = pd.DataFrame([c[:3] for c in CASOS_CANCELAMENTO], columns=["REG_ANS", "Trimestre", "Ano"])
+    merged = consol.juntar_cadop(validos, cadop).assign(NaoPositivo=False)
+    incons = consol.detectar_inconsistencias(validos, pd.Series(False, index=validos.index), merged)
+    marcadas = set(zip(*[incons.loc[incons["tipo"] == "reg_ans_cadop_cancelada", c] for c in ("reg_ans", "trimestre")]))
+
+    ok = True
+    print(f"{'REG_ANS':>8} {'tri':>6} {'CNPJ vigente':>15} {'cancelada em':>13} {'esperado':>9} {'marcada':>8}")
+    for (reg, tri, ano, esperado), cnpj, cancelamento in zip(CASOS_CANCELAMENTO, merged["CNPJ"], merged["DataCancelamento"]):
+        marcada = (reg, tri) in marcadas
+        ok &= marcada == esperado
+        print(f"{reg:>8} {tri + ano:>6} {cnpj:>15} {str(cancelamento):>13} {str(esperado):>9} {str(marcada):>8}")
+    # 500: o registro de 2020 acabou em 2021; em 2025 vale o de 2010
+    ok &= merged.loc[validos["REG_ANS"] == "500", "CNPJ"].tolist() == ["55000000000500"]
+    print(f"\nCancelamentos conferem: {ok}\n")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CNPJ com razões diferentes: laço por CNPJ (antigo) x um groupby.")
+    parser.add_argument("--cnpjs", default="5000,10000,20000,40000",
+                        help="quantidades de CNPJs, separadas por vírgula")
+    args = parser.parse_args()
+
+    conferir_cancelamentos()
+    print(f"{'CNPJs':>8} {'ambíguos':>9} {'por CNPJ':>10} {'groupby':>9}  iguais")
+    for n in (int(x) for x in args.cnpjs.split(",")):
+        merged = gerar_merged(n)
+
+        t0 = time.perf_counter()
+        antigo = por_cnpj_antigo(merged)
+        t_antigo = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        novo = consol.cnpjs_com_razoes_diferentes(merged)
+        t_novo = time.perf_counter() - t0
+
+        iguais = antigo == dict(zip(novo["CNPJ"], novo["razoes"]))
+        print(f"{n:>8} {len(novo):>9} {t_antigo:>9.2f}s {t_novo:>8.2f}s  {iguais}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,27 @@
 from __future__ import annotations
 
+import argparse
 import csv
 import logging
 import re
-import zipfile
+import sys
 from dataclasses import dataclass
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Módulos compartilhados entre os testes (pasta Compartilhado/ na raiz do repositório)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Cache_http import cache_padrao  # noqa: E402
+from Cadop import HistoricoCadop, SnapshotCadop, sha256_arquivo, snapshot_cadop  # noqa: E402
+from Consolidado import BaseConsolidada, Particao  # noqa: E402
+from Saida_compactada import FORMATOS_EXTRAS, NIVEL_PADRAO, escrever_csv_compactado  # noqa: E402
+from Valores_decimais import centavos_half_up, para_ponto_fixo, texto_centavos  # noqa: E402
 
 LOGGER = logging.getLogger("teste1.3")
 
@@ -18,6 +29,35 @@ CADOP_URL = (
     "https://dadosabertos.ans.gov.br/FTP/PDA/"
     "operadoras_de_plano_de_saude_ativas/Relatorio_cadop.csv"
 )
+CADOP_CANCELADAS_URL = (
+    "https://dadosabertos.ans.gov.br/FTP/PDA/"
+    "operadoras_de_plano_de_saude_canceladas/Relatorio_cadop_canceladas.csv"
+)
+
+# Linhas de cada tipo no relatório CSV (o Parquet tem todas); a ordem é a do relatório
+LIMITES_RELATORIO = {
+    "valor_invalido": 20,
+    "reg_ans_sem_cadop": 50,
+    "reg_ans_cadop_cancelada": 50,
+    "valor_zero_ou_negativo": 50,
+    "cnpj_com_razoes_diferentes": 200,
+}
+RAZOES_NO_RELATORIO = 6
+
+# Muda quando a leitura dos intermediários (ler_intermediario/analisar_valores) muda: força regravar as partições
+VERSAO_BASE = 1
+
+SCHEMA_INCONSISTENCIAS = pa.schema([
+    ("tipo", pa.dictionary(pa.int8(), pa.string())),
+    ("reg_ans", pa.string()),
+    ("cnpj", pa.string()),
+    ("trimestre", pa.string()),
+    ("ano", pa.string()),
+    ("fonte", pa.dictionary(pa.int32(), pa.string())),
+    ("valor", pa.string()),              # texto como veio do CSV intermediário
+    ("razoes", pa.list_(pa.string())),   # razões sociais distintas do CNPJ, em ordem
+    ("data_cancelamento", pa.date32()),  # operadora resolvida pelo cadastro de canceladas
+])
 
 
 # =========================
@@ -43,6 +83,10 @@ def pasta_saida() -> Path:
     return pasta_dados() / "Saída"
 
 
+def pasta_consolidado() -> Path:
+    return pasta_dados() / "Consolidado"
+
+
 # =========================
 # Logging
 # =========================
@@ -53,10 +97,6 @@ def configurar_logging() -> None:
 # =========================
 # Helpers
 # =========================
-def apenas_digitos(s: str) -> str:
-    return re.sub(r"\D+", "", s or "")
-
-
 def normalizar_texto(s: str) -> str:
     return (s or "").strip().upper()
 
@@ -90,69 +130,46 @@ def formato_dinheiro(v: Decimal) -> str:
 
 
 def baixar_arquivo(url: str, destino: Path, timeout_s: int = 60) -> None:
-    destino.parent.mkdir(parents=True, exist_ok=True)
-    tmp = destino.with_suffix(destino.suffix + ".part")
-    if destino.exists():
-        return
-
-    with requests.get(url, stream=True, timeout=timeout_s) as resp:
-        resp.raise_for_status()
-        with open(tmp, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
-    tmp.replace(destino)
+    cache_padrao().baixar(url, destino, timeout_s=timeout_s)
 
 
 # =========================
 # CADOP (REG_ANS -> CNPJ/Razao)
 # =========================
-def carregar_cadop() -> pd.DataFrame:
-    """Baixa e carrega o cadastro de operadoras da ANS."""
+def baixar_cadastro(url: str, destino: Path) -> bool:
+    """Revalida um CSV do cadastro (304 quando não mudou). Sem rede, fica a cópia local; retorna se há arquivo para ler."""
+    try:
+        baixar_arquivo(url, destino)
+    except Exception as e:
+        if not destino.exists():
+            LOGGER.warning("Não consegui baixar %s (%s).", destino.name, e)
+            return False
+        LOGGER.warning("Não consegui revalidar %s (%s). Usando cópia local.", destino.name, e)
+    return True
+
+
+def carregar_cadop() -> HistoricoCadop:
+    """ Baixa os cadastros de operadoras ativas e canceladas da ANS e devolve o histórico de REG_ANS (Compartilhado/Cadop.py). Sem o de canceladas, só as ativas entram."""
     pasta_documentos().mkdir(parents=True, exist_ok=True)
     cadop_path = pasta_documentos() / "Relatorio_cadop.csv"
-    
-    if not cadop_path.exists():
-        LOGGER.info("Baixando CADOP...")
-        baixar_arquivo(CADOP_URL, cadop_path)
+    canceladas_path = pasta_documentos() / "Relatorio_cadop_canceladas.csv"
 
-    try:
-        df = pd.read_csv(cadop_path, sep=";", dtype=str, encoding="utf-8")
-    except UnicodeDecodeError:
-        df = pd.read_csv(cadop_path, sep=";", dtype=str, encoding="latin1")
+    if not baixar_cadastro(CADOP_URL, cadop_path):
+        raise RuntimeError(f"Sem o cadastro de operadoras ativas ({cadop_path.name}).")
 
-    # Detecta colunas (aceita variações)
-    cols = {c.strip().upper().replace("_", ""): c for c in df.columns}
-    
-    # REG_ANS pode ser: REGISTRO_ANS, REG_ANS, REGANS, REGISTRO_OPERADORA
-    reg_col = (
-        cols.get("REGISTROANS") or 
-        cols.get("REGANS") or 
-        cols.get("REGISTROOPERADORA")
-    )
-    
-    # CNPJ
-    cnpj_col = cols.get("CNPJ")
-    
-    # Razão Social pode ter variações
-    razao_col = (
-        cols.get("RAZAOSOCIAL") or 
-        cols.get("NOMEEMPRESARIAL") or 
-        cols.get("RAZAO") or
-        cols.get("NOME")
-    )
+    # Lido uma vez por conteúdo: as próximas execuções (e a 2.2) só mapeiam o snapshot
+    ativas = snapshot_cadop(cadop_path)
+    if not all(ativas.origem[c] for c in ("reg_ans", "cnpj", "razao_social")):
+        raise RuntimeError(f"CADOP sem colunas esperadas. Encontradas: {ativas.colunas_csv[:30]}")
 
-    if not reg_col or not cnpj_col or not razao_col:
-        raise RuntimeError(f"CADOP sem colunas esperadas. Encontradas: {list(df.columns)[:30]}")
+    canceladas: Optional[SnapshotCadop] = None
+    if baixar_cadastro(CADOP_CANCELADAS_URL, canceladas_path):
+        canceladas = snapshot_cadop(canceladas_path)
+        if not all(canceladas.origem[c] for c in ("reg_ans", "cnpj", "razao_social")):
+            LOGGER.warning("Cadastro de canceladas sem colunas esperadas. Usando só as ativas.")
+            canceladas = None
 
-    out = df[[reg_col, cnpj_col, razao_col]].copy()
-    out.columns = ["REG_ANS", "CNPJ", "RazaoSocial"]
-    out["REG_ANS"] = out["REG_ANS"].fillna("").astype(str).str.strip()
-    out["CNPJ"] = out["CNPJ"].fillna("").astype(str).map(apenas_digitos)
-    out["RazaoSocial"] = out["RazaoSocial"].fillna("").astype(str).str.strip()
-    out = out[out["REG_ANS"] != ""].drop_duplicates(subset=["REG_ANS"], keep="first")
-    
-    return out
+    return HistoricoCadop.de_snapshots(ativas, canceladas)
 
 
 # =========================
@@ -188,93 +205,206 @@ def ler_intermediario(p: Path) -> pd.DataFrame:
     if "ValorDespesas" not in df.columns:
         raise RuntimeError(f"{p.name} não tem coluna ValorDespesas.")
 
-    df["ValorDec"] = df["ValorDespesas"].map(extrair_decimal)
     return df
 
 
-def consolidar() -> Tuple[pd.DataFrame, List[Dict[str, str]]]:
-    """Consolida CSVs intermediários e faz JOIN com CADOP."""
-    rel_incons: List[Dict[str, str]] = []
-
-    arquivos = listar_intermediarios()
-    if not arquivos:
-        raise RuntimeError("Nenhum CSV intermediário encontrado em Dados/Normal.")
-
-    LOGGER.info("Lendo %d arquivos intermediários...", len(arquivos))
-    frames = []
-    for p in arquivos:
-        df = ler_intermediario(p)
-        df["Fonte"] = p.name
-        frames.append(df)
-
-    base = pd.concat(frames, ignore_index=True)
-
-    # Valores inválidos
-    invalid = base["ValorDec"].isna()
-    if bool(invalid.any()):
-        for x in base.loc[invalid].head(20).itertuples(index=False):
-            rel_incons.append({
-                "tipo": "valor_invalido",
-                "chave": f"REG_ANS={getattr(x,'REG_ANS','')}",
-                "detalhe": f"fonte={getattr(x,'Fonte','')} raw={getattr(x,'ValorDespesas','')}",
-            })
-        base = base.loc[~invalid].copy()
-
-    # JOIN com CADOP
-    cadop = carregar_cadop()
-    merged = base.merge(cadop, on="REG_ANS", how="left")
-
-    # REG_ANS sem cadastro
-    missing = merged["CNPJ"].isna() | (merged["CNPJ"].fillna("").astype(str).str.strip() == "")
-    if bool(missing.any()):
-        for x in merged.loc[missing].head(50).itertuples(index=False):
-            rel_incons.append({
-                "tipo": "reg_ans_sem_cadop",
-                "chave": f"REG_ANS={getattr(x,'REG_ANS','')}",
-                "detalhe": f"fonte={getattr(x,'Fonte','')}",
-            })
-
-    # Valores zero/negativos
-    zero_or_neg = merged["ValorDec"] <= Decimal("0")
-    if bool(zero_or_neg.any()):
-        for x in merged.loc[zero_or_neg].head(50).itertuples(index=False):
-            rel_incons.append({
-                "tipo": "valor_zero_ou_negativo",
-                "chave": f"CNPJ={getattr(x,'CNPJ','')} REG_ANS={getattr(x,'REG_ANS','')}",
-                "detalhe": f"tri={getattr(x,'Trimestre','')} ano={getattr(x,'Ano','')} valor={getattr(x,'ValorDec','')}",
-            })
-
-    # CNPJ com múltiplas razões sociais
-    tmp = merged.dropna(subset=["CNPJ", "RazaoSocial"]).copy()
-    if not tmp.empty:
-        nun = tmp.groupby("CNPJ")["RazaoSocial"].nunique()
-        amb = nun[nun > 1].index.tolist()
-        for cnpj in amb[:200]:
-            razoes = sorted(tmp.loc[tmp["CNPJ"] == cnpj, "RazaoSocial"].unique().tolist())
-            rel_incons.append({
-                "tipo": "cnpj_com_razoes_diferentes",
-                "chave": f"CNPJ={cnpj}",
-                "detalhe": " | ".join(razoes[:6]) + (" ..." if len(razoes) > 6 else ""),
-            })
+def particao_do_arquivo(p: Path) -> Particao:
+    """(ano, trimestre) pelo nome do intermediário da 1.2 (despesas_eventos_sinistros_3T2025.csv)."""
+    m = re.search(r"_(\d)T(\d{4})\.csv$", p.name)
+    if not m:
+        raise RuntimeError(f"Não consegui inferir trimestre/ano do nome: {p.name}")
+    return int(m.group(2)), int(m.group(1))
+
+
+def ler_trimestres(texto: str) -> List[Particao]:
+    """ "1T2025,4T2024" -> [(2025, 1), (2024, 4)]."""
+    out = []
+    for rotulo in (t.strip() for t in texto.split(",") if t.strip()):
+        m = re.fullmatch(r"([1-4])T(\d{4})", rotulo.upper())
+        if not m:
+            raise ValueError(f"Trimestre inválido: {rotulo} (use 1T2025)")
+        out.append((int(m.group(2)), int(m.group(1))))
+    return out
+
+
+def analisar_valores(brutos: pd.Series) -> pd.DataFrame:
+    """ Vetorizado: se cada valor é válido, se é <= 0 e o texto arredondado para centavos (ROUND_HALF_UP). Só o que foge do formato simples passa por extrair_decimal."""
+    pf = para_ponto_fixo(brutos, formato="auto")
+    out = pd.DataFrame({
+        "valido": pf.ok,
+        "nao_positivo": pf.ok & (pf.mantissa <= 0),
+        "texto": texto_centavos(centavos_half_up(pf), pf.negativo).where(pf.ok, ""),
+    })
+
+    for idx, bruto in brutos[~pf.ok].items():
+        d = extrair_decimal(bruto)
+        if d is None or d.is_nan():
+            continue
+        out.at[idx, "valido"] = True
+        out.at[idx, "nao_positivo"] = d <= Decimal("0")
+        out.at[idx, "texto"] = str(d.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+    return out
+
+
+def linhas_base(p: Path) -> pd.DataFrame:
+    """Um intermediário já analisado, nas colunas da base consolidada: valor validado, arredondado e marcado se <= 0."""
+    df = ler_intermediario(p)
+    df["Fonte"] = p.name
+    valores = analisar_valores(df["ValorDespesas"])
+    df["ValorCentavos"] = valores["texto"]
+    df["NaoPositivo"] = valores["nao_positivo"]
+    df["Valido"] = valores["valido"]
+    return df
+
+
+def atualizar_base(base: BaseConsolidada) -> List[Particao]:
+    """ Grava na base consolidada só os trimestres de Dados/Normal que são novos ou mudaram (sha256 do CSV). Os outros, e o histórico que já não está em Dados/Normal, ficam como estão. Retorna os trimestres de Dados/Normal."""
+    atuais = []
+    for p in listar_intermediarios():
+        particao = particao_do_arquivo(p)
+        atuais.append(particao)
+        sha = sha256_arquivo(p)
+        if base.atualizada(particao, sha, VERSAO_BASE):
+            continue
+        LOGGER.info("Base consolidada: gravando %dT%d (%s)", particao[1], particao[0], p.name)
+        base.gravar(particao, linhas_base(p), p.name, sha, VERSAO_BASE)
+    base.limpar()
+    return atuais
+
+
+def fim_do_trimestre(trimestre: pd.Series, ano: pd.Series) -> pd.Series:
+    """Último dia de cada trimestre ("1T", "2025" -> 2025-03-31); NaT quando não dá para ler."""
+    t = pd.to_numeric(trimestre.fillna("").astype(str).str.extract(r"^(\d)", expand=False), errors="coerce")
+    a = pd.to_numeric(ano, errors="coerce")
+    ok = t.between(1, 4) & a.between(1900, 2999)
+    inicio = pd.to_datetime(pd.DataFrame({
+        "year": a.where(ok, 1970).astype(int), "month": t.where(ok, 1).astype(int) * 3 - 2, "day": 1,
+    }))
+    return (inicio + pd.offsets.QuarterEnd(0)).where(ok)
+
+
+def colunas_inconsistencia(df: pd.DataFrame, tipo: str) -> pd.DataFrame:
+    """Linhas de df no formato do relatório completo (colunas de SCHEMA_INCONSISTENCIAS que df tiver; o resto fica nulo)."""
+    origem = {"reg_ans": "REG_ANS", "cnpj": "CNPJ", "trimestre": "Trimestre", "ano": "Ano",
+              "fonte": "Fonte", "valor": "ValorDespesas", "razoes": "razoes",
+              "data_cancelamento": "DataCancelamento"}
+    out = pd.DataFrame({"tipo": tipo}, index=df.index)
+    for nome, col in origem.items():
+        out[nome] = df[col] if col in df.columns else None
+    return out.reset_index(drop=True)
+
+
+def cnpjs_com_razoes_diferentes(merged: pd.DataFrame) -> pd.DataFrame:
+    """ CNPJ -> razões sociais distintas (ordenadas), só para os CNPJs com mais de uma. Uma ordenação e um groupby: linear no número de linhas, sem refiltrar a base por CNPJ."""
+    pares = (
+        merged.loc[merged["CNPJ"].notna() & merged["RazaoSocial"].notna(), ["CNPJ", "RazaoSocial"]]
+        .drop_duplicates()
+        .sort_values(["CNPJ", "RazaoSocial"], ignore_index=True)
+    )
+    qtd = pares.groupby("CNPJ", sort=False)["RazaoSocial"].transform("size")
+    amb = pares[qtd > 1]
+    return amb.groupby("CNPJ", sort=False)["RazaoSocial"].agg(list).rename("razoes").reset_index()
+
+
+def detectar_inconsistencias(base: pd.DataFrame, invalido: pd.Series, merged: pd.DataFrame) -> pd.DataFrame:
+    """ Todas as inconsistências, completas, num DataFrame só (uma linha por ocorrência; CNPJ com razões diferentes é uma linha por CNPJ). Cada regra é uma máscara ou um groupby sobre a base inteira."""
+    sem_cadop = merged["CNPJ"].isna() | (merged["CNPJ"].fillna("").astype(str).str.strip() == "")
+    partes = [
+        colunas_inconsistencia(base.loc[invalido], "valor_invalido"),
+        colunas_inconsistencia(merged.loc[sem_cadop], "reg_ans_sem_cadop"),
+        colunas_inconsistencia(merged.loc[merged["Cancelada"]], "reg_ans_cadop_cancelada"),
+        colunas_inconsistencia(merged.loc[merged["NaoPositivo"]], "valor_zero_ou_negativo"),
+        colunas_inconsistencia(cnpjs_com_razoes_diferentes(merged), "cnpj_com_razoes_diferentes"),
+    ]
+    return pd.concat(partes, ignore_index=True)
+
+
+def resumo_inconsistencias(incons: pd.DataFrame) -> List[Dict[str, str]]:
+    """ Visão para leitura humana (relatorio_inconsistencias.csv): as primeiras LIMITES_RELATORIO linhas de cada tipo, no formato tipo/chave/detalhe."""
+    rel: List[Dict[str, str]] = []
+    for tipo, limite in LIMITES_RELATORIO.items():
+        sub = incons[incons["tipo"] == tipo].head(limite)
+        reg = sub["reg_ans"].astype(str)
+        if tipo == "valor_invalido":
+            chave = "REG_ANS=" + reg
+            detalhe = "fonte=" + sub["fonte"].astype(str) + " raw=" + sub["valor"].astype(str)
+        elif tipo == "reg_ans_sem_cadop":
+            chave = "REG_ANS=" + reg
+            detalhe = "fonte=" + sub["fonte"].astype(str)
+        elif tipo == "reg_ans_cadop_cancelada":
+            chave = "CNPJ=" + sub["cnpj"].astype(str) + " REG_ANS=" + reg
+            detalhe = ("tri=" + sub["trimestre"].astype(str) + " ano=" + sub["ano"].astype(str)
+                       + " cancelada_em=" + sub["data_cancelamento"].astype(str))
+        elif tipo == "valor_zero_ou_negativo":
+            chave = "CNPJ=" + sub["cnpj"].astype(str) + " REG_ANS=" + reg
+            detalhe = ("tri=" + sub["trimestre"].astype(str) + " ano=" + sub["ano"].astype(str)
+                       + " valor=" + sub["valor"].map(extrair_decimal).astype(str))
+        else:
+            chave = "CNPJ=" + sub["cnpj"].astype(str)
+            detalhe = sub["razoes"].map(
+                lambda r: " | ".join(r[:RAZOES_NO_RELATORIO]) + (" ..." if len(r) > RAZOES_NO_RELATORIO else "")
+            )
+        rel.extend({"tipo": tipo, "chave": c, "detalhe": d} for c, d in zip(chave, detalhe))
+    return rel
+
+
+def juntar_cadop(validos: pd.DataFrame, cadop: HistoricoCadop) -> pd.DataFrame:
+    """ validos com CNPJ, RazaoSocial, Ativa, DataCancelamento e Cancelada do CADOP: as-of por (REG_ANS, fim do trimestre) no histórico de ativas + canceladas, numa busca só para o frame inteiro. NaN quando o REG_ANS não está lá. Cancelada: o cancelamento veio até o fim do trimestre (cancelada depois dele não é inconsistência)."""
+    dados = cadop.na_data(
+        validos["REG_ANS"].tolist(),
+        fim_do_trimestre(validos["Trimestre"], validos["Ano"]).to_numpy(dtype="datetime64[D]"),
+        ["cnpj", "razao_social", "ativa", "data_cancelamento"],
+    )
+    return pd.concat([validos, dados.rename(columns={
+        "cnpj": "CNPJ", "razao_social": "RazaoSocial", "ativa": "Ativa", "data_cancelamento": "DataCancelamento",
+        "cancelada_na_data": "Cancelada",
+    })], axis=1)
+
+
+def consolidar(
+    trimestres: Optional[List[Particao]] = None, historico: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """ Atualiza a base consolidada com os intermediários novos, lê os trimestres pedidos (padrão: os de Dados/Normal; historico=True: todos) e faz JOIN com CADOP. Retorna o CSV final e todas as inconsistências (detectar_inconsistencias)."""
+    consolidada = BaseConsolidada(pasta_consolidado())
+    atuais = atualizar_base(consolidada)
+    if historico:
+        trimestres = consolidada.particoes()
+    elif trimestres is None:
+        if not atuais:
+            raise RuntimeError("Nenhum CSV intermediário encontrado em Dados/Normal.")
+        trimestres = atuais
+
+    faltando = sorted(set(trimestres) - set(consolidada.particoes()))
+    if faltando:
+        raise RuntimeError("Trimestres fora da base consolidada: " + ", ".join(f"{t}T{a}" for a, t in faltando))
+
+    LOGGER.info("Lendo %d trimestres da base consolidada...", len(set(trimestres)))
+    base = consolidada.ler(trimestres)
+    invalido = ~base["Valido"]
+
+    # JOIN com CADOP (valores inválidos ficam de fora)
+    merged = juntar_cadop(base.loc[~invalido].reset_index(drop=True), carregar_cadop())
+
+    incons = detectar_inconsistencias(base, invalido, merged)
 
     # Monta CSV final
     out = merged.copy()
     out["CNPJ"] = out["CNPJ"].fillna("").astype(str)
     out["RazaoSocial"] = out["RazaoSocial"].fillna("").astype(str)
-    out["ValorDespesas"] = out["ValorDec"].map(
-        lambda d: str(d.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
-    )
+    out["ValorDespesas"] = out["ValorCentavos"]
 
     final = out[["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"]].copy()
 
-    return final, rel_incons
+    return final, incons
 
 
-def salvar_csv_final(df: pd.DataFrame) -> Path:
-    pasta_saida().mkdir(parents=True, exist_ok=True)
-    out_path = pasta_saida() / "consolidado_despesas.csv"
-    df.to_csv(out_path, sep=";", index=False, encoding="utf-8", quoting=csv.QUOTE_MINIMAL)
-    return out_path
+def salvar_csv_final(df: pd.DataFrame, nivel: int = NIVEL_PADRAO, extras: Tuple[str, ...] = ()) -> Dict[str, Path]:
+    """CSV final, o ZIP e os irmãos comprimidos pedidos, numa passada só (sem reler o CSV para zipar)."""
+    return escrever_csv_compactado(
+        df, pasta_saida(), "consolidado_despesas.csv", "consolidado_despesas.zip",
+        extras=extras, nivel=nivel, sep=";", encoding="utf-8", quoting=csv.QUOTE_MINIMAL,
+    )
 
 
 def salvar_relatorio_inconsistencias(rel: List[Dict[str, str]]) -> Path:
@@ -289,31 +419,66 @@ def salvar_relatorio_inconsistencias(rel: List[Dict[str, str]]) -> Path:
     return out_path
 
 
-def zipar(csv_path: Path) -> Path:
-    out_zip = pasta_saida() / "consolidado_despesas.zip"
-    with zipfile.ZipFile(out_zip, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        zf.write(csv_path, arcname=csv_path.name)
-    return out_zip
+def salvar_inconsistencias_parquet(incons: pd.DataFrame) -> Path:
+    """Relatório completo, sem limite de linhas, em Parquet (tipo e fonte como dicionário)."""
+    pasta_documentos().mkdir(parents=True, exist_ok=True)
+    out_path = pasta_documentos() / "inconsistencias.parquet"
+    dados = incons.astype(object).where(incons.notna(), None)
+    tabela = pa.Table.from_pandas(dados, schema=SCHEMA_INCONSISTENCIAS, preserve_index=False)
+    pq.write_table(tabela, out_path, compression="zstd")
+    return out_path
+
+
+def ler_argumentos() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Consolida os trimestres da 1.2, cruza com o CADOP e gera o ZIP final.")
+    parser.add_argument("--trimestres", default="",
+                        help="trimestres da base consolidada no CSV final, ex.: 4T2024,1T2025 (padrão: os de Dados/Normal)")
+    parser.add_argument("--historico", action="store_true",
+                        help="CSV final com todos os trimestres da base consolidada")
+    parser.add_argument("--nivel", type=int, choices=range(0, 10), default=NIVEL_PADRAO, metavar="0-9",
+                        help=f"nível de compressão do ZIP (e dos extras); padrão {NIVEL_PADRAO}")
+    parser.add_argument("--extras", default="",
+                        help=f"cópias comprimidas do CSV além do ZIP, separadas por vírgula: {','.join(FORMATOS_EXTRAS)}")
+    args = parser.parse_args()
+    args.extras = tuple(e.strip() for e in args.extras.split(",") if e.strip())
+    desconhecidos = [e for e in args.extras if e not in FORMATOS_EXTRAS]
+    if desconhecidos:
+        parser.error(f"--extras: formato desconhecido {desconhecidos}")
+    if args.nivel == 0 and "zst" in args.extras:
+        parser.error("--nivel 0 (sem compressão) não existe no zstd: use 1-9 com --extras zst")
+    try:
+        args.trimestres = ler_trimestres(args.trimestres) or None
+    except ValueError as e:
+        parser.error(f"--trimestres: {e}")
+    if args.historico and args.trimestres:
+        parser.error("use --trimestres ou --historico, não os dois")
+    return args
 
 
 def main() -> None:
     configurar_logging()
+    args = ler_argumentos()
 
     LOGGER.info("Consolidando trimestres...\n")
-    final, rel = consolidar()
+    final, incons = consolidar(args.trimestres, historico=args.historico)
+    for tipo, qtd in incons["tipo"].value_counts(sort=False).items():
+        LOGGER.info("Inconsistências %s: %d", tipo, qtd)
 
     # Métricas
     total = sum((Decimal(v) for v in final["ValorDespesas"].tolist()), Decimal("0"))
     LOGGER.info("Linhas no consolidado: %d", len(final))
     LOGGER.info("Total consolidado: R$ %s\n", formato_dinheiro(total))
 
-    out_csv = salvar_csv_final(final)
-    out_rel = salvar_relatorio_inconsistencias(rel)
-    out_zip = zipar(out_csv)
+    saidas = salvar_csv_final(final, nivel=args.nivel, extras=args.extras)
+    out_rel = salvar_relatorio_inconsistencias(resumo_inconsistencias(incons))
+    out_incons = salvar_inconsistencias_parquet(incons)
 
-    LOGGER.info("CSV final: %s", out_csv.name)
-    LOGGER.info("Relatório de inconsistências: %s", out_rel.name)
-    LOGGER.info("ZIP final: %s", out_zip.name)
+    LOGGER.info("CSV final: %s", saidas["csv"].name)
+    LOGGER.info("Relatório de inconsistências: %s (completo: %s)", out_rel.name, out_incons.name)
+    LOGGER.info("ZIP final: %s", saidas["zip"].name)
+    for ext in args.extras:
+        LOGGER.info("Cópia .%s: %s", ext, saidas[ext].name)
+    LOGGER.info(cache_padrao().resumo())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import Processar_validacao as val
+from Conferir_validacao import CNPJS_BORDA, RAZOES_BORDA, VALORES_BORDA, com_texto, escalar, iguais
+
+
+def digitos_verificadores(base12: np.ndarray) -> np.ndarray:
+    r1 = (base12 @ val.PESOS_DV1) % 11
+    dv1 = np.where(r1 < 2, 0, 11 - r1)
+    r2 = (np.column_stack([base12, dv1]) @ val.PESOS_DV2) % 11
+    return np.column_stack([base12, dv1, np.where(r2 < 2, 0, 11 - r2)])
+
+
+def gerar(linhas: int, distintos: int, seed: int = 42) -> pd.DataFrame:
+    """Entrada sintética: CNPJs com e sem máscara (~10% com DV errado), razões e valores BR/US, mais os casos de borda."""
+    rng = np.random.default_rng(seed)
+    m = digitos_verificadores(rng.integers(0, 10, size=(distintos, 12)))
+    errado = rng.random(distintos) < 0.1
+    m[errado, 13] = (m[errado, 13] + 1) % 10
+    cnpjs = ["".join(map(str, d)) for d in m.tolist()]
+    cnpjs = [f"{c[:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:]}" if i % 3 == 0 else c for i, c in enumerate(cnpjs)]
+    centavos = rng.integers(-100_000, 10_000_000_000, size=distintos)
+    valores = [f"{c / 100:.2f}" if i % 2 else f"{c / 100:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+               for i, c in enumerate(centavos.tolist())]
+
+    def coluna(pool: list, borda: list) -> np.ndarray:
+        pool = np.array(pool + borda, dtype=object)
+        return pool[rng.integers(0, len(pool), size=linhas)]
+
+    return pd.DataFrame({
+        "CNPJ": coluna(cnpjs, CNPJS_BORDA),
+        "RazaoSocial": coluna([f"OPERADORA {i}" for i in range(distintos // 10 + 1)], RAZOES_BORDA),
+        "Trimestre": "1T",
+        "Ano": "2025",
+        "ValorDespesas": coluna(valores, VALORES_BORDA),
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Validação da 2.1: validar_linha por linha (antigo) x em lote (NumPy).")
+    parser.add_argument("--linhas", type=int, default=10_000_000)
+    parser.add_argument("--distintos", type=int, default=1_000_000, help="CNPJs/valores distintos na entrada")
+    parser.add_argument("--linhas-escalar", type=int, default=200_000,
+                        help="linhas validadas também pelo caminho antigo (ele leva minutos em 10 milhões)")
+    args = parser.parse_args()
+
+    df = gerar(args.linhas, args.distintos)
+    print(f"{args.linhas:_} linhas, {args.distintos:_} CNPJs/valores distintos\n".replace("_", "."))
+
+    estatistica = val.nova_estatistica()
+    t0 = time.perf_counter()
+    lote = val.validar_lote(df, estatistica)
+    t_lote = time.perf_counter() - t0
+
+    amostra = df.iloc[:args.linhas_escalar]
+    t0 = time.perf_counter()
+    ref = escalar(amostra)
+    t_escalar = time.perf_counter() - t0
+    estimado = t_escalar * len(df) / max(len(amostra), 1)
+
+    print(f"Por linha (apply), {len(amostra):_} linhas: {t_escalar:8.2f}s  (~{estimado:.0f}s para todas)".replace("_", "."))
+    print(f"Em lote, todas as linhas:        {t_lote:8.2f}s")
+    print(f"Ganho estimado: {estimado / t_lote:.0f}x | resultados iguais na amostra: {iguais(com_texto(lote.iloc[:len(amostra)]), ref)}")
+    print(f"Inválidas: {int((~lote['valido']).sum())} | motivos: {val.contar_motivos(lote['codigo_motivos'].to_numpy())}")
+    print(f"\nNormalização: {estatistica['tempo_preparacao_s']:.2f}s")
+    for motivo, e in estatistica["regras"].items():
+        print(f"Regra {motivo} (bit {e['bit']}): {e['linhas']} linhas em {e['tempo_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+import Processar_validacao as val
+
+# Casos que o lote precisa tratar exatamente como o validar_linha
+CNPJS_BORDA = [
+    "11.222.333/0001-81", "11222333000181", " 11222333000181 ", "11222333000182", "1222333000181",
+    "00000000000000", "11111111111111", "0", "", "   ", "abc", "123456789012345", "١١٢٢٢٣٣٣٠٠٠١٨١",
+    "11.222.333/0001-8١", "nan", "None", None, np.nan, "00.000.000/0001-91", "191",
+]
+RAZOES_BORDA = ["OPERADORA X", "  OPERADORA Y  ", "", "   ", "nan", "NaN", "NULL", "none", "None", None, np.nan, "0"]
+VALORES_BORDA = [
+    "1.234,56", "1,234.56", "1234,56", "1234.56", "R$ 1.234,56", "-10,00", "0", "0,00", "-0", "", "   ", "-", ".",
+    "-.", "abc", "1.2.3", "1,2,3", "1.234.567", "--5", "5-", "1e5", "R$", ",5", "5,", ".5", "-.5", "1 234,56",
+    "١٢٣", "+5", "1_000", "99999999999999999999999999.99", "nan", "inf", None, np.nan,
+]
+
+
+def casos_borda() -> pd.DataFrame:
+    """Todas as combinações dos casos de borda de CNPJ, razão social e valor."""
+    return pd.DataFrame(
+        [(c, r, "1T", "2025", v) for c in CNPJS_BORDA for r in RAZOES_BORDA for v in VALORES_BORDA],
+        columns=val.COLUNAS_ESPERADAS,
+    )
+
+
+def escalar(df: pd.DataFrame) -> pd.DataFrame:
+    """Caminho anterior: validar_linha por linha com df.apply(..., result_type="expand")."""
+    res = df.apply(
+        lambda linha: val.validar_linha(linha.get("CNPJ"), linha.get("RazaoSocial"), linha.get("ValorDespesas")),
+        axis=1, result_type="expand",
+    )
+    res.columns = ["valido", "motivos", "cnpj_norm", "razao_norm", "valor_float"]
+    res["motivo_rejeicao"] = res["motivos"].map(";".join)
+    res["valor_float"] = res["valor_float"].astype(np.float64)
+    return res[["valido", "motivo_rejeicao", "cnpj_norm", "razao_norm", "valor_float"]]
+
+
+def com_texto(lote: pd.DataFrame) -> pd.DataFrame:
+    """Resultado do lote com codigo_motivos traduzido para o motivo_rejeicao do escalar."""
+    return lote.assign(motivo_rejeicao=val.texto_motivos(lote["codigo_motivos"].to_numpy()))[
+        ["valido", "motivo_rejeicao", "cnpj_norm", "razao_norm", "valor_float"]]
+
+
+def iguais(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    for col in a.columns:
+        x, y = a[col].reset_index(drop=True), b[col].reset_index(drop=True)
+        if col == "valor_float":
+            ok = np.array_equal(x.to_numpy(), y.to_numpy(), equal_nan=True)
+        else:
+            ok = x.astype(object).where(x.notna(), None).tolist() == y.astype(object).where(y.notna(), None).tolist()
+        if not ok:
+            print(f"   diferença em {col}")
+            return False
+    return True
+
+
+def main() -> int:
+    """Confere validar_lote contra validar_linha em todas as combinações dos casos de borda. Sai com código 1 se alguma coluna divergir."""
+    borda = casos_borda()
+    ok = iguais(com_texto(val.validar_lote(borda)), escalar(borda))
+    print(f"Casos de borda ({len(borda)} combinações) iguais ao escalar: {ok}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,50 @@
 from __future__ import annotations
 
+import argparse
 import json
 import re
+import sys
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import shutil
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
+# Módulos compartilhados entre os testes (pasta Compartilhado/ na raiz do repositório)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Deteccao_csv import FormatoCsv, formato_csv, ler_csv_detectado, salvar_sidecar  # noqa: E402
+from Memo_cnpj import MemoCnpj  # noqa: E402
 
 COLUNAS_ESPERADAS = ["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"]
 
+# Entradas maiores que isso são validadas em blocos (memória constante) em vez de carregadas inteiras
+LIMITE_LOTE_BYTES = 256 * 1024 * 1024
+LINHAS_POR_BLOCO = 500_000
+
+# Versão das regras do veredito de CNPJ guardado no memo (Compartilhado/Memo_cnpj.py). Mudou normalizar_cnpj,
+# validar_cnpj, as versões em lote, CNPJ_SIMPLES ou os pesos? Incrementa para descartar o memo gravado.
+VERSAO_REGRAS = 1
+
+# Pesos dos dígitos verificadores do CNPJ (os mesmos do validar_cnpj)
+PESOS_DV1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int64)
+PESOS_DV2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int64)
+
+# codigo_motivos é um uint32: o bit i liga o motivo de REGRAS[i]
+MAX_REGRAS = 32
+
+# Formatos simples (só ASCII, sem espaço), resolvidos pelo pyarrow. O resto passa pelas operações de texto do pandas,
+# que repetem o regex do escalar (\d e \s do Python aceitam dígitos e espaços de outros alfabetos)
+CNPJ_SIMPLES = r"^(?:[0-9]{14}|[0-9]{2}\.[0-9]{3}\.[0-9]{3}/[0-9]{4}-[0-9]{2})$"
+VALOR_PONTO = r"^-?[0-9]+(?:\.[0-9]+)?$"                               # 1234.56
+VALOR_BR = r"^-?(?:[0-9]{1,3}(?:\.[0-9]{3})+|[0-9]+),[0-9]+$"          # 1.234,56 / 1234,56
+VALOR_US = r"^-?[0-9]{1,3}(?:,[0-9]{3})+\.[0-9]+$"                     # 1,234.56
+
 def arquivo_tem_dados_csv(caminho: Path) -> bool:
     """
     True se o arquivo tem pelo menos 1 linha de dados além do cabeçalho.
@@ -123,7 +157,11 @@ def converter_numero(valor: Any) -> Optional[float]:
 
 
 def ler_csv(caminho: Path) -> pd.DataFrame:
-    """Lê CSV tentando separadores e encodings comuns, com fallback resiliente."""
+    """Lê CSV no formato detectado pela amostra (Deteccao_csv, engine C, uma leitura). Se não der, tenta separadores e encodings comuns, com fallback resiliente."""
+    df = ler_csv_detectado(caminho)
+    if df is not None:
+        return df
+
     encodings = ["utf-8-sig", "utf-8", "latin1", "iso-8859-1"]
     seps = [",", ";", "\t", "|"]
 
@@ -203,6 +241,346 @@ def validar_linha(
     return (valido, motivos, cnpj_norm, razao_norm, valor_float)
 
 
+def _texto_arrow(valores: pd.Series) -> pa.Array:
+    return pa.array(valores.to_numpy(dtype=object), type=pa.string())
+
+
+def _casa(arr: pa.Array, padrao: str) -> np.ndarray:
+    return pc.match_substring_regex(arr, padrao).to_numpy(zero_copy_only=False)
+
+
+def normalizar_cnpjs(valores: pd.Series) -> pd.Series:
+    """normalizar_cnpj para uma coluna de textos sem nulos: o mesmo regex, aplicado de uma vez (pyarrow nos formatos simples, pandas no resto)."""
+    valores = valores.astype(str)
+    out = pd.Series(None, index=valores.index, dtype=object)
+    arr = _texto_arrow(valores)
+    simples = _casa(arr, CNPJ_SIMPLES)
+    out[simples] = pc.replace_substring_regex(arr.filter(simples), r"[^0-9]", "").to_numpy(zero_copy_only=False)
+
+    resto = valores[~simples]
+    digitos = resto.str.strip().str.replace(r"\D", "", regex=True)
+    ok = digitos.str.len().between(1, 14)
+    out[~simples] = digitos.str.zfill(14).where(ok, None)
+    return out
+
+
+def validar_cnpjs(cnpjs: pd.Series) -> np.ndarray:
+    """ validar_cnpj em lote. Os CNPJs de 14 dígitos ASCII viram uma matriz (n, 14) de uint8 e os dois dígitos verificadores saem de um produto pela matriz de pesos. Dígitos de outros alfabetos (que o \\d do regex aceita) vão para o validar_cnpj de uma linha."""
+    out = np.zeros(len(cnpjs), dtype=bool)
+    arr = pa.array(cnpjs.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+    ascii14 = pc.fill_null(pc.match_substring_regex(arr, r"^[0-9]{14}$"), False).to_numpy(zero_copy_only=False)
+    idx = np.flatnonzero(ascii14)
+    if len(idx):
+        m = np.frombuffer("".join(cnpjs.iloc[idx]).encode("ascii"), dtype=np.uint8).reshape(-1, 14) - ord("0")
+        repetido = (m == m[:, :1]).all(axis=1)
+        r1 = (m[:, :12] @ PESOS_DV1) % 11
+        r2 = (m[:, :13] @ PESOS_DV2) % 11
+        dv1 = np.where(r1 < 2, 0, 11 - r1)
+        dv2 = np.where(r2 < 2, 0, 11 - r2)
+        out[idx] = ~repetido & (m[:, 12] == dv1) & (m[:, 13] == dv2)
+
+    resto = np.flatnonzero(cnpjs.notna().to_numpy() & ~ascii14)
+    out[resto] = [validar_cnpj(c) for c in cnpjs.iloc[resto]]
+    return out
+
+
+def converter_numeros(valores: pd.Series) -> pd.Series:
+    """ converter_numero para uma coluna de textos sem nulos (float64, NaN onde o escalar devolve None). Os formatos simples (1234.56, 1.234,56, 1,234.56) são convertidos pelo pyarrow; o resto segue os mesmos passos do escalar, com as operações de texto do pandas."""
+    valores = valores.astype(str)
+    out = pd.Series(np.nan, index=valores.index, dtype=np.float64)
+    arr = _texto_arrow(valores)
+    ponto = _casa(arr, VALOR_PONTO)
+    br = _casa(arr, VALOR_BR)
+    us = _casa(arr, VALOR_US)
+    if ponto.any():
+        out[ponto] = pc.cast(arr.filter(ponto), pa.float64()).to_numpy()
+    if br.any():
+        sem_milhar = pc.replace_substring(arr.filter(br), ".", "")
+        out[br] = pc.cast(pc.replace_substring(sem_milhar, ",", "."), pa.float64()).to_numpy()
+    if us.any():
+        out[us] = pc.cast(pc.replace_substring(arr.filter(us), ",", ""), pa.float64()).to_numpy()
+
+    resto = ~(ponto | br | us)
+    if resto.any():
+        out[resto] = _converter_numeros_texto(valores[resto])
+    return out
+
+
+def _converter_numeros_texto(valores: pd.Series) -> pd.Series:
+    texto = valores.str.strip().str.replace(r"[R$\s]", "", regex=True)
+    virgula = texto.str.rfind(",")
+    ponto = texto.str.rfind(".")
+    br = (virgula >= 0) & (ponto >= 0) & (virgula > ponto)
+    us = (virgula >= 0) & (ponto >= 0) & (virgula < ponto)
+    so_virgula = (virgula >= 0) & (ponto < 0)
+    texto = texto.copy()
+    texto[br] = texto[br].str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    texto[us] = texto[us].str.replace(",", "", regex=False)
+    texto[so_virgula] = texto[so_virgula].str.replace(",", ".", regex=False)
+    texto = texto.str.replace(r"[^0-9\.\-]", "", regex=True)
+
+    # Só dígitos, ponto e sinal sobram: o que float() aceita é exatamente isto ("", "-", "." e "-." não)
+    numerico = texto.str.fullmatch(r"-?(?:[0-9]+\.?[0-9]*|\.[0-9]+)")
+    out = pd.Series(np.nan, index=valores.index, dtype=np.float64)
+    out[numerico] = texto[numerico].astype(np.float64)
+    return out
+
+
+def normalizar_razoes(valores: pd.Series) -> pd.Series:
+    """Razão social sem espaços nas pontas; None quando vazia ou "nan"/"none"/"null" (como validar_linha)."""
+    razao = valores.astype(str).str.strip()
+    vazia = (razao == "") | razao.str.lower().isin(["nan", "none", "null"])
+    return razao.where(~vazia, None)
+
+
+def por_distintos(valores: pd.Series, funcao, faltante: Any) -> np.ndarray:
+    """ Aplica uma função de coluna só aos valores distintos e devolve o resultado linha a linha pelos códigos do factorize. Nulo (código -1) recebe faltante, que fica na última posição."""
+    codigos, distintos = pd.factorize(valores)
+    resultado = np.asarray(funcao(pd.Series(distintos, dtype=object)), dtype=object)
+    return np.append(resultado, np.array([faltante], dtype=object))[codigos]
+
+
+@dataclass
+class Lote:
+    """Colunas de um lote já normalizadas, que as regras leem. O veredito do CNPJ fica por valor distinto (códigos do factorize): o DV é calculado uma vez por CNPJ, ou vem do memo."""
+    cnpj_codigos: np.ndarray
+    cnpj_valido: np.ndarray         # por CNPJ distinto
+    cnpj_norm: np.ndarray
+    razao_norm: np.ndarray
+    valor_float: np.ndarray
+
+
+@dataclass(frozen=True)
+class Regra:
+    motivo: str
+    avaliar: Callable[[Lote], np.ndarray]     # máscara booleana: True nas linhas rejeitadas
+
+
+REGRAS: List[Regra] = []
+
+
+def regra(motivo: str) -> Callable[[Callable[[Lote], np.ndarray]], Callable[[Lote], np.ndarray]]:
+    """ Registra uma regra de rejeição: uma função vetorizada Lote -> máscara. O bit do motivo em codigo_motivos é a posição no registro; a ordem de registro é também a ordem dos motivos no texto de motivo_rejeicao."""
+    def registrar(avaliar: Callable[[Lote], np.ndarray]) -> Callable[[Lote], np.ndarray]:
+        if any(r.motivo == motivo for r in REGRAS):
+            raise ValueError(f"Regra já registrada: {motivo}")
+        if len(REGRAS) >= MAX_REGRAS:
+            raise ValueError(f"Mais de {MAX_REGRAS} regras não cabem em codigo_motivos")
+        REGRAS.append(Regra(motivo, avaliar))
+        return avaliar
+    return registrar
+
+
+# Mesmas regras e mesma ordem de validar_linha
+@regra("cnpj_invalido")
+def _cnpj_invalido(lote: Lote) -> np.ndarray:
+    return ~np.append(lote.cnpj_valido, False)[lote.cnpj_codigos]
+
+
+@regra("razao_social_vazia")
+def _razao_social_vazia(lote: Lote) -> np.ndarray:
+    return pd.isna(lote.razao_norm)
+
+
+@regra("valor_invalido_ou_nao_positivo")
+def _valor_invalido(lote: Lote) -> np.ndarray:
+    return np.isnan(lote.valor_float) | (lote.valor_float <= 0)
+
+
+def veredito_cnpjs(brutos: pd.Series) -> Tuple[pd.Series, np.ndarray]:
+    """normalizar_cnpj + validar_cnpj para CNPJs brutos distintos e sem nulos: (normalizados, válidos)."""
+    norm = normalizar_cnpjs(brutos)
+    return norm, validar_cnpjs(norm)
+
+
+def preparar_lote(df: pd.DataFrame, memo: Optional[MemoCnpj] = None) -> Lote:
+    """Normaliza CNPJ, razão social e valor, cada coluna só nos seus valores distintos. Com memo, os CNPJs que ele já conhece não são recalculados."""
+    codigos, distintos = pd.factorize(df["CNPJ"])
+    distintos = pd.Series(distintos, dtype=object)
+    if memo is None:
+        norm, valido = veredito_cnpjs(distintos)
+        norm = norm.to_numpy(dtype=object)
+    else:
+        norm, valido = memo.resolver(distintos, veredito_cnpjs)
+    return Lote(
+        cnpj_codigos=codigos,
+        cnpj_valido=valido,
+        cnpj_norm=np.append(norm, None)[codigos],
+        razao_norm=por_distintos(df["RazaoSocial"], normalizar_razoes, None),
+        valor_float=por_distintos(df["ValorDespesas"], converter_numeros, np.nan).astype(np.float64),
+    )
+
+
+def nova_estatistica() -> Dict[str, Any]:
+    """Tempo da normalização e, por regra, bit, linhas rejeitadas e tempo. validar_lote soma nela; um dict serve para vários blocos."""
+    return {
+        "tempo_preparacao_s": 0.0,
+        "regras": {r.motivo: {"bit": i, "linhas": 0, "tempo_s": 0.0} for i, r in enumerate(REGRAS)},
+    }
+
+
+def validar_lote(
+    df: pd.DataFrame,
+    estatistica: Optional[Dict[str, Any]] = None,
+    memo: Optional[MemoCnpj] = None,
+) -> pd.DataFrame:
+    """ validar_linha para o DataFrame inteiro, sem laço por linha: valido, codigo_motivos, cnpj_norm, razao_norm e valor_float, com os mesmos valores que o escalar daria. Cada regra de REGRAS vira uma máscara sobre o lote e liga o seu bit em codigo_motivos (texto_motivos traduz para o motivo_rejeicao do escalar)."""
+    t0 = time.perf_counter()
+    lote = preparar_lote(df, memo)
+    if estatistica is not None:
+        estatistica["tempo_preparacao_s"] += time.perf_counter() - t0
+
+    codigo = np.zeros(len(df), dtype=np.uint32)
+    for bit, r in enumerate(REGRAS):
+        t0 = time.perf_counter()
+        rejeitadas = np.asarray(r.avaliar(lote), dtype=bool)
+        codigo |= rejeitadas.astype(np.uint32) << np.uint32(bit)
+        if estatistica is not None:
+            e = estatistica["regras"][r.motivo]
+            e["linhas"] += int(np.count_nonzero(rejeitadas))
+            e["tempo_s"] += time.perf_counter() - t0
+
+    return pd.DataFrame({
+        "valido": codigo == 0,
+        "codigo_motivos": codigo,
+        "cnpj_norm": lote.cnpj_norm,
+        "razao_norm": lote.razao_norm,
+        "valor_float": lote.valor_float,
+    }, index=df.index)
+
+
+def texto_motivos(codigos: np.ndarray) -> np.ndarray:
+    """codigo_motivos -> "motivo;motivo", na ordem de REGRAS (a mesma em que validar_linha acrescenta os motivos). Só os códigos distintos são montados."""
+    distintos, inverso = np.unique(np.asarray(codigos, dtype=np.uint32), return_inverse=True)
+    textos = np.array(
+        [";".join(r.motivo for i, r in enumerate(REGRAS) if c >> i & 1) for c in distintos.tolist()] + [""],
+        dtype=object,
+    )
+    return textos[inverso.reshape(-1)]
+
+
+def contar_motivos(codigos: np.ndarray) -> Dict[str, int]:
+    """Quantas linhas têm cada motivo, na ordem em que cada um aparece pela primeira vez (a mesma do laço por linha; na mesma linha, a ordem de REGRAS)."""
+    codigos = np.asarray(codigos, dtype=np.uint32)
+    primeira: Dict[str, Tuple[int, int]] = {}
+    contagem: Dict[str, int] = {}
+    for bit, r in enumerate(REGRAS):
+        ligado = (codigos >> np.uint32(bit)) & 1 == 1
+        qtd = int(np.count_nonzero(ligado))
+        if qtd:
+            contagem[r.motivo] = qtd
+            primeira[r.motivo] = (int(np.argmax(ligado)), bit)
+    return {m: contagem[m] for m in sorted(contagem, key=primeira.__getitem__)}
+
+
+def separar_resultados(df: pd.DataFrame, resultados: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Linhas válidas e inválidas (com motivo_rejeicao em texto), com CNPJ, razão e valor normalizados, como vão para os CSVs."""
+    df_completo = pd.concat([df, resultados], axis=1)
+
+    df_validos = df_completo[df_completo["valido"]].copy()
+    df_invalidos = df_completo[~df_completo["valido"]].copy()
+
+    df_validos["CNPJ"] = df_validos["cnpj_norm"]
+    df_validos["RazaoSocial"] = df_validos["razao_norm"]
+    df_validos["ValorDespesas"] = df_validos["valor_float"]
+    df_validos = df_validos[COLUNAS_ESPERADAS]
+
+    df_invalidos["CNPJ"] = df_invalidos["cnpj_norm"]
+    df_invalidos["RazaoSocial"] = df_invalidos["razao_norm"]
+    df_invalidos["ValorDespesas"] = df_invalidos["valor_float"]
+    df_invalidos["motivo_rejeicao"] = texto_motivos(df_invalidos["codigo_motivos"].to_numpy())
+    df_invalidos = df_invalidos[COLUNAS_ESPERADAS + ["motivo_rejeicao"]]
+    return df_validos, df_invalidos
+
+
+def somar_motivos(contagem: Dict[str, int], bloco: Dict[str, int]) -> None:
+    """Acumula a contagem de um bloco. Motivo novo entra no fim, então a ordem continua a da primeira aparição no arquivo."""
+    for motivo, qtd in bloco.items():
+        contagem[motivo] = contagem.get(motivo, 0) + qtd
+
+
+def blocos_entrada(caminho: Path, formato: FormatoCsv, linhas_por_bloco: int, on_bad_lines: str) -> Iterator[pd.DataFrame]:
+    return pd.read_csv(
+        caminho,
+        dtype=str,
+        encoding=formato.encoding,
+        sep=formato.sep,
+        engine="c",
+        chunksize=linhas_por_bloco,
+        on_bad_lines=on_bad_lines,
+    )
+
+
+def validar_em_blocos(
+    arquivo_entrada: Path,
+    arquivo_validados: Path,
+    arquivo_invalidos: Path,
+    formato: FormatoCsv,
+    linhas_por_bloco: int,
+    on_bad_lines: str = "error",
+    memo: Optional[MemoCnpj] = None,
+) -> Tuple[int, int, int, Dict[str, int], Dict[str, Any]]:
+    """ Lê a entrada em blocos de linhas_por_bloco, valida cada um com validar_lote e acrescenta o resultado aos CSVs de saída, já abertos. Só um bloco fica em memória. Cada linha é validada sozinha, então os arquivos saem iguais aos do modo em lote. Retorna (total, válidas, inválidas, motivos, estatística das regras)."""
+    # Cabeçalho conferido antes de abrir as saídas: coluna faltando não apaga os CSVs da execução anterior
+    verificar_colunas(pd.read_csv(arquivo_entrada, dtype=str, encoding=formato.encoding, sep=formato.sep, nrows=0))
+
+    total = validos = invalidos = 0
+    contagem_motivos: Dict[str, int] = {}
+    estatistica = nova_estatistica()
+    if memo is not None:
+        memo.zerar_contadores()
+    with open(arquivo_validados, "w", encoding="utf-8-sig", newline="") as f_validos, \
+            open(arquivo_invalidos, "w", encoding="utf-8-sig", newline="") as f_invalidos:
+        for i, bloco in enumerate(blocos_entrada(arquivo_entrada, formato, linhas_por_bloco, on_bad_lines)):
+            resultados = validar_lote(bloco, estatistica, memo)
+            df_validos, df_invalidos = separar_resultados(bloco, resultados)
+            df_validos.to_csv(f_validos, index=False, header=i == 0)
+            df_invalidos.to_csv(f_invalidos, index=False, header=i == 0)
+
+            total += len(bloco)
+            validos += len(df_validos)
+            invalidos += len(df_invalidos)
+            somar_motivos(contagem_motivos, contar_motivos(resultados["codigo_motivos"].to_numpy()))
+            print(f"   Bloco {i + 1}: {total} linhas validadas")
+    return total, validos, invalidos, contagem_motivos, estatistica
+
+
+def validar_arquivo_em_blocos(
+    arquivo_entrada: Path,
+    arquivo_validados: Path,
+    arquivo_invalidos: Path,
+    linhas_por_bloco: int,
+    memo: Optional[MemoCnpj] = None,
+) -> Optional[Tuple[int, int, int, Dict[str, int], Dict[str, Any]]]:
+    """ validar_em_blocos no formato detectado (Deteccao_csv). Byte inválido em UTF-8 depois da amostra: recomeça em latin1 e corrige o sidecar. Linhas ruins: recomeça pulando-as, como o último recurso do ler_csv. None se o formato não foi detectado (o chamador lê em lote)."""
+    formato = formato_csv(arquivo_entrada)
+    if formato is None:
+        return None
+
+    formatos = [formato]
+    if formato.encoding == "utf-8-sig":
+        formatos.append(FormatoCsv(encoding="latin1", sep=formato.sep, bom=False))
+    ultimo_erro: Optional[Exception] = None
+    for n, f in enumerate(formatos):
+        for on_bad_lines in ("error", "skip"):
+            try:
+                resultado = validar_em_blocos(
+                    arquivo_entrada, arquivo_validados, arquivo_invalidos, f, linhas_por_bloco, on_bad_lines, memo)
+            except UnicodeDecodeError as e:
+                ultimo_erro = e
+                break
+            except pd.errors.ParserError as e:
+                ultimo_erro = e
+                continue
+            if on_bad_lines == "skip":
+                print("[WARN] Algumas linhas ruins foram ignoradas (on_bad_lines='skip').")
+            if n > 0:
+                salvar_sidecar(arquivo_entrada, f)
+            return resultado
+
+    raise RuntimeError(f"Não consegui ler o arquivo: {arquivo_entrada}. Último erro: {ultimo_erro}")
+
+
 def verificar_colunas(df: pd.DataFrame) -> None:
     """Verifica se o CSV tem todas as colunas necessárias."""
     faltando = [col for col in COLUNAS_ESPERADAS if col not in df.columns]
@@ -244,14 +622,88 @@ def salvar_saidas_vazias(
         "linhas_invalidas": 0,
         "taxa_rejeicao_pct": 0.0,
         "motivos_rejeicao": {},
+        **relatorio_regras(nova_estatistica()),
     }
     arquivo_relatorio.write_text(json.dumps(relatorio, ensure_ascii=False, indent=2), encoding="utf-8")
 
     print("\n[OK] CSV de entrada está vazio (apenas cabeçalho). Saídas vazias geradas.")
 
 
-def processar_validacao() -> None:
-    """Executa todo o processo da etapa 2.1."""
+def relatorio_regras(estatistica: Dict[str, Any]) -> Dict[str, Any]:
+    """Parte do resumo_validacao.json com o tempo da normalização e, por regra, bit, linhas rejeitadas e tempo (em segundos)."""
+    return {
+        "tempo_preparacao_s": round(estatistica["tempo_preparacao_s"], 4),
+        "regras": {
+            motivo: {"bit": e["bit"], "linhas": e["linhas"], "tempo_s": round(e["tempo_s"], 4)}
+            for motivo, e in estatistica["regras"].items()
+        },
+    }
+
+
+def salvar_relatorio(
+    arquivo_relatorio: Path,
+    total: int,
+    validos: int,
+    invalidos: int,
+    contagem_motivos: Dict[str, int],
+    estatistica: Dict[str, Any],
+    memo: Optional[MemoCnpj] = None,
+) -> None:
+    relatorio = {
+        "total_linhas": total,
+        "linhas_validas": validos,
+        "linhas_invalidas": invalidos,
+        "taxa_rejeicao_pct": round((invalidos / total * 100), 2) if total > 0 else 0.0,
+        "motivos_rejeicao": contagem_motivos,
+        **relatorio_regras(estatistica),
+    }
+    if memo is not None:
+        relatorio["memo_cnpj"] = memo.resumo()
+
+    arquivo_relatorio.write_text(
+        json.dumps(relatorio, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    print(f"   Relatório: {arquivo_relatorio.name}")
+
+    print(f"\nTotal de linhas: {total}")
+    print(f"Válidas: {validos} ({(validos / total * 100):.1f}%)")
+    print(f"Inválidas: {invalidos} ({(invalidos / total * 100):.1f}%)")
+
+    if contagem_motivos:
+        print("\nMotivos de rejeição:")
+        for motivo, qtd in sorted(contagem_motivos.items(), key=lambda x: -x[1]):
+            print(f"   • {motivo}: {qtd}")
+
+    print(f"\nTempo por regra (normalização: {estatistica['tempo_preparacao_s']:.2f}s):")
+    for motivo, e in estatistica["regras"].items():
+        print(f"   • {motivo}: {e['linhas']} linhas em {e['tempo_s']:.2f}s")
+
+    if memo is not None:
+        r = memo.resumo()
+        print(f"\nMemo de CNPJs: {r['acertos']}/{r['consultas']} já conhecidos ({r['taxa_acerto_pct']:.1f}%), "
+              f"{r['entradas']} guardados")
+
+
+def carregar_memo() -> MemoCnpj:
+    memo = MemoCnpj.carregar(VERSAO_REGRAS)
+    if memo.descartado:
+        print(f"[INFO] Memo de CNPJs descartado ({memo.descartado} diferente): os vereditos serão recalculados.")
+    return memo
+
+
+def salvar_memo(memo: MemoCnpj) -> None:
+    try:
+        descartadas = memo.salvar()
+    except OSError as e:
+        print(f"[WARN] Não consegui gravar o memo de CNPJs ({memo.caminho}): {e}")
+        return
+    if descartadas:
+        print(f"[INFO] Memo de CNPJs no limite ({memo.max_entradas}): {descartadas} entradas menos usadas saíram.")
+
+
+def processar_validacao(linhas_por_bloco: Optional[int] = None, usar_memo: bool = True) -> None:
+    """ Executa todo o processo da etapa 2.1. linhas_por_bloco: 0 lê a entrada inteira (lote), N > 0 valida em blocos de N linhas; None escolhe pelo tamanho do arquivo (blocos acima de LIMITE_LOTE_BYTES). usar_memo: consulta e atualiza o memo de CNPJs (Compartilhado/Memo_cnpj.py)."""
     pasta_script = Path(__file__).resolve().parent
 
     arquivo_entrada = pasta_script / "Dados" / "Entradas" / "consolidado_teste1.csv"
@@ -265,6 +717,28 @@ def processar_validacao() -> None:
     criar_arquivo_exemplo(arquivo_entrada)
     sincronizar_entrada_da_tarefa1(arquivo_entrada, pasta_script)
 
+    if linhas_por_bloco is None:
+        linhas_por_bloco = LINHAS_POR_BLOCO if arquivo_entrada.stat().st_size > LIMITE_LOTE_BYTES else 0
+
+    memo = carregar_memo() if usar_memo else None
+
+    if linhas_por_bloco > 0:
+        print(f"\nValidando em blocos de {linhas_por_bloco} linhas: {arquivo_entrada.name}")
+        resultado = validar_arquivo_em_blocos(
+            arquivo_entrada, arquivo_validados, arquivo_invalidos, linhas_por_bloco, memo)
+        if resultado is not None:
+            total, validos, invalidos, contagem_motivos, estatistica = resultado
+            if total == 0:
+                salvar_saidas_vazias(arquivo_validados, arquivo_invalidos, arquivo_relatorio)
+                return
+            print(f"   Validados: {arquivo_validados.name}")
+            print(f"   Inválidos: {arquivo_invalidos.name}")
+            salvar_relatorio(arquivo_relatorio, total, validos, invalidos, contagem_motivos, estatistica, memo)
+            if memo is not None:
+                salvar_memo(memo)
+            return
+        print("[WARN] Formato do CSV não detectado; validando em lote.")
+
     print(f"\nLendo: {arquivo_entrada.name}")
     df = ler_csv(arquivo_entrada)
     print(f"   Total de linhas: {len(df)}")
@@ -276,35 +750,9 @@ def processar_validacao() -> None:
         return
 
     print("\nValidando dados...")
-    resultados = df.apply(
-        lambda linha: validar_linha(
-            linha.get("CNPJ"),
-            linha.get("RazaoSocial"),
-            linha.get("ValorDespesas"),
-        ),
-        axis=1,
-        result_type="expand",
-    )
-    resultados.columns = ["valido", "motivos", "cnpj_norm", "razao_norm", "valor_float"]
-
-    df_completo = pd.concat([df, resultados], axis=1)
-
-    df_completo["motivo_rejeicao"] = df_completo["motivos"].apply(
-        lambda lista: ";".join(lista) if isinstance(lista, list) else ""
-    )
-
-    df_validos = df_completo[df_completo["valido"]].copy()
-    df_invalidos = df_completo[~df_completo["valido"]].copy()
-
-    df_validos["CNPJ"] = df_validos["cnpj_norm"]
-    df_validos["RazaoSocial"] = df_validos["razao_norm"]
-    df_validos["ValorDespesas"] = df_validos["valor_float"]
-    df_validos = df_validos[COLUNAS_ESPERADAS]
-
-    df_invalidos["CNPJ"] = df_invalidos["cnpj_norm"]
-    df_invalidos["RazaoSocial"] = df_invalidos["razao_norm"]
-    df_invalidos["ValorDespesas"] = df_invalidos["valor_float"]
-    df_invalidos = df_invalidos[COLUNAS_ESPERADAS + ["motivo_rejeicao"]]
+    estatistica = nova_estatistica()
+    resultados = validar_lote(df, estatistica, memo)
+    df_validos, df_invalidos = separar_resultados(df, resultados)
 
     print("\nSalvando resultados...")
     df_validos.to_csv(arquivo_validados, index=False, encoding="utf-8-sig")
@@ -313,40 +761,28 @@ def processar_validacao() -> None:
     df_invalidos.to_csv(arquivo_invalidos, index=False, encoding="utf-8-sig")
     print(f"   Inválidos: {arquivo_invalidos.name}")
 
-    total = len(df)
-    validos = len(df_validos)
-    invalidos = len(df_invalidos)
-
-    contagem_motivos: Dict[str, int] = {}
-    for motivo_str in df_invalidos["motivo_rejeicao"]:
-        for motivo in str(motivo_str).split(";"):
-            motivo = motivo.strip()
-            if motivo:
-                contagem_motivos[motivo] = contagem_motivos.get(motivo, 0) + 1
-
-    relatorio = {
-        "total_linhas": total,
-        "linhas_validas": validos,
-        "linhas_invalidas": invalidos,
-        "taxa_rejeicao_pct": round((invalidos / total * 100), 2) if total > 0 else 0.0,
-        "motivos_rejeicao": contagem_motivos,
-    }
-
-    arquivo_relatorio.write_text(
-        json.dumps(relatorio, ensure_ascii=False, indent=2),
-        encoding="utf-8",
+    salvar_relatorio(
+        arquivo_relatorio, len(df), len(df_validos), len(df_invalidos),
+        contar_motivos(resultados["codigo_motivos"].to_numpy()), estatistica, memo,
     )
-    print(f"   Relatório: {arquivo_relatorio.name}")
+    if memo is not None:
+        salvar_memo(memo)
 
-    print(f"\nTotal de linhas: {total}")
-    print(f"Válidas: {validos} ({(validos / total * 100):.1f}%)")
-    print(f"Inválidas: {invalidos} ({(invalidos / total * 100):.1f}%)")
 
-    if contagem_motivos:
-        print("\nMotivos de rejeição:")
-        for motivo, qtd in sorted(contagem_motivos.items(), key=lambda x: -x[1]):
-            print(f"   • {motivo}: {qtd}")
+def ler_argumentos() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Etapa 2.1: validação do consolidado do Teste 1.")
+    parser.add_argument(
+        "--linhas-por-bloco", type=int, default=None,
+        help=f"valida em blocos de N linhas, com memória constante (0 = tudo de uma vez; "
+             f"padrão: blocos de {LINHAS_POR_BLOCO} só se a entrada passar de {LIMITE_LOTE_BYTES // 2**20} MB)",
+    )
+    parser.add_argument("--sem-memo", action="store_true", help="não consulta nem grava o memo de CNPJs")
+    args = parser.parse_args()
+    if args.linhas_por_bloco is not None and args.linhas_por_bloco < 0:
+        parser.error("--linhas-por-bloco deve ser >= 0")
+    return args
 
 
 if __name__ == "__main__":
-    processar_validacao()
+    args = ler_argumentos()
+    processar_validacao(args.linhas_por_bloco, usar_memo=not args.sem_memo)
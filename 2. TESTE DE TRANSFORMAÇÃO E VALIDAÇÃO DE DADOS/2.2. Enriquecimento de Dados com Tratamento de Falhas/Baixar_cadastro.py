@@ -1,40 +1,32 @@
 from __future__ import annotations
 
 import re
+import sys
 import time
 import zipfile
 from pathlib import Path
 from typing import Optional, Tuple
 from urllib.parse import urljoin
 
-import requests
+# Módulos compartilhados entre os testes (pasta Compartilhado/ na raiz do repositório)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Cache_http import cache_padrao  # noqa: E402
 
 
 BASE_DIR_URL = "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/"
 
 
-def _http_get(url: str, timeout_s: int = 60) -> requests.Response:
-    r = requests.get(url, timeout=timeout_s)
-    r.raise_for_status()
-    return r
+def _http_get_texto(url: str, timeout_s: int = 60) -> str:
+    return cache_padrao().obter_texto(url, timeout_s=timeout_s)
 
 
 def _download_stream(url: str, destino: Path, timeout_s: int = 120) -> None:
-    destino.parent.mkdir(parents=True, exist_ok=True)
-    tmp = destino.with_suffix(destino.suffix + ".part")
-
-    with requests.get(url, stream=True, timeout=timeout_s) as r:
-        r.raise_for_status()
-        with tmp.open("wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 256):
-                if chunk:
-                    f.write(chunk)
-
-    tmp.replace(destino)
+    cache_padrao().baixar(url, destino, timeout_s=timeout_s)
 
 
 def _listar_links(base_dir_url: str) -> list[str]:
-    html = _http_get(base_dir_url, timeout_s=60).text
+    html = _http_get_texto(base_dir_url, timeout_s=60)
     links = re.findall(r'href="([^"]+)"', html, flags=re.IGNORECASE)
     # mantém apenas arquivos, remove navegação
     files = []
@@ -88,12 +80,9 @@ def _extrair_primeiro_csv(zip_path: Path, destino_csv: Path) -> None:
 
 
 def baixar_cadop(destino_csv: Path, forcar: bool = False, tentativas: int = 3) -> Path:
-    """Baixa o cadastro de operadoras ativas e salva como CSV no caminho destino_csv. Retorna o caminho final do CSV."""
+    """Baixa o cadastro de operadoras ativas e salva como CSV no caminho destino_csv. Retorna o caminho final do CSV. O download passa pelo cache HTTP, então um cadastro que não mudou custa só um 304. Se a ANS estiver fora do ar e já houver cópia local, ela é usada (a menos que forcar=True)."""
     destino_csv.parent.mkdir(parents=True, exist_ok=True)
 
-    if destino_csv.exists() and destino_csv.stat().st_size > 0 and not forcar:
-        return destino_csv
-
     ultimo_erro: Optional[Exception] = None
 
     for i in range(1, tentativas + 1):
@@ -118,6 +107,10 @@ def baixar_cadop(destino_csv: Path, forcar: bool = False, tentativas: int = 3) -
             ultimo_erro = e
             time.sleep(1.25 * i)
 
+    if destino_csv.exists() and destino_csv.stat().st_size > 0 and not forcar:
+        print(f"[WARN] Não consegui revalidar o cadastro ({ultimo_erro}). Usando cópia local.")
+        return destino_csv
+
     raise RuntimeError(f"Falha ao baixar CADOP. Último erro: {ultimo_erro}")
 
 
@@ -127,3 +120,4 @@ if __name__ == "__main__":
     print(f"Baixando cadastro para: {destino}")
     final = baixar_cadop(destino, forcar=False)
     print(f"Cadastro salvo em: {final}")
+    print(cache_padrao().resumo())
@@ -1,12 +1,19 @@
 import json
 import re
+import sys
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple
 import shutil
 
 import pandas as pd
 
-from Baixar_cadastro import baixar_cadop
+# Módulos compartilhados entre os testes (pasta Compartilhado/ na raiz do repositório)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Baixar_cadastro import baixar_cadop  # noqa: E402
+from Cache_http import cache_padrao  # noqa: E402
+from Cadop import SnapshotCadop, snapshot_cadop  # noqa: E402
+from Deteccao_csv import ler_csv_detectado  # noqa: E402
 
 
 COLUNAS_VALIDADOS = ["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"]
@@ -46,23 +53,11 @@ def normalizar_cnpj(valor: Any) -> Optional[str]:
     return digitos.zfill(14)
 
 
-def normalizar_nome_coluna(nome: str) -> str:
-    """Remove acentos e caracteres especiais de nomes de colunas."""
-    texto = str(nome).strip().lower()
-    
-    # Remove acentos
-    texto = (
-        texto.replace("á", "a").replace("à", "a").replace("ã", "a").replace("â", "a")
-        .replace("é", "e").replace("ê", "e")
-        .replace("í", "i")
-        .replace("ó", "o").replace("ô", "o").replace("õ", "o")
-        .replace("ú", "u")
-        .replace("ç", "c")
-    )
-    
-    # Remove tudo que não é letra ou número
-    texto = re.sub(r"[^a-z0-9]+", "", texto)
-    return texto
+def normalizar_cnpjs(valores: pd.Series) -> pd.Series:
+    """normalizar_cnpj uma vez por valor distinto: os mesmos CNPJs de operadoras se repetem em todo trimestre."""
+    codigos, distintos = pd.factorize(valores)
+    norm = pd.Series([normalizar_cnpj(v) for v in distintos] + [None], dtype=object).to_numpy()
+    return pd.Series(norm[codigos], index=valores.index, dtype=object)
 
 
 def limpar_texto(valor: Any) -> str:
@@ -78,7 +73,11 @@ def limpar_texto(valor: Any) -> str:
 
 
 def ler_csv(caminho: Path) -> pd.DataFrame:
-    """Lê CSV tentando múltiplos encodings e separadores."""
+    """Lê CSV no formato detectado pela amostra (Deteccao_csv, engine C, uma leitura); se não der, tenta múltiplos encodings e separadores."""
+    df = ler_csv_detectado(caminho, on_bad_lines="skip")
+    if df is not None:
+        return df
+
     encodings = ["utf-8-sig", "utf-8", "latin1", "iso-8859-1"]
     separadores = [None, ";", ",", "\t", "|"]
     ultimo_erro: Optional[Exception] = None
@@ -111,33 +110,12 @@ def verificar_colunas(df: pd.DataFrame, colunas_esperadas: list, nome_arquivo: s
         )
 
 
-def mapear_colunas_cadastro(df: pd.DataFrame) -> Tuple[str, str, str, str]:
-    """Identifica automaticamente as colunas do cadastro ANS. Retorna: (coluna_cnpj, coluna_registro, coluna_modalidade, coluna_uf)"""
-    # Cria mapa de colunas normalizadas
-    mapa = {normalizar_nome_coluna(col): col for col in df.columns}
-    
-    def buscar_coluna(*opcoes: str) -> Optional[str]:
-        """Busca a primeira coluna que bate com as opções."""
-        for opcao in opcoes:
-            if opcao in mapa:
-                return mapa[opcao]
-        return None
-    
-    def buscar_por_contencao(parte: str) -> Optional[str]:
-        parte = normalizar_nome_coluna(parte)
-        for norm, original in mapa.items():
-            if parte in norm:
-                return original
-        return None
-    
-    # Busca as colunas necessárias
-    col_cnpj = buscar_coluna("cnpj") or buscar_por_contencao("cnpj")
-    col_registro = (
-        buscar_coluna("registroans", "registrodaans", "registroansoperadora")
-        or buscar_por_contencao("registroans")
-    )
-    col_modalidade = buscar_coluna("modalidade") or buscar_por_contencao("modalidade")
-    col_uf = buscar_coluna("uf") or buscar_por_contencao("uf")
+def mapear_colunas_cadastro(cadastro: SnapshotCadop) -> Tuple[str, str, str, str]:
+    """Colunas do cadastro ANS, como o snapshot compartilhado (Compartilhado/Cadop.py) as identificou. Retorna: (coluna_cnpj, coluna_registro, coluna_modalidade, coluna_uf)"""
+    col_cnpj = cadastro.origem["cnpj"]
+    col_registro = cadastro.origem["reg_ans"]
+    col_modalidade = cadastro.origem["modalidade"]
+    col_uf = cadastro.origem["uf"]
 
     # Valida se encontrou todas
     if not col_cnpj or not col_registro or not col_modalidade or not col_uf:
@@ -145,7 +123,7 @@ def mapear_colunas_cadastro(df: pd.DataFrame) -> Tuple[str, str, str, str]:
             "Não consegui mapear colunas do cadastro ANS.\n"
             f"Encontrado: CNPJ={col_cnpj}, Registro={col_registro}, "
             f"Modalidade={col_modalidade}, UF={col_uf}\n"
-            f"Colunas disponíveis: {list(df.columns)}"
+            f"Colunas disponíveis: {cadastro.colunas_csv}"
         )
     
     return col_cnpj, col_registro, col_modalidade, col_uf
@@ -175,7 +153,7 @@ def deduplicar_cadastro(df_cadastro: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Dat
     df = df_cadastro.copy()
     
     # Normaliza dados
-    df["CNPJ"] = df["CNPJ"].apply(normalizar_cnpj)
+    df["CNPJ"] = normalizar_cnpjs(df["CNPJ"])
     df["RegistroANS"] = df["RegistroANS"].apply(limpar_texto)
     df["Modalidade"] = df["Modalidade"].apply(limpar_texto)
     df["UF"] = df["UF"].apply(limpar_texto)
@@ -285,22 +263,19 @@ def processar_enriquecimento() -> None:
         return
     
     # Normaliza CNPJ dos validados
-    df_validados["CNPJ"] = df_validados["CNPJ"].apply(normalizar_cnpj)
+    df_validados["CNPJ"] = normalizar_cnpjs(df_validados["CNPJ"])
     
-    # Baixa cadastro se necessário
-    if (not arquivo_cadastro.exists()) or arquivo_cadastro.stat().st_size == 0:
-        print("\nBaixando cadastro de operadoras da ANS...")
-        baixar_cadop(arquivo_cadastro, forcar=False)
+    # Baixa/revalida cadastro (304 quando não mudou)
+    print("\nVerificando cadastro de operadoras da ANS...")
+    baixar_cadop(arquivo_cadastro, forcar=False)
     
-    # Lê cadastro
+    # Lê cadastro: snapshot compartilhado com a 1.3, lido do CSV só quando o conteúdo muda
     print(f"\nLendo: {arquivo_cadastro.name}")
-    df_cadastro_completo = ler_csv(arquivo_cadastro)
-    
-    # Mapeia colunas do cadastro automaticamente
-    col_cnpj, col_registro, col_modalidade, col_uf = mapear_colunas_cadastro(df_cadastro_completo)
+    cadastro = snapshot_cadop(arquivo_cadastro)
+    mapear_colunas_cadastro(cadastro)
     
-    # Extrai apenas colunas relevantes
-    df_cadastro = df_cadastro_completo[[col_cnpj, col_registro, col_modalidade, col_uf]].copy()
+    # Só as colunas relevantes
+    df_cadastro = cadastro.df(["cnpj", "reg_ans", "modalidade", "uf"])
     df_cadastro.columns = ["CNPJ", "RegistroANS", "Modalidade", "UF"]
     
     # Remove duplicatas do cadastro
@@ -355,6 +330,7 @@ def processar_enriquecimento() -> None:
     print(f"  Enriquecidos: {len(df_com_match)} ({len(df_com_match)/len(df_resultado)*100:.1f}%)")
     print(f"  Sem match: {len(df_sem_match)} ({len(df_sem_match)/len(df_resultado)*100:.1f}%)")
     print(f"  CNPJs divergentes no cadastro: {total_divergentes}")
+    print(f"  {cache_padrao().resumo()}")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,16 @@
 import json
 import shutil
+import sys
 from pathlib import Path
 from typing import Any, Dict, Optional
 
 import pandas as pd
 
+# Módulos compartilhados entre os testes (pasta Compartilhado/ na raiz do repositório)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "Compartilhado"))
+
+from Deteccao_csv import ler_csv_detectado  # noqa: E402
+from Saida_compactada import NIVEL_PADRAO, escrever_csv_compactado  # noqa: E402
 
 COLUNAS_ENTRADA = [
     "CNPJ",
@@ -19,6 +25,11 @@ COLUNAS_ENTRADA = [
 
 
 def ler_csv(caminho: Path) -> pd.DataFrame:
+    """Lê CSV no formato detectado pela amostra (Deteccao_csv, engine C, uma leitura); se não der, tenta múltiplos encodings e separadores."""
+    df = ler_csv_detectado(caminho, on_bad_lines="skip")
+    if df is not None:
+        return df
+
     encodings = ["utf-8-sig", "utf-8", "latin1", "iso-8859-1"]
     separadores = [None, ";", ",", "\t", "|"]
     ultimo_erro: Optional[Exception] = None
@@ -132,26 +143,18 @@ def salvar_saida_vazia(pasta_saida: Path) -> None:
     print("Entrada vazia. Saídas vazias geradas.")
 
 
-def compactar_zip(arquivo_csv: Path, pasta_saida: Path, nome_zip: str) -> Path:
+def salvar_e_compactar(agregado: pd.DataFrame, pasta_saida: Path, nome_zip: str, nivel: int = NIVEL_PADRAO) -> Dict[str, Path]:
     """
-    Cria Teste_{seu_nome}.zip contendo despesas_agregadas.csv
+    Grava despesas_agregadas.csv e Teste_{seu_nome}.zip (com o CSV dentro) na mesma passada,
+    sem copiar o CSV para uma pasta temporária e zipar de novo.
     """
-    zip_base = pasta_saida / nome_zip.replace(".zip", "")
-    zip_path = Path(str(zip_base) + ".zip")
-
-    tmp_dir = pasta_saida / "__tmp_zip__"
-    if tmp_dir.exists():
-        shutil.rmtree(tmp_dir, ignore_errors=True)
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-
-    shutil.copy2(arquivo_csv, tmp_dir / arquivo_csv.name)
-    shutil.make_archive(str(zip_base), "zip", root_dir=tmp_dir)
-
-    shutil.rmtree(tmp_dir, ignore_errors=True)
-    return zip_path
+    nome_zip = nome_zip.replace(".zip", "") + ".zip"
+    return escrever_csv_compactado(
+        agregado, pasta_saida, "despesas_agregadas.csv", nome_zip, nivel=nivel, encoding="utf-8-sig",
+    )
 
 
-def processar_agregacao(nome_zip: str = "Teste_Matheus.zip") -> None:
+def processar_agregacao(nome_zip: str = "Teste_Matheus.zip", nivel_compressao: int = NIVEL_PADRAO) -> None:
     pasta_script = Path(__file__).resolve().parent
 
     pasta_entradas = pasta_script / "Dados" / "Entradas"
@@ -198,9 +201,9 @@ def processar_agregacao(nome_zip: str = "Teste_Matheus.zip") -> None:
     # ORDENAÇÃO: total desc (maior -> menor)
     agregado = agregado.sort_values(by="total_despesas", ascending=False, kind="mergesort")
 
-    # salva CSV final
-    arquivo_saida = pasta_saidas / "despesas_agregadas.csv"
-    agregado.to_csv(arquivo_saida, index=False, encoding="utf-8-sig")
+    # salva CSV final e o ZIP
+    saidas = salvar_e_compactar(agregado, pasta_saidas, nome_zip, nivel=nivel_compressao)
+    arquivo_saida = saidas["csv"]
 
     # resumo
     resumo = {
@@ -214,14 +217,11 @@ def processar_agregacao(nome_zip: str = "Teste_Matheus.zip") -> None:
         encoding="utf-8",
     )
 
-    # compacta
-    zip_path = compactar_zip(arquivo_saida, pasta_saidas, nome_zip)
-
     print("Resultados:")
     print(f"  Registros usados na agregação: {len(df)}")
     print(f"  Grupos (RazaoSocial, UF): {len(agregado)}")
     print(f"  CSV gerado: {arquivo_saida}")
-    print(f"  ZIP gerado: {zip_path}")
+    print(f"  ZIP gerado: {saidas['zip']}")
 
 
 if __name__ == "__main__":
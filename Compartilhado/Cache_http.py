@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+LOGGER = logging.getLogger("cache_http")
+
+PASTA_CACHE_PADRAO = Path(os.getenv("ANS_CACHE_HTTP_DIR", Path(__file__).resolve().parent / "Cache" / "http"))
+MAX_MB_PADRAO = int(os.getenv("ANS_CACHE_HTTP_MAX_MB", "4096"))
+INDICE_FILENAME = "indice.json"
+# Por quantos segundos os cabeçalhos de uma URL conferida com o servidor valem sem nova consulta
+FRESCOR_S_PADRAO = int(os.getenv("ANS_CACHE_HTTP_FRESCOR_S", "600"))
+
+# Arquivos menores que isso não compensam dividir em faixas paralelas
+TAMANHO_MINIMO_PARTES = 32 * 1024 * 1024
+
+
+def _gravar_stream(resp: requests.Response, destino: Path, modo: str) -> None:
+    with open(destino, modo) as f:
+        for chunk in resp.iter_content(chunk_size=1024 * 1024):
+            if chunk:
+                f.write(chunk)
+
+
+def formato_bytes(n: float) -> str:
+    for unidade in ("B", "KB", "MB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unidade}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+class CacheHttp:
+    """ Cache em disco para os GETs da ANS. Guarda o corpo + ETag/Last-Modified/Content-Length de cada URL e, na próxima vez, manda If-None-Match/If-Modified-Since: se o servidor responder 304 o arquivo local é reaproveitado sem baixar nada. O tamanho total é limitado (LRU por último acesso)."""
+
+    def __init__(
+        self,
+        pasta: Path = PASTA_CACHE_PADRAO,
+        max_bytes: int = MAX_MB_PADRAO * 1024 * 1024,
+        sessao: Optional[requests.Session] = None,
+    ) -> None:
+        self.pasta = pasta
+        self.max_bytes = max_bytes
+        self.sessao = sessao or requests.Session()
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_baixados = 0
+        self.bytes_evitados = 0
+
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self._indice: Dict[str, Dict] = self._carregar_indice()
+        # o limite pode ter diminuído desde a última execução
+        if self._indice:
+            self._expulsar(manter="")
+            self._salvar_indice()
+
+    # -------------------------
+    # Índice
+    # -------------------------
+    def _carregar_indice(self) -> Dict[str, Dict]:
+        path = self.pasta / INDICE_FILENAME
+        if not path.exists():
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            LOGGER.warning("Índice do cache HTTP ilegível, recomeçando vazio: %s", path)
+            return {}
+        # descarta entradas cujo corpo sumiu do disco
+        return {url: e for url, e in dados.items() if (self.pasta / e.get("arquivo", "")).is_file()}
+
+    def _salvar_indice(self) -> None:
+        path = self.pasta / INDICE_FILENAME
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._indice, f, ensure_ascii=False, indent=1)
+        tmp.replace(path)
+
+    def _arquivo_corpo(self, url: str) -> Path:
+        return self.pasta / hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _entrada_valida(self, url: str) -> Optional[Dict]:
+        entrada = self._indice.get(url)
+        if entrada and (self.pasta / entrada["arquivo"]).is_file():
+            return entrada
+        return None
+
+    def _expulsar(self, manter: str) -> None:
+        """Remove as entradas menos usadas até o cache caber em max_bytes."""
+        total = sum(e.get("tamanho", 0) for e in self._indice.values())
+        por_idade = sorted(self._indice.items(), key=lambda kv: kv[1].get("ultimo_acesso", 0))
+        for url, entrada in por_idade:
+            if total <= self.max_bytes:
+                break
+            if url == manter:
+                continue
+            (self.pasta / entrada["arquivo"]).unlink(missing_ok=True)
+            total -= entrada.get("tamanho", 0)
+            del self._indice[url]
+            self.evictions += 1
+
+    # -------------------------
+    # HTTP
+    # -------------------------
+    def _arquivo_parcial_meta(self, corpo: Path) -> Path:
+        return self.pasta / f"{corpo.name}.parcial.json"
+
+    def _ler_parcial_meta(self, corpo: Path) -> Dict:
+        path = self._arquivo_parcial_meta(corpo)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _gravar_parcial_meta(self, corpo: Path, meta: Dict) -> None:
+        with open(self._arquivo_parcial_meta(corpo), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @staticmethod
+    def _cabecalhos_download(resp: requests.Response) -> Tuple[Optional[int], Optional[str], bool]:
+        """(tamanho total, validador, aceita Range) de uma resposta 200."""
+        content_length = resp.headers.get("Content-Length")
+        total = int(content_length) if content_length and not resp.headers.get("Content-Encoding") else None
+        validador = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+        aceita_range = (
+            total is not None
+            and validador is not None
+            and resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+        )
+        return total, validador, aceita_range
+
+    def _continuar_parcial(
+        self,
+        url: str,
+        corpo: Path,
+        tmp: Path,
+        entrada: Optional[Dict],
+        timeout_s: int,
+        sessao: requests.Session,
+    ) -> Optional[Tuple[requests.Response, Optional[int]]]:
+        """Retoma o .part de um download interrompido (Range + If-Range) antes de qualquer GET completo. 206: completa o .part. 200 (arquivo mudou no servidor ou Range ignorado): a própria resposta já é o download inteiro. Retorna (resposta, tamanho total), ou None quando não há o que retomar ou o servidor responde 416; aí o chamador faz o GET normal."""
+        meta = self._ler_parcial_meta(corpo)
+        validador, total = meta.get("validador"), meta.get("total")
+        if not (validador and total and tmp.exists() and 0 < tmp.stat().st_size < total):
+            return None
+        if entrada and validador in (entrada.get("etag"), entrada.get("last_modified")):
+            return None  # essa versão já está inteira no cache
+        ja = tmp.stat().st_size
+        headers = {"Range": f"bytes={ja}-", "If-Range": validador}
+        with sessao.get(url, headers=headers, stream=True, timeout=timeout_s) as resp:
+            if resp.status_code == 416:
+                tmp.unlink(missing_ok=True)
+                self._arquivo_parcial_meta(corpo).unlink(missing_ok=True)
+                return None
+            resp.raise_for_status()
+            if resp.status_code == 206:
+                _gravar_stream(resp, tmp, "ab")
+                LOGGER.info("Download retomado a partir de %s: %s", formato_bytes(ja), url)
+                return resp, total
+            total, validador, aceita_range = self._cabecalhos_download(resp)
+            if aceita_range:
+                self._gravar_parcial_meta(corpo, {"validador": validador, "total": total})
+            _gravar_stream(resp, tmp, "wb")
+            return resp, total
+
+    def _baixar_em_partes(
+        self,
+        url: str,
+        corpo: Path,
+        tmp: Path,
+        total: int,
+        validador: str,
+        partes: int,
+        timeout_s: int,
+        sessao: requests.Session,
+    ) -> None:
+        """Baixa faixas de bytes em paralelo (cada uma retomável) e junta tudo em tmp."""
+        limites: List[Tuple[int, int]] = [
+            (i * total // partes, (i + 1) * total // partes - 1) for i in range(partes)
+        ]
+        arquivos = [self.pasta / f"{tmp.name}{i}" for i in range(partes)]
+
+        meta = {"validador": validador, "total": total, "partes": partes}
+        if self._ler_parcial_meta(corpo) != meta:
+            for arq in arquivos:
+                arq.unlink(missing_ok=True)
+            self._gravar_parcial_meta(corpo, meta)
+
+        def baixar_parte(i: int) -> None:
+            ini, fim = limites[i]
+            arq = arquivos[i]
+            ja = arq.stat().st_size if arq.exists() else 0
+            if ja > fim - ini + 1:
+                arq.unlink()
+                ja = 0
+            if ja == fim - ini + 1:
+                return
+            headers = {"Range": f"bytes={ini + ja}-{fim}", "If-Range": validador}
+            with sessao.get(url, headers=headers, stream=True, timeout=timeout_s) as resp:
+                resp.raise_for_status()
+                if resp.status_code != 206:
+                    raise IOError(f"Servidor não respeitou o Range (arquivo mudou?): {url}")
+                _gravar_stream(resp, arq, "ab")
+
+        with ThreadPoolExecutor(max_workers=partes) as executor:
+            list(executor.map(baixar_parte, range(partes)))
+
+        with open(tmp, "wb") as out:
+            for arq in arquivos:
+                with open(arq, "rb") as src:
+                    shutil.copyfileobj(src, out, length=1024 * 1024)
+        for arq in arquivos:
+            arq.unlink(missing_ok=True)
+
+    def _revalidar(
+        self,
+        url: str,
+        timeout_s: int,
+        sessao: Optional[requests.Session],
+        partes: int = 1,
+        verificar: Optional[Callable[[Path], None]] = None,
+    ) -> Path:
+        """Garante o corpo da URL atualizado no cache e retorna o caminho dele. Downloads interrompidos continuam de onde pararam (se o servidor aceitar Range) e, com partes > 1, arquivos grandes são baixados em faixas paralelas. Antes de entrar no cache o arquivo é conferido contra o Content-Length e pela função verificar."""
+        sessao = sessao or self.sessao
+        with self._lock:
+            entrada = self._entrada_valida(url)
+
+        headers: Dict[str, str] = {}
+        if entrada:
+            if entrada.get("etag"):
+                headers["If-None-Match"] = entrada["etag"]
+            if entrada.get("last_modified"):
+                headers["If-Modified-Since"] = entrada["last_modified"]
+
+        corpo = self._arquivo_corpo(url)
+        tmp = corpo.with_suffix(".part")
+
+        retomado = self._continuar_parcial(url, corpo, tmp, entrada, timeout_s, sessao)
+        if retomado is not None:
+            resp, total = retomado
+        else:
+            with sessao.get(url, headers=headers, stream=True, timeout=timeout_s) as resp:
+                if resp.status_code == 304 and entrada:
+                    with self._lock:
+                        entrada["ultimo_acesso"] = entrada["validado_em"] = time.time()
+                        self.hits += 1
+                        self.bytes_evitados += entrada.get("tamanho", 0)
+                        self._salvar_indice()
+                    return self.pasta / entrada["arquivo"]
+
+                resp.raise_for_status()
+
+                total, validador, aceita_range = self._cabecalhos_download(resp)
+                if aceita_range and partes > 1 and total >= TAMANHO_MINIMO_PARTES:
+                    resp.close()
+                    self._baixar_em_partes(url, corpo, tmp, total, validador, partes, timeout_s, sessao)
+                else:
+                    if aceita_range:
+                        self._gravar_parcial_meta(corpo, {"validador": validador, "total": total})
+                    _gravar_stream(resp, tmp, "wb")
+
+        tamanho = tmp.stat().st_size
+        if total is not None and tamanho != total:
+            # menor: fica o .part para retomar na próxima tentativa
+            if tamanho > total:
+                tmp.unlink(missing_ok=True)
+            raise IOError(f"Download incompleto de {url}: {tamanho} de {total} bytes")
+
+        if verificar is not None:
+            try:
+                verificar(tmp)
+            except Exception:
+                tmp.unlink(missing_ok=True)
+                self._arquivo_parcial_meta(corpo).unlink(missing_ok=True)
+                raise
+
+        tmp.replace(corpo)
+        self._arquivo_parcial_meta(corpo).unlink(missing_ok=True)
+        with self._lock:
+            self._indice[url] = {
+                "arquivo": corpo.name,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "content_length": total,
+                "encoding": resp.encoding,
+                "tamanho": tamanho,
+                "ultimo_acesso": time.time(),
+                "validado_em": time.time(),
+            }
+            self.misses += 1
+            self.bytes_baixados += tamanho
+            self._expulsar(manter=url)
+            self._salvar_indice()
+        return corpo
+
+    def obter_texto(self, url: str, timeout_s: int = 30, sessao: Optional[requests.Session] = None) -> str:
+        corpo = self._revalidar(url, timeout_s, sessao)
+        with self._lock:
+            encoding = (self._indice.get(url) or {}).get("encoding") or "utf-8"
+        return corpo.read_bytes().decode(encoding, errors="replace")
+
+    def baixar(
+        self,
+        url: str,
+        destino: Path,
+        timeout_s: int = 60,
+        sessao: Optional[requests.Session] = None,
+        partes: int = 1,
+        verificar: Optional[Callable[[Path], None]] = None,
+    ) -> Path:
+        """Revalida a URL e deixa uma cópia do conteúdo em destino. Cópia, não hardlink: quem editar o destino no lugar não pode alterar o corpo guardado no cache (um destino que ainda seja hardlink de execuções antigas é trocado por cópia)."""
+        corpo = self._revalidar(url, timeout_s, sessao, partes=partes, verificar=verificar)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = destino.with_suffix(destino.suffix + ".tmp")
+        tmp.unlink(missing_ok=True)
+        shutil.copyfile(corpo, tmp)
+        tmp.replace(destino)
+        return destino
+
+    @staticmethod
+    def _metadados_entrada(entrada: Dict) -> Dict[str, Optional[object]]:
+        tamanho = entrada.get("content_length")
+        return {
+            "tamanho": tamanho if tamanho is not None else entrada.get("tamanho"),
+            "last_modified": entrada.get("last_modified"),
+            "etag": entrada.get("etag"),
+        }
+
+    def metadados(
+        self,
+        url: str,
+        timeout_s: int = 30,
+        sessao: Optional[requests.Session] = None,
+        frescor_s: int = FRESCOR_S_PADRAO,
+    ) -> Dict[str, Optional[object]]:
+        """Tamanho, Last-Modified e ETag da URL (None no que o servidor não informar). Se o corpo está no cache e foi conferido com o servidor há menos de frescor_s segundos, responde do índice sem rede; senão faz um HEAD condicional, e um 304 reaproveita os valores guardados. O HEAD não grava nada novo no índice: só um GET traz o corpo."""
+        sessao = sessao or self.sessao
+        with self._lock:
+            entrada = self._entrada_valida(url)
+            if entrada and time.time() - entrada.get("validado_em", 0) < frescor_s:
+                return self._metadados_entrada(entrada)
+
+        headers: Dict[str, str] = {}
+        if entrada:
+            if entrada.get("etag"):
+                headers["If-None-Match"] = entrada["etag"]
+            if entrada.get("last_modified"):
+                headers["If-Modified-Since"] = entrada["last_modified"]
+
+        resp = sessao.head(url, headers=headers, timeout=timeout_s, allow_redirects=True)
+        if resp.status_code == 304 and entrada:
+            with self._lock:
+                entrada["validado_em"] = time.time()
+                self._salvar_indice()
+            return self._metadados_entrada(entrada)
+        resp.raise_for_status()
+
+        tamanho = resp.headers.get("Content-Length", "")
+        return {
+            "tamanho": int(tamanho) if tamanho.isdigit() else None,
+            "last_modified": resp.headers.get("Last-Modified"),
+            "etag": resp.headers.get("ETag"),
+        }
+
+    def resumo(self) -> str:
+        return (
+            f"Cache HTTP: {self.hits} hits (304), {self.misses} misses, "
+            f"{formato_bytes(self.bytes_baixados)} baixados, {formato_bytes(self.bytes_evitados)} evitados, "
+            f"{self.evictions} removidos por LRU"
+        )
+
+
+_CACHE_PADRAO: Optional[CacheHttp] = None
+_CACHE_PADRAO_LOCK = threading.Lock()
+
+
+def cache_padrao() -> CacheHttp:
+    """Instância única por processo, na pasta Compartilhado/Cache/http."""
+    global _CACHE_PADRAO
+    with _CACHE_PADRAO_LOCK:
+        if _CACHE_PADRAO is None:
+            _CACHE_PADRAO = CacheHttp()
+        return _CACHE_PADRAO
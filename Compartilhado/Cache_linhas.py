@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from Cache_http import formato_bytes
+from Valores_decimais import centavos_half_up, para_ponto_fixo
+
+LOGGER = logging.getLogger("cache_linhas")
+
+PASTA_CACHE_PADRAO = Path(os.getenv("ANS_CACHE_LINHAS_DIR", Path(__file__).resolve().parent / "Cache" / "linhas"))
+MAX_MB_PADRAO = int(os.getenv("ANS_CACHE_LINHAS_MAX_MB", "4096"))
+MAX_DIAS_PADRAO = int(os.getenv("ANS_CACHE_LINHAS_MAX_DIAS", "30"))
+
+# Mudou o layout dos arquivos do cache? Incrementa para ignorar o que já está gravado.
+FORMATO = 2
+
+# Cada gravação monta a entrada numa pasta própria aqui dentro e só depois move para a partição
+# (o "." faz o dataset e os globs de limpar() ignorarem)
+PASTA_TEMPORARIOS = ".tmp"
+# Temporário sem mudança há mais que isso é de uma execução que caiu: limpar() pode apagar
+IDADE_TEMPORARIO_S = 24 * 3600
+
+COLUNAS_TEXTO = ("reg_ans", "conta", "descricao", "valor")
+SCHEMA_LINHAS = pa.schema([
+    ("reg_ans", pa.string()),
+    ("conta", pa.string()),
+    ("descricao", pa.string()),
+    ("valor", pa.string()),             # texto exato, como veio do arquivo
+    ("valor_centavos", pa.int64()),     # ROUND_HALF_UP; nulo quando o texto não é um número simples
+    ("arquivo", pa.string()),
+])
+# As partições ficam no caminho (ano=/trimestre=/zip=), não dentro dos arquivos
+PARTICOES = ds.partitioning(
+    pa.schema([("ano", pa.int16()), ("trimestre", pa.int8()), ("zip", pa.string())]),
+    flavor="hive",
+)
+
+
+@dataclass(frozen=True)
+class ChaveLinhas:
+    """Um arquivo tabular dentro de um ZIP da ANS, identificado pelo conteúdo do ZIP (sha256) e pela versão da leitura que gerou as linhas."""
+    ano: int
+    trimestre: int
+    sha256_zip: str
+    membro: str
+    versao_leitura: int
+
+    def pasta(self, raiz: Path) -> Path:
+        return raiz / f"ano={self.ano}" / f"trimestre={self.trimestre}" / f"zip={self.sha256_zip[:16]}"
+
+    def nome(self) -> str:
+        legivel = re.sub(r"[^0-9A-Za-z._-]+", "_", self.membro)[-80:]
+        return f"{legivel}-{hashlib.sha1(self.membro.encode('utf-8')).hexdigest()[:8]}"
+
+
+def publicar(origem: Path, destino: Path, tentativas: int = 3) -> None:
+    """os.replace para dentro da partição. O limpar() de outro processo pode remover a pasta, vazia, entre o mkdir e a troca: aí ela é criada de novo."""
+    for i in range(tentativas):
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(origem, destino)
+            return
+        except FileNotFoundError:
+            if i == tentativas - 1 or not origem.exists():
+                raise
+
+
+def modificado_em(pasta: Path) -> float:
+    """mtime mais recente da pasta e do que está nela (o Parquet em gravação muda a cada chunk)."""
+    try:
+        return max([pasta.stat().st_mtime] + [p.stat().st_mtime for p in pasta.iterdir()])
+    except OSError:
+        return time.time()
+
+
+@dataclass
+class GravadorLinhas:
+    """Grava os chunks de um arquivo num Parquet temporário, um row group por chunk (a releitura devolve exatamente os mesmos chunks, com as mesmas colunas). O temporário fica numa pasta só desta gravação, em temporarios; só vira entrada do cache em concluir()."""
+    destino: Path
+    meta_path: Path
+    nome_arquivo: str
+    temporarios: Path
+    meta: Dict[str, Any] = field(default_factory=dict)
+    cancelado: bool = False
+    _pasta_tmp: Optional[Path] = None
+    _writer: Optional[pq.ParquetWriter] = None
+    _grupos: List[int] = field(default_factory=list)
+    _colunas: List[List[str]] = field(default_factory=list)
+    _linhas: int = 0
+
+    def _abrir_pasta_tmp(self) -> Path:
+        if self._pasta_tmp is None:
+            self._pasta_tmp = self.temporarios / uuid.uuid4().hex
+            self._pasta_tmp.mkdir(parents=True)
+        return self._pasta_tmp
+
+    def gravar(self, linhas: pd.DataFrame, parte: int) -> None:
+        """linhas tem as colunas de COLUNAS_TEXTO que o chunk tem (conta pode faltar, e pode faltar só em algumas planilhas de um XLSX). parte separa blocos com regra própria (planilhas de um XLSX)."""
+        if self.cancelado or linhas.empty:
+            return
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._abrir_pasta_tmp() / self.destino.name, SCHEMA_LINHAS, compression="zstd")
+
+        pf = para_ponto_fixo(linhas["valor"], formato="br")
+        centavos = centavos_half_up(pf).astype("Int64").where(pf.ok)
+        dados = {c: linhas[c] if c in linhas.columns else pd.Series(None, index=linhas.index, dtype=object)
+                 for c in COLUNAS_TEXTO}
+        tabela = pa.table({
+            **{c: pa.array(s.to_numpy(dtype=object), type=pa.string(), from_pandas=True) for c, s in dados.items()},
+            "valor_centavos": pa.array(centavos, type=pa.int64(), from_pandas=True),
+            "arquivo": pa.array([self.nome_arquivo] * len(linhas), type=pa.string()),
+        }, schema=SCHEMA_LINHAS)
+        self._writer.write_table(tabela, row_group_size=len(tabela))
+        self._grupos.append(parte)
+        self._colunas.append([c for c in COLUNAS_TEXTO if c in linhas.columns])
+        self._linhas += len(tabela)
+
+    def cancelar(self) -> None:
+        """O arquivo não cabe no formato do cache: continua sendo lido do original."""
+        self.cancelado = True
+        self.descartar()
+
+    def descartar(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._pasta_tmp is not None:
+            shutil.rmtree(self._pasta_tmp, ignore_errors=True)
+            self._pasta_tmp = None
+
+    def concluir(self) -> None:
+        if self.cancelado:
+            return
+        pasta_tmp = self._abrir_pasta_tmp()
+        if self._writer is None:   # arquivo sem linhas: entrada vazia, só com o meta
+            pq.write_table(SCHEMA_LINHAS.empty_table(), pasta_tmp / self.destino.name)
+        else:
+            self._writer.close()
+            self._writer = None
+
+        meta = dict(self.meta, formato=FORMATO, grupos=self._grupos, colunas=self._colunas,
+                    linhas=self._linhas, criado=time.time())
+        with open(pasta_tmp / self.meta_path.name, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        publicar(pasta_tmp / self.destino.name, self.destino)
+        # o meta é o "commit" da entrada: entra por último
+        publicar(pasta_tmp / self.meta_path.name, self.meta_path)
+        self.descartar()
+
+
+class CacheLinhas:
+    """ Cache em Parquet das linhas já lidas e projetadas (REG_ANS, conta, descrição, valor) dos CSV/XLSX da ANS. Particionado por ano/trimestre/ZIP, com a chave pelo sha256 do ZIP: conteúdo novo é entrada nova. Reprocessar (ou testar outra regra de agregação) lê daqui em vez de refazer o parse. Entradas sem uso há mais de max_dias ou além de max_bytes (LRU) são removidas."""
+
+    def __init__(
+        self,
+        pasta: Path = PASTA_CACHE_PADRAO,
+        max_bytes: int = MAX_MB_PADRAO * 1024 * 1024,
+        max_dias: float = MAX_DIAS_PADRAO,
+    ) -> None:
+        self.pasta = pasta
+        self.max_bytes = max_bytes
+        self.max_dias = max_dias
+        self.evictions = 0
+
+    def _caminhos(self, chave: ChaveLinhas) -> Tuple[Path, Path]:
+        pasta = chave.pasta(self.pasta)
+        nome = chave.nome()
+        return pasta / f"{nome}.parquet", pasta / f"_{nome}.json"
+
+    def meta(self, chave: ChaveLinhas) -> Optional[Dict[str, Any]]:
+        """Meta da entrada, se ela existe completa e foi gravada por esta versão (do cache e da leitura)."""
+        parquet, meta_path = self._caminhos(chave)
+        if not parquet.is_file() or not meta_path.is_file():
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("formato") != FORMATO or meta.get("versao_leitura") != chave.versao_leitura:
+            return None
+        return meta
+
+    def frames(self, chave: ChaveLinhas) -> Iterator[Tuple[pd.DataFrame, int]]:
+        """Os chunks gravados, na ordem e com os mesmos limites, como (DataFrame com as colunas de COLUNAS_TEXTO que o chunk tinha, parte). Nulos voltam como NaN, igual ao read_csv."""
+        parquet, meta_path = self._caminhos(chave)
+        os.utime(meta_path)   # último acesso, para o LRU
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arquivo = pq.ParquetFile(parquet)
+        for i, (parte, colunas) in enumerate(zip(meta["grupos"], meta["colunas"])):
+            df = arquivo.read_row_group(i, columns=colunas).to_pandas()
+            yield df.astype(object).where(df.notna(), np.nan), parte
+
+    @contextmanager
+    def gravando(self, chave: ChaveLinhas, nome_arquivo: str) -> Iterator[GravadorLinhas]:
+        """Gravador da entrada. Se o bloco levantar exceção, nada fica no cache."""
+        parquet, meta_path = self._caminhos(chave)
+        gravador = GravadorLinhas(parquet, meta_path, nome_arquivo, self.pasta / PASTA_TEMPORARIOS,
+                                  meta={"versao_leitura": chave.versao_leitura})
+        try:
+            yield gravador
+        except BaseException:
+            gravador.descartar()
+            raise
+        gravador.concluir()
+
+    def consultar(
+        self,
+        colunas: Optional[List[str]] = None,
+        filtro: Optional[ds.Expression] = None,
+    ) -> pd.DataFrame:
+        """Lê o cache inteiro como um dataset particionado. O filtro (ex.: (ds.field("ano") == 2025) & (ds.field("conta") == "41")) é empurrado para o Parquet: partições de fora nem são abertas e row groups são pulados pelas estatísticas. Inclui todas as versões de ZIP ainda no cache; filtre por "zip" (16 primeiros caracteres do sha256) para ficar só com as atuais."""
+        if not self.pasta.is_dir():
+            return SCHEMA_LINHAS.empty_table().to_pandas()
+        dataset = ds.dataset(self.pasta, format="parquet", partitioning=PARTICOES)
+        return dataset.to_table(columns=colunas, filter=filtro).to_pandas()
+
+    def _entradas(self) -> List[Tuple[float, int, Path, Path]]:
+        entradas = []
+        for meta_path in self.pasta.glob("ano=*/trimestre=*/zip=*/_*.json"):
+            parquet = meta_path.with_name(f"{meta_path.stem[1:]}.parquet")
+            try:
+                acesso = meta_path.stat().st_mtime
+                tamanho = meta_path.stat().st_size + (parquet.stat().st_size if parquet.exists() else 0)
+            except OSError:
+                continue
+            entradas.append((acesso, tamanho, parquet, meta_path))
+        return entradas
+
+    def limpar(self) -> int:
+        """Remove as entradas sem uso há mais de max_dias e, depois, as menos usadas até caber em max_bytes. Retorna quantas saíram."""
+        if not self.pasta.is_dir():
+            return 0
+        limite_idade = time.time() - self.max_dias * 86400
+        entradas = sorted(self._entradas())
+        total = sum(t for _, t, _, _ in entradas)
+        removidas = 0
+        for acesso, tamanho, parquet, meta_path in entradas:
+            if acesso >= limite_idade and total <= self.max_bytes:
+                break
+            meta_path.unlink(missing_ok=True)
+            parquet.unlink(missing_ok=True)
+            total -= tamanho
+            removidas += 1
+
+        # Outro processo pode estar gravando agora: só sai temporário (ou Parquet sem meta) parado há
+        # mais de IDADE_TEMPORARIO_S, e pasta só com rmdir, que falha se alguém acabou de pôr algo nela
+        limite_tmp = time.time() - IDADE_TEMPORARIO_S
+        temporarios = self.pasta / PASTA_TEMPORARIOS
+        if temporarios.is_dir():
+            for pasta in temporarios.iterdir():
+                if modificado_em(pasta) < limite_tmp:
+                    shutil.rmtree(pasta, ignore_errors=True)
+        for pasta in self.pasta.glob("ano=*/trimestre=*/zip=*"):
+            for arq in pasta.iterdir():
+                sobra = arq.name.startswith(".") or (
+                    arq.suffix == ".parquet" and not arq.with_name(f"_{arq.stem}.json").exists()
+                )
+                try:
+                    if sobra and arq.stat().st_mtime < limite_tmp:
+                        arq.unlink()
+                except OSError:
+                    pass
+        for nivel in ("ano=*/trimestre=*/zip=*", "ano=*/trimestre=*", "ano=*"):
+            for pasta in self.pasta.glob(nivel):
+                try:
+                    pasta.rmdir()
+                except OSError:
+                    pass   # não está vazia
+        self.evictions += removidas
+        return removidas
+
+    def tamanho(self) -> int:
+        return sum(t for _, t, _, _ in self._entradas()) if self.pasta.is_dir() else 0
+
+    def resumo(self, hits: int, misses: int) -> str:
+        return (
+            f"Cache de linhas: {hits} hits, {misses} misses, {formato_bytes(self.tamanho())} em disco, "
+            f"{self.evictions} removidos (idade/LRU)"
+        )
+
+
+_CACHE_PADRAO: Optional[CacheLinhas] = None
+_CACHE_PADRAO_LOCK = threading.Lock()
+
+
+def cache_linhas_padrao() -> CacheLinhas:
+    """Instância única por processo, na pasta Compartilhado/Cache/linhas."""
+    global _CACHE_PADRAO
+    with _CACHE_PADRAO_LOCK:
+        if _CACHE_PADRAO is None:
+            _CACHE_PADRAO = CacheLinhas()
+        return _CACHE_PADRAO
+
+
+def filtro_zips(shas: Iterable[str]) -> ds.Expression:
+    """Filtro de consultar() para só as versões de ZIP informadas (sha256 completos)."""
+    return ds.field("zip").isin([s[:16] for s in shas])
@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import unicodedata
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+LOGGER = logging.getLogger("cadop")
+
+PASTA_SNAPSHOTS_PADRAO = Path(os.getenv("ANS_CACHE_CADOP_DIR", Path(__file__).resolve().parent / "Cache" / "cadop"))
+# Snapshots de versões antigas do cadastro que continuam em disco
+SNAPSHOTS_GUARDADOS = 3
+
+# Mudou o parse ou o layout do snapshot? Incrementa para gerar de novo.
+FORMATO = 2
+
+# Coluna do snapshot -> nomes aceitos no CSV da ANS (já normalizados: minúsculas, sem acento, só letras e dígitos),
+# na ordem de preferência. Depois dos nomes exatos, vale a primeira coluna que contém o trecho de "contem".
+COLUNAS_CADOP: Dict[str, Tuple[str, ...]] = {
+    "reg_ans": ("registroans", "regans", "registrooperadora", "registrodaans", "registroansoperadora"),
+    "cnpj": ("cnpj",),
+    "razao_social": ("razaosocial", "nomeempresarial", "razao", "nome"),
+    "modalidade": ("modalidade",),
+    "uf": ("uf",),
+    "data_registro": ("dataregistroans", "dataregistro"),
+    "data_cancelamento": ("datadescredenciamento", "datacancelamento", "datadocancelamento"),
+}
+COLUNAS_DATA = ("data_registro", "data_cancelamento")
+CONTEM: Dict[str, str] = {"cnpj": "cnpj", "modalidade": "modalidade", "uf": "uf"}
+
+
+def normalizar_nome_coluna(nome: str) -> str:
+    texto = unicodedata.normalize("NFKD", str(nome).strip().lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", "", texto)
+
+
+def mapear_colunas(colunas: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Coluna do snapshot -> coluna do CSV (None se não achou)."""
+    mapa: Dict[str, str] = {}
+    for c in colunas:
+        mapa.setdefault(normalizar_nome_coluna(c), c)
+
+    out: Dict[str, Optional[str]] = {}
+    for nome, opcoes in COLUNAS_CADOP.items():
+        achou = next((mapa[o] for o in opcoes if o in mapa), None)
+        if achou is None and nome in CONTEM:
+            achou = next((orig for norm, orig in mapa.items() if CONTEM[nome] in norm), None)
+        out[nome] = achou
+    return out
+
+
+def chave_cnpj(cnpj: pd.Series) -> pd.Series:
+    """CNPJ só com dígitos e 14 posições (zeros à esquerda); "" quando não tem dígito ou passa de 14."""
+    digitos = cnpj.fillna("").astype(str).str.replace(r"\D+", "", regex=True)
+    ok = (digitos.str.len() > 0) & (digitos.str.len() <= 14)
+    return digitos.str.zfill(14).where(ok, "")
+
+
+def para_data(texto: pd.Series) -> pd.Series:
+    """AAAA-MM-DD (CADOP atual) ou DD/MM/AAAA; NaT no resto."""
+    iso = pd.to_datetime(texto, format="%Y-%m-%d", errors="coerce")
+    br = pd.to_datetime(texto.where(iso.isna()), format="%d/%m/%Y", errors="coerce")
+    return iso.fillna(br)
+
+
+def sha256_arquivo(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+# =========================
+# Parse do CSV
+# =========================
+def ler_cabecalho(csv_path: Path) -> Tuple[str, str, List[str]]:
+    """(encoding, separador, colunas). utf-8-sig tira o BOM se houver; sem UTF-8 válido no começo, latin1."""
+    with open(csv_path, "rb") as f:
+        amostra = f.read(64 * 1024)
+    try:
+        amostra.decode("utf-8")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # um caractere multibyte cortado no fim da amostra não conta
+        encoding = "utf-8-sig" if e.start >= len(amostra) - 3 else "latin1"
+
+    primeira = amostra.decode(encoding, errors="replace").splitlines()[0] if amostra else ""
+    sep = max((";", ",", "\t", "|"), key=primeira.count)
+    colunas = [c.strip().strip('"') for c in primeira.split(sep)]
+    return encoding, sep, colunas
+
+
+def ler_cadop_csv(csv_path: Path) -> Tuple[pd.DataFrame, Dict[str, Optional[str]], List[str]]:
+    """ Lê do CSV só as colunas de COLUNAS_CADOP (engine C, usecols), como texto sem espaços nas pontas e "" no lugar de vazio; as de COLUNAS_DATA viram datas. Retorna também o mapeamento usado e as colunas originais."""
+    encoding, sep, colunas = ler_cabecalho(csv_path)
+    origem = mapear_colunas(colunas)
+    usar = sorted({c for c in origem.values() if c}, key=colunas.index)
+
+    def ler(enc: str) -> pd.DataFrame:
+        return pd.read_csv(csv_path, sep=sep, dtype=str, encoding=enc, usecols=usar or None,
+                           on_bad_lines="skip", engine="c")
+
+    try:
+        df = ler(encoding)
+    except UnicodeDecodeError:
+        df = ler("latin1")
+    df.columns = [c.strip() for c in df.columns]
+
+    out = pd.DataFrame(index=df.index)
+    for nome, col in origem.items():
+        out[nome] = df[col].fillna("").astype(str).str.strip() if col else ""
+    out["cnpj"] = out["cnpj"].str.replace(r"\D+", "", regex=True)
+    for c in COLUNAS_DATA:
+        out[c] = para_data(out[c])
+    return out.reset_index(drop=True), origem, colunas
+
+
+# =========================
+# Índices (chaves ordenadas + linha)
+# =========================
+def montar_indice(chaves: pd.Series) -> pa.Table:
+    """ Chaves não vazias ordenadas (binário de largura fixa) com a linha de origem de cada uma. Ordenação estável: chaves repetidas ficam na ordem do arquivo."""
+    ok = (chaves != "").to_numpy()
+    codif = np.array([c.encode("utf-8") for c in chaves[ok]], dtype=bytes)
+    largura = max(1, codif.dtype.itemsize)
+    codif = codif.astype(f"S{largura}")
+    ordem = np.argsort(codif, kind="stable")
+    ordenadas = np.ascontiguousarray(codif[ordem])
+    return pa.table({
+        "chave": pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(largura), len(ordenadas), [None, pa.py_buffer(ordenadas.tobytes())]
+        ),
+        "linha": pa.array(np.flatnonzero(ok)[ordem].astype(np.int32)),
+    })
+
+
+@dataclass
+class IndiceOrdenado:
+    """Índice de uma coluna: busca binária (searchsorted) sobre as chaves mapeadas direto do arquivo, sem cópia."""
+    chaves: np.ndarray      # S<largura>, ordenadas
+    linhas: np.ndarray      # int32
+
+    @classmethod
+    def de_tabela(cls, tabela: pa.Table) -> "IndiceOrdenado":
+        col = tabela.column("chave").combine_chunks()
+        largura = col.type.byte_width
+        chaves = np.frombuffer(col.buffers()[1], dtype=f"S{largura}", count=len(col), offset=col.offset * largura)
+        linhas = tabela.column("linha").combine_chunks().to_numpy(zero_copy_only=False)
+        return cls(chaves, linhas)
+
+    def intervalos(self, busca: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """[inicio, fim) de cada chave buscada em self.linhas; inicio == fim quando não há."""
+        largura = self.chaves.dtype.itemsize
+        codif = [b.encode("utf-8") for b in busca]
+        cabe = np.fromiter((0 < len(b) <= largura for b in codif), dtype=bool, count=len(codif))
+        q = np.array([b if c else b"" for b, c in zip(codif, cabe)], dtype=f"S{largura}")
+        inicio = np.searchsorted(self.chaves, q, side="left")
+        fim = np.searchsorted(self.chaves, q, side="right")
+        fim[~cabe] = inicio[~cabe]
+        return inicio, fim
+
+    def primeira(self, busca: Iterable[str]) -> np.ndarray:
+        """Linha da primeira ocorrência (ordem do arquivo) de cada chave; -1 quando não há."""
+        inicio, fim = self.intervalos(busca)
+        achou = fim > inicio
+        out = np.full(len(inicio), -1, dtype=np.int64)
+        out[achou] = self.linhas[inicio[achou]]
+        return out
+
+
+# =========================
+# Snapshot
+# =========================
+def ler_ipc(path: Path) -> pa.Table:
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+
+def gravar_ipc(tabela: pa.Table, path: Path) -> None:
+    with pa.OSFile(str(path), "wb") as f, pa.ipc.new_file(f, tabela.schema) as w:
+        w.write_table(tabela)
+
+
+@dataclass
+class SnapshotCadop:
+    """ Cadastro de operadoras já lido: tabela Arrow (mapeada do disco) com as colunas de COLUNAS_CADOP na ordem do arquivo, mais os índices REG_ANS -> linhas e CNPJ -> linhas. A chave de CNPJ é a de chave_cnpj (14 dígitos)."""
+    sha256: str
+    tabela: pa.Table
+    origem: Dict[str, Optional[str]]      # coluna do snapshot -> coluna do CSV
+    colunas_csv: List[str]
+    reg_ans: IndiceOrdenado
+    cnpj: IndiceOrdenado
+
+    def df(self, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+        return self.tabela.select(colunas or self.tabela.column_names).to_pandas()
+
+    def linhas(self, posicoes: np.ndarray, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+        """Linhas nas posições pedidas, na ordem pedida; -1 vira linha nula (NaN em todas as colunas)."""
+        achou = posicoes >= 0
+        tabela = self.tabela.select(colunas or self.tabela.column_names)
+        pegar = pa.array(np.where(achou, posicoes, 0), mask=~achou)
+        out = tabela.take(pegar).to_pandas()
+        return out.where(out.notna(), np.nan)
+
+    def por_reg_ans(self, regs: Iterable[str], colunas: Optional[List[str]] = None) -> pd.DataFrame:
+        """Uma linha por REG_ANS buscado (a primeira do cadastro), NaN quando não está no cadastro."""
+        return self.linhas(self.reg_ans.primeira(regs), colunas)
+
+    def por_cnpj(self, cnpjs: Iterable[str], colunas: Optional[List[str]] = None) -> pd.DataFrame:
+        """Todas as linhas do cadastro com os CNPJs buscados (qualquer máscara), com a posição do CNPJ na busca em "busca"."""
+        chaves = chave_cnpj(pd.Series(list(cnpjs), dtype=object))
+        inicio, fim = self.cnpj.intervalos(chaves.tolist())
+        busca = np.repeat(np.arange(len(inicio)), fim - inicio)
+        partes = [self.cnpj.linhas[i:f] for i, f in zip(inicio, fim)]
+        pos = np.concatenate(partes).astype(np.int64) if partes else np.zeros(0, dtype=np.int64)
+        return self.linhas(pos, colunas).assign(busca=busca)
+
+
+def gerar_snapshot(csv_path: Path, destino: Path, sha256: str) -> None:
+    df, origem, colunas = ler_cadop_csv(csv_path)
+    meta = {
+        "sha256": sha256,
+        "formato": str(FORMATO),
+        "colunas_csv": "\x1f".join(colunas),
+        **{f"origem.{k}": v or "" for k, v in origem.items()},
+    }
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    for c in COLUNAS_DATA:
+        i = tabela.schema.get_field_index(c)
+        tabela = tabela.set_column(i, c, pc.cast(tabela.column(c), pa.date32()))
+    tabela = tabela.replace_schema_metadata(meta)
+
+    tmp = destino.with_name(f".{destino.name}.{uuid.uuid4().hex}")
+    tmp.mkdir(parents=True)
+    try:
+        gravar_ipc(tabela, tmp / "cadop.arrow")
+        gravar_ipc(montar_indice(df["reg_ans"]), tmp / "indice_reg_ans.arrow")
+        gravar_ipc(montar_indice(chave_cnpj(df["cnpj"])), tmp / "indice_cnpj.arrow")
+        tmp.rename(destino)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not destino.is_dir():   # outro processo gravou o mesmo snapshot antes: tudo bem
+            raise
+
+
+def carregar_snapshot(pasta: Path) -> SnapshotCadop:
+    tabela = ler_ipc(pasta / "cadop.arrow")
+    meta = {k.decode(): v.decode() for k, v in (tabela.schema.metadata or {}).items()}
+    return SnapshotCadop(
+        sha256=meta["sha256"],
+        tabela=tabela.replace_schema_metadata(None),
+        origem={k: meta[f"origem.{k}"] or None for k in COLUNAS_CADOP},
+        colunas_csv=meta["colunas_csv"].split("\x1f"),
+        reg_ans=IndiceOrdenado.de_tabela(ler_ipc(pasta / "indice_reg_ans.arrow")),
+        cnpj=IndiceOrdenado.de_tabela(ler_ipc(pasta / "indice_cnpj.arrow")),
+    )
+
+
+# =========================
+# Histórico (ativas + canceladas)
+# =========================
+# Dias desde 1970 deslocados para ficarem positivos; data ausente vale "desde sempre" no início
+# e "hoje em diante" na busca. Fim: ativa nunca termina; cancelada sem data já terminou em qualquer data.
+_DESLOCAMENTO_DIAS = 2 ** 30
+_SEM_INICIO = 0
+_SEM_DATA_BUSCA = 2 ** 31 - 1
+_SEM_FIM = 2 ** 31
+_FIM_DESCONHECIDO = 0
+
+
+def dias(datas: np.ndarray, vazio: int) -> np.ndarray:
+    d = np.asarray(datas, dtype="datetime64[D]")
+    return np.where(np.isnat(d), vazio, d.astype(np.int64) + _DESLOCAMENTO_DIAS)
+
+
+@dataclass
+class HistoricoCadop:
+    """ REG_ANS no tempo, juntando os cadastros de operadoras ativas e canceladas. Cada linha vale de data_registro até data_cancelamento (aberto nas ativas). Índice de intervalos: chave composta (código do REG_ANS, dia de início) ordenada, então a busca "registro vigente em tal data" é um único searchsorted para o frame inteiro."""
+    tabela: pa.Table            # canceladas + ativas, com a coluna "ativa"
+    regs: np.ndarray            # REG_ANS distintos, ordenados (S<largura>)
+    chaves: np.ndarray          # código * 2**32 + dia de início, ordenadas
+    linhas: np.ndarray          # linha da tabela de cada chave
+    fins: np.ndarray            # dia do cancelamento de cada chave (_SEM_FIM nas ativas)
+
+    @classmethod
+    def de_snapshots(cls, ativas: SnapshotCadop, canceladas: Optional[SnapshotCadop] = None) -> "HistoricoCadop":
+        partes = [s.tabela.append_column("ativa", pa.array(np.full(s.tabela.num_rows, s is ativas)))
+                  for s in (canceladas, ativas) if s is not None]
+        tabela = pa.concat_tables(partes)
+
+        reg = np.array([r.encode("utf-8") for r in tabela.column("reg_ans").to_pylist()], dtype=bytes)
+        reg = reg.astype(f"S{max(1, reg.dtype.itemsize)}")
+        ok = reg != b""
+        regs = np.unique(reg[ok])
+        codigo = np.searchsorted(regs, reg)
+        inicio = dias(tabela.column("data_registro").to_numpy(zero_copy_only=False), _SEM_INICIO)
+        chave = codigo.astype(np.int64) * 2 ** 32 + inicio
+        ativa = tabela.column("ativa").to_numpy(zero_copy_only=False)
+        fim = np.where(ativa, _SEM_FIM,
+                       dias(tabela.column("data_cancelamento").to_numpy(zero_copy_only=False), _FIM_DESCONHECIDO))
+
+        # Empates (mesmo REG_ANS e mesmo início): vence a ativa e, dentro do arquivo, a primeira linha,
+        # que é a última da ordenação (a busca pega a última chave <= data)
+        n = len(reg)
+        ordem = np.lexsort((-np.arange(n), ativa, chave))
+        ordem = ordem[ok[ordem]]
+        return cls(tabela, regs, chave[ordem], ordem.astype(np.int64), fim[ordem].astype(np.int64))
+
+    def vigentes(self, regs: Iterable[str], datas: Iterable) -> np.ndarray:
+        """ Linha da tabela vigente para cada (REG_ANS, data): entre os registros do REG_ANS com início até a data, o mais recente que ainda não estava cancelado na data (as-of). Se todos já estavam cancelados, fica o de início mais recente (cancelada_na_data diz se é o caso). REG_ANS registrado só depois da data fica com o primeiro registro; -1 quando não aparece em nenhum cadastro. Data ausente = o registro mais recente."""
+        largura = self.regs.dtype.itemsize
+        q = [r.encode("utf-8") if isinstance(r, str) else b"" for r in regs]
+        cabe = np.fromiter((0 < len(b) <= largura for b in q), dtype=bool, count=len(q))
+        q_arr = np.array([b if c else b"" for b, c in zip(q, cabe)], dtype=f"S{largura}")
+        codigo = np.searchsorted(self.regs, q_arr)
+        achou = cabe & (codigo < len(self.regs))
+        achou[achou] = self.regs[codigo[achou]] == q_arr[achou]
+
+        dia = dias(np.asarray(list(datas), dtype="datetime64[D]"), _SEM_DATA_BUSCA)
+        pos = np.searchsorted(self.chaves, codigo.astype(np.int64) * 2 ** 32 + dia, side="right") - 1
+        # chave de outro REG_ANS (ou nenhuma): a data é anterior ao primeiro registro, que é a próxima chave
+        antes = (pos < 0) | (self.chaves[np.maximum(pos, 0)] >> 32 != codigo)
+        pos = np.where(antes, pos + 1, pos)
+
+        # O de início mais recente já tinha sido cancelado na data: volta pelos registros anteriores do mesmo
+        # REG_ANS até achar um que ainda valia. Cada REG_ANS tem poucos registros, então são poucas voltas.
+        escolhido = pos.copy()
+        cand = pos.copy()
+        voltar = achou & ~antes & (self.fins[np.clip(pos, 0, len(self.fins) - 1)] <= dia)
+        while voltar.any():
+            cand = np.where(voltar, cand - 1, cand)
+            voltar &= (cand >= 0) & (self.chaves[np.maximum(cand, 0)] >> 32 == codigo)
+            valia = voltar & (self.fins[np.maximum(cand, 0)] > dia)
+            escolhido = np.where(valia, cand, escolhido)
+            voltar &= ~valia
+        return np.where(achou, self.linhas[np.clip(escolhido, 0, len(self.linhas) - 1)], -1)
+
+    def cancelada_na_data(self, posicoes: np.ndarray, datas: Iterable) -> np.ndarray:
+        """ Para as linhas de vigentes(): o registro é do cadastro de canceladas e o cancelamento veio até a data (sem data de cancelamento conta como cancelado; data buscada ausente = hoje em diante). False onde não achou."""
+        dia = dias(np.asarray(list(datas), dtype="datetime64[D]"), _SEM_DATA_BUSCA)
+        achou = posicoes >= 0
+        linha = np.where(achou, posicoes, 0)
+        ativa = self.tabela.column("ativa").to_numpy(zero_copy_only=False)[linha]
+        fim = dias(self.tabela.column("data_cancelamento").to_numpy(zero_copy_only=False)[linha], _FIM_DESCONHECIDO)
+        return achou & ~ativa & (fim <= dia)
+
+    def na_data(self, regs: Iterable[str], datas: Iterable, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+        """ Uma linha por (REG_ANS, data) buscado com o registro vigente; NaN em tudo quando não há. A coluna cancelada_na_data diz se a operadora já estava cancelada na data buscada (cancelamento depois dela não conta)."""
+        datas = np.asarray(list(datas), dtype="datetime64[D]")
+        posicoes = self.vigentes(regs, datas)
+        achou = posicoes >= 0
+        tabela = self.tabela.select(colunas or self.tabela.column_names)
+        out = tabela.take(pa.array(np.where(achou, posicoes, 0), mask=~achou)).to_pandas()
+        out = out.where(out.notna(), np.nan)
+        out["cancelada_na_data"] = self.cancelada_na_data(posicoes, datas)
+        return out
+
+
+def limpar_snapshots(raiz: Path, manter: Path) -> None:
+    """Deixa só os SNAPSHOTS_GUARDADOS mais recentes (o atual sempre fica)."""
+    antigos = sorted((p for p in raiz.glob("v*-*") if p.is_dir() and p != manter),
+                     key=lambda p: p.stat().st_mtime, reverse=True)
+    for p in antigos[SNAPSHOTS_GUARDADOS - 1:]:
+        shutil.rmtree(p, ignore_errors=True)
+
+
+def snapshot_cadop(csv_path: Path, pasta: Path = PASTA_SNAPSHOTS_PADRAO) -> SnapshotCadop:
+    """ Snapshot do CSV do CADOP baixado (a revalidação do download fica com quem chama, via Cache_http). A chave é o sha256 do conteúdo: o mesmo cadastro é lido uma vez só, qualquer que seja a etapa ou o nome do arquivo local. As próximas leituras só mapeiam os arquivos Arrow."""
+    sha = sha256_arquivo(csv_path)
+    destino = pasta / f"v{FORMATO}-{sha[:16]}"
+    if not destino.is_dir():
+        LOGGER.info("Gerando snapshot do CADOP: %s", destino.name)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        gerar_snapshot(csv_path, destino, sha)
+        limpar_snapshots(pasta, destino)
+    else:
+        os.utime(destino)
+    return carregar_snapshot(destino)
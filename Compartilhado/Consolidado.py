@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+FORMATO_CATALOGO = 1
+NOME_CATALOGO = "catalogo.json"
+
+# Linhas dos CSVs intermediários da 1.2 já analisadas pela 1.3 (valor validado e arredondado), antes do JOIN com o CADOP
+SCHEMA_BASE = pa.schema([
+    ("REG_ANS", pa.string()),
+    ("Trimestre", pa.string()),
+    ("Ano", pa.string()),
+    ("ValorDespesas", pa.string()),          # texto como veio do CSV intermediário
+    ("Fonte", pa.dictionary(pa.int32(), pa.string())),
+    ("ValorCentavos", pa.string()),          # arredondado para centavos; vazio quando inválido
+    ("NaoPositivo", pa.bool_()),
+    ("Valido", pa.bool_()),
+])
+
+Particao = Tuple[int, int]   # (ano, trimestre)
+
+# Colunas de texto: o to_pandas do Arrow dá None nos nulos; o read_csv(dtype=str) dos intermediários dava NaN
+COLUNAS_TEXTO = [c.name for c in SCHEMA_BASE if c.type == pa.string()]
+
+
+class BaseConsolidada:
+    """ Base consolidada da 1.3, só de acréscimo: um Parquet por trimestre em ano=AAAA/trimestre=T/ e um catalogo.json com a fonte (nome e sha256 do CSV intermediário) e o arquivo de cada partição. Trimestre novo ou alterado grava só a própria partição; o resto fica como está, então o histórico pode crescer sem reprocessar os anos anteriores. Quem lê usa o catálogo, nunca lista a pasta: uma partição só existe depois que o catálogo aponta para ela."""
+
+    def __init__(self, pasta: Path) -> None:
+        self.pasta = Path(pasta)
+
+    @property
+    def caminho_catalogo(self) -> Path:
+        return self.pasta / NOME_CATALOGO
+
+    def catalogo(self) -> Dict[str, Any]:
+        try:
+            with open(self.caminho_catalogo, "r", encoding="utf-8") as f:
+                cat = json.load(f)
+        except (OSError, ValueError):
+            return {"formato": FORMATO_CATALOGO, "particoes": []}
+        if cat.get("formato") != FORMATO_CATALOGO:
+            return {"formato": FORMATO_CATALOGO, "particoes": []}
+        return cat
+
+    def _gravar_catalogo(self, cat: Dict[str, Any]) -> None:
+        cat["particoes"].sort(key=lambda e: (e["ano"], e["trimestre"]))
+        tmp = self.caminho_catalogo.with_name(f".{NOME_CATALOGO}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cat, f, ensure_ascii=False, indent=2)
+        tmp.replace(self.caminho_catalogo)
+
+    def entrada(self, particao: Particao) -> Optional[Dict[str, Any]]:
+        for e in self.catalogo()["particoes"]:
+            if (e["ano"], e["trimestre"]) == particao:
+                return e
+        return None
+
+    def entradas(self) -> List[Dict[str, Any]]:
+        """ Entradas do catálogo cujo Parquet existe. Partição com o arquivo apagado conta como desatualizada: some da leitura e atualizada() devolve False, então é gravada de novo quando o CSV de origem aparecer."""
+        return [e for e in self.catalogo()["particoes"] if (self.pasta / e["arquivo"]).exists()]
+
+    def particoes(self) -> List[Particao]:
+        """Partições do catálogo (com o arquivo no lugar), em ordem cronológica."""
+        return [(e["ano"], e["trimestre"]) for e in self.entradas()]
+
+    def atualizada(self, particao: Particao, sha256: str, versao: int) -> bool:
+        """True se a partição já foi gravada a partir do mesmo CSV (sha256) e com a mesma versão da leitura."""
+        e = self.entrada(particao)
+        return (e is not None and e["sha256"] == sha256 and e["versao"] == versao
+                and (self.pasta / e["arquivo"]).exists())
+
+    def gravar(self, particao: Particao, linhas: pd.DataFrame, fonte: str, sha256: str, versao: int) -> Path:
+        """ Grava (ou troca) uma partição: o Parquet novo vai para um nome próprio, o catálogo passa a apontar para ele e só então o arquivo anterior é apagado. Uma execução que cai no meio deixa o catálogo antigo válido."""
+        ano, trimestre = particao
+        relativo = Path(f"ano={ano}") / f"trimestre={trimestre}" / f"base-{sha256[:16]}-v{versao}.parquet"
+        destino = self.pasta / relativo
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        tabela = pa.Table.from_pandas(linhas[list(SCHEMA_BASE.names)], schema=SCHEMA_BASE, preserve_index=False)
+        tmp = destino.with_name(f".{destino.name}.tmp")
+        pq.write_table(tabela, tmp, compression="zstd")
+        tmp.replace(destino)
+
+        cat = self.catalogo()
+        anteriores = [e for e in cat["particoes"] if (e["ano"], e["trimestre"]) == particao]
+        cat["particoes"] = [e for e in cat["particoes"] if (e["ano"], e["trimestre"]) != particao]
+        cat["particoes"].append({
+            "ano": ano, "trimestre": trimestre, "arquivo": relativo.as_posix(),
+            "fonte": fonte, "sha256": sha256, "versao": versao, "linhas": int(len(linhas)),
+            "gravado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        self._gravar_catalogo(cat)
+
+        for e in anteriores:
+            if e["arquivo"] != relativo.as_posix():
+                (self.pasta / e["arquivo"]).unlink(missing_ok=True)
+        return destino
+
+    def ler(self, particoes: Optional[Iterable[Particao]] = None) -> pd.DataFrame:
+        """ Linhas das partições pedidas (todas, se None), em ordem cronológica, com as colunas de SCHEMA_BASE. Texto nulo vem como NaN, como no read_csv(dtype=str). Partição pedida que não está no catálogo, ou cujo arquivo foi apagado (entradas()), é ignorada."""
+        entradas = self.entradas()
+        if particoes is not None:
+            pedidas = set(particoes)
+            entradas = [e for e in entradas if (e["ano"], e["trimestre"]) in pedidas]
+        if not entradas:
+            return SCHEMA_BASE.empty_table().to_pandas()
+        tabela = pa.concat_tables([pq.read_table(self.pasta / e["arquivo"], schema=SCHEMA_BASE) for e in entradas])
+        df = tabela.to_pandas()
+        df["Fonte"] = df["Fonte"].astype(object)
+        for c in COLUNAS_TEXTO:
+            df[c] = df[c].where(df[c].notna(), np.nan)
+        return df
+
+    def limpar(self) -> int:
+        """Apaga Parquets fora do catálogo (sobras de uma execução interrompida). Retorna quantos."""
+        usados = {self.pasta / e["arquivo"] for e in self.catalogo()["particoes"]}
+        sobras = [p for p in self.pasta.glob("ano=*/trimestre=*/*.parquet") if p not in usados]
+        sobras += list(self.pasta.glob("ano=*/trimestre=*/.*.tmp"))
+        for p in sobras:
+            p.unlink(missing_ok=True)
+        return len(sobras)
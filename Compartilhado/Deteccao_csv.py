@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import hashlib
+import io
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+FORMATO_SIDECAR = 1
+BYTES_AMOSTRA = 64 * 1024
+LINHAS_AMOSTRA = 50
+
+# Na ordem de preferência quando dois separadores empatam
+SEPARADORES = [";", ",", "\t", "|"]
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+@dataclass(frozen=True)
+class FormatoCsv:
+    encoding: str
+    sep: str
+    bom: bool
+
+
+def caminho_sidecar(caminho: Path) -> Path:
+    return caminho.with_name(f"{caminho.name}.formato.json")
+
+
+def ler_amostra(caminho: Path) -> bytes:
+    with open(caminho, "rb") as f:
+        return f.read(BYTES_AMOSTRA)
+
+
+def chave_arquivo(caminho: Path, amostra: bytes) -> Dict[str, object]:
+    """Tamanho, mtime e sha256 da amostra: se qualquer um mudar, o formato é detectado de novo."""
+    st = caminho.stat()
+    return {"tamanho": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256_amostra": hashlib.sha256(amostra).hexdigest()}
+
+
+def decodificar_amostra(amostra: bytes) -> FormatoCsv:
+    """ Encoding pela amostra: BOM, se houver; senão UTF-8 se a amostra decodifica (o utf-8-sig da escada antiga lê o mesmo), senão latin1, que aceita qualquer byte. O separador fica vazio até detectar_separador."""
+    for bom, encoding in BOMS:
+        if amostra.startswith(bom):
+            return FormatoCsv(encoding=encoding, sep="", bom=True)
+    try:
+        # final=False: um caractere multibyte cortado no fim da amostra não conta como erro
+        codecs.getincrementaldecoder("utf-8")().decode(amostra, final=False)
+        return FormatoCsv(encoding="utf-8-sig", sep="", bom=False)
+    except UnicodeDecodeError:
+        return FormatoCsv(encoding="latin1", sep="", bom=False)
+
+
+def linhas_amostra(amostra: bytes, encoding: str) -> List[str]:
+    texto = codecs.getincrementaldecoder(encoding)(errors="replace").decode(amostra, final=False)
+    linhas = texto.splitlines()
+    if len(amostra) == BYTES_AMOSTRA and len(linhas) > 1:
+        linhas = linhas[:-1]   # a última linha pode estar cortada
+    return [l for l in linhas[:LINHAS_AMOSTRA] if l.strip()]
+
+
+def detectar_separador(linhas: List[str]) -> Optional[str]:
+    """ O separador que dá ao cabeçalho mais de uma coluna e às linhas de dados o mesmo número de campos que o cabeçalho (lido com o csv do Python, então aspas contam). Empate: a ordem de SEPARADORES."""
+    if not linhas:
+        return None
+    melhor, melhor_nota = None, None
+    for sep in SEPARADORES:
+        campos = [len(r) for r in csv.reader(io.StringIO("\n".join(linhas)), delimiter=sep)]
+        if not campos or campos[0] < 2:
+            continue
+        dados = campos[1:] or [campos[0]]
+        consistentes = sum(c == campos[0] for c in dados) / len(dados)
+        nota = (consistentes, campos[0])
+        if melhor_nota is None or nota > melhor_nota:
+            melhor, melhor_nota = sep, nota
+    return melhor
+
+
+def detectar_formato(caminho: Path, amostra: Optional[bytes] = None) -> Optional[FormatoCsv]:
+    """Encoding, BOM e separador a partir dos primeiros BYTES_AMOSTRA bytes. None se nenhum separador conhecido serve."""
+    amostra = ler_amostra(caminho) if amostra is None else amostra
+    base = decodificar_amostra(amostra)
+    sep = detectar_separador(linhas_amostra(amostra, base.encoding))
+    if sep is None:
+        return None
+    return FormatoCsv(encoding=base.encoding, sep=sep, bom=base.bom)
+
+
+def formato_csv(caminho: Path) -> Optional[FormatoCsv]:
+    """ Formato do CSV, guardado num sidecar <arquivo>.formato.json ao lado dele. Vale enquanto tamanho, mtime e o sha256 da amostra forem os mesmos; a leitura seguinte só confere a chave."""
+    amostra = ler_amostra(caminho)
+    chave = chave_arquivo(caminho, amostra)
+    sidecar = caminho_sidecar(caminho)
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            salvo = json.load(f)
+        if salvo.get("formato") == FORMATO_SIDECAR and all(salvo.get(k) == v for k, v in chave.items()):
+            return FormatoCsv(encoding=salvo["encoding"], sep=salvo["sep"], bom=salvo["bom"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    formato = detectar_formato(caminho, amostra)
+    if formato is not None:
+        salvar_sidecar(caminho, formato, chave)
+    return formato
+
+
+def salvar_sidecar(caminho: Path, formato: FormatoCsv, chave: Optional[Dict[str, object]] = None) -> None:
+    chave = chave_arquivo(caminho, ler_amostra(caminho)) if chave is None else chave
+    sidecar = caminho_sidecar(caminho)
+    tmp = sidecar.with_name(f".{sidecar.name}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"formato": FORMATO_SIDECAR, **chave, **asdict(formato)}, f, ensure_ascii=False, indent=2)
+        tmp.replace(sidecar)
+    except OSError:
+        tmp.unlink(missing_ok=True)   # pasta só de leitura: segue sem sidecar
+
+
+def ler_csv_detectado(caminho: Path, **opcoes) -> Optional[pd.DataFrame]:
+    """ Lê o CSV uma vez, com a engine C, no formato detectado (dtype=str, como as etapas do Teste 2). Se a amostra enganou (ex.: byte inválido em UTF-8 depois dela), tenta latin1 e corrige o sidecar. None quando não dá: o chamador segue com as tentativas de antes."""
+    formato = formato_csv(caminho)
+    if formato is None:
+        return None
+    tentativas = [formato]
+    if formato.encoding == "utf-8-sig":
+        tentativas.append(FormatoCsv(encoding="latin1", sep=formato.sep, bom=False))
+    for i, f in enumerate(tentativas):
+        try:
+            df = pd.read_csv(caminho, dtype=str, encoding=f.encoding, sep=f.sep, engine="c", **opcoes)
+        except (UnicodeDecodeError, pd.errors.ParserError, ValueError):
+            continue
+        if i > 0:
+            salvar_sidecar(caminho, f)
+        return df
+    return None
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PASTA_MEMO_PADRAO = Path(os.getenv("ANS_CACHE_CNPJ_DIR", Path(__file__).resolve().parent / "Cache" / "cnpj"))
+MAX_ENTRADAS_PADRAO = int(os.getenv("ANS_CACHE_CNPJ_MAX", "200000"))
+
+# Mudou o layout do arquivo? Incrementa para ignorar o que já está gravado.
+FORMATO = 1
+NOME_ARQUIVO = "memo_cnpj.parquet"
+CHAVE_META = b"memo_cnpj"
+
+SCHEMA_MEMO = pa.schema([
+    ("bruto", pa.string()),     # CNPJ como veio na entrada
+    ("norm", pa.string()),      # 14 dígitos; nulo quando não sobra CNPJ
+    ("valido", pa.bool_()),
+    ("uso", pa.int32()),        # última execução que consultou ou gravou a entrada
+])
+
+# calcular(brutos) -> (normalizados, válidos), para CNPJs que o memo ainda não conhece
+Calculo = Callable[[pd.Series], Tuple[pd.Series, np.ndarray]]
+
+
+class MemoCnpj:
+    """ Vereditos de CNPJ (normalizado + válido) guardados entre execuções. Os mesmos CNPJs de operadoras aparecem em todo trimestre e em toda execução: carregado no início, o memo vira um índice hash (pd.Index) e só os CNPJs que ele não conhece são calculados. Vale para uma versão das regras (a constante de quem usa, incrementada quando uma regra do veredito muda); com versão ou formato diferente, começa vazio. Guarda no máximo max_entradas, ficando com as usadas mais recentemente."""
+
+    def __init__(self, versao: int, pasta: Optional[Path] = None, max_entradas: Optional[int] = None) -> None:
+        self.versao = versao
+        self.pasta = Path(pasta) if pasta is not None else PASTA_MEMO_PADRAO
+        self.max_entradas = MAX_ENTRADAS_PADRAO if max_entradas is None else max_entradas
+        self.execucao = 1
+        self.descartado: Optional[str] = None
+        self.consultas = 0
+        self.acertos = 0
+        self._definir(np.array([], dtype=object), np.array([], dtype=object),
+                      np.array([], dtype=bool), np.array([], dtype=np.int32))
+
+    @property
+    def caminho(self) -> Path:
+        return self.pasta / NOME_ARQUIVO
+
+    def _definir(self, brutos: np.ndarray, norm: np.ndarray, valido: np.ndarray, uso: np.ndarray) -> None:
+        self._indice = pd.Index(brutos, dtype=object)
+        self._norm = norm
+        self._valido = valido
+        self._uso = uso
+
+    def __len__(self) -> int:
+        return len(self._indice)
+
+    @classmethod
+    def carregar(cls, versao: int, pasta: Optional[Path] = None, max_entradas: Optional[int] = None) -> "MemoCnpj":
+        memo = cls(versao, pasta, max_entradas)
+        try:
+            tabela = pq.read_table(memo.caminho, schema=SCHEMA_MEMO)
+            meta = json.loads((pq.read_schema(memo.caminho).metadata or {}).get(CHAVE_META, b"{}"))
+        except (OSError, ValueError, pa.ArrowException):
+            return memo      # sem memo (ou ilegível): começa vazio
+        if meta.get("formato") != FORMATO:
+            memo.descartado = "formato"
+            return memo
+        if meta.get("versao") != versao:
+            memo.descartado = "versao"
+            return memo
+        memo.execucao = int(meta.get("execucao", 0)) + 1
+        memo._definir(
+            tabela.column("bruto").to_numpy(zero_copy_only=False).astype(object),
+            tabela.column("norm").to_numpy(zero_copy_only=False).astype(object),
+            tabela.column("valido").to_numpy(zero_copy_only=False).astype(bool),
+            tabela.column("uso").to_numpy(zero_copy_only=False).astype(np.int32),
+        )
+        return memo
+
+    def resolver(self, brutos: pd.Series, calcular: Calculo) -> Tuple[np.ndarray, np.ndarray]:
+        """ (normalizados, válidos) para CNPJs brutos distintos e sem nulos. O que o memo já conhece vem dele; o resto sai de calcular e entra no memo, junto com a forma normalizada como chave (normalizar 14 dígitos dá eles mesmos), para quem consulta CNPJs já normalizados também acertar."""
+        brutos = pd.Series(brutos, dtype=object).reset_index(drop=True)
+        pos = self._indice.get_indexer(brutos)
+        achados = pos >= 0
+        self.consultas += len(brutos)
+        self.acertos += int(achados.sum())
+
+        norm = np.empty(len(brutos), dtype=object)
+        valido = np.zeros(len(brutos), dtype=bool)
+        norm[achados] = self._norm[pos[achados]]
+        valido[achados] = self._valido[pos[achados]]
+        self._uso[pos[achados]] = self.execucao
+
+        faltam = np.flatnonzero(~achados)
+        if len(faltam):
+            novos_norm, novos_valido = calcular(brutos.iloc[faltam].reset_index(drop=True))
+            novos_norm = np.asarray(novos_norm, dtype=object)
+            novos_valido = np.asarray(novos_valido, dtype=bool)
+            norm[faltam] = novos_norm
+            valido[faltam] = novos_valido
+            self._acrescentar(brutos.iloc[faltam].to_numpy(dtype=object), novos_norm, novos_valido)
+        return norm, valido
+
+    def _acrescentar(self, brutos: np.ndarray, norm: np.ndarray, valido: np.ndarray) -> None:
+        tem_norm = pd.notna(norm)
+        novos = pd.DataFrame({
+            "bruto": np.concatenate([brutos, norm[tem_norm]]),
+            "norm": np.concatenate([norm, norm[tem_norm]]),
+            "valido": np.concatenate([valido, valido[tem_norm]]),
+        }).drop_duplicates("bruto")
+        novos = novos[self._indice.get_indexer(novos["bruto"]) < 0]
+        if novos.empty:
+            return
+        self._definir(
+            np.concatenate([self._indice.to_numpy(dtype=object), novos["bruto"].to_numpy(dtype=object)]),
+            np.concatenate([self._norm, novos["norm"].to_numpy(dtype=object)]),
+            np.concatenate([self._valido, novos["valido"].to_numpy(dtype=bool)]),
+            np.concatenate([self._uso, np.full(len(novos), self.execucao, dtype=np.int32)]),
+        )
+
+    def zerar_contadores(self) -> None:
+        self.consultas = self.acertos = 0
+
+    def salvar(self) -> int:
+        """ Grava o memo (temporário com nome único + troca, então duas execuções ao mesmo tempo não escrevem no mesmo arquivo). Acima de max_entradas, ficam as entradas usadas mais recentemente. Retorna quantas foram descartadas pelo limite."""
+        manter = np.arange(len(self))
+        if len(self) > self.max_entradas:
+            manter = np.sort(np.argsort(-self._uso, kind="stable")[:self.max_entradas])
+        tabela = pa.Table.from_arrays([
+            pa.array(self._indice.to_numpy(dtype=object)[manter], type=pa.string()),
+            pa.array(self._norm[manter], type=pa.string(), from_pandas=True),
+            pa.array(self._valido[manter], type=pa.bool_()),
+            pa.array(self._uso[manter], type=pa.int32()),
+        ], schema=SCHEMA_MEMO)
+        meta = {"formato": FORMATO, "versao": self.versao, "execucao": self.execucao, "entradas": len(manter)}
+        tabela = tabela.replace_schema_metadata({CHAVE_META: json.dumps(meta).encode("utf-8")})
+
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.pasta, prefix=f".{NOME_ARQUIVO}.", suffix=".tmp", delete=False) as f:
+            tmp = Path(f.name)
+        try:
+            pq.write_table(tabela, tmp, compression="zstd")
+            os.replace(tmp, self.caminho)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return len(self) - len(manter)
+
+    def resumo(self) -> Dict[str, Any]:
+        """Contadores da execução. entradas é o que fica gravado, já com o limite de max_entradas."""
+        return {
+            "versao": self.versao,
+            "entradas": min(len(self), self.max_entradas),
+            "consultas": self.consultas,
+            "acertos": self.acertos,
+            "taxa_acerto_pct": round(self.acertos / self.consultas * 100, 2) if self.consultas else 0.0,
+            "descartado": self.descartado,
+        }
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Grupos do plano de contas da ANS usados pelos testes (prefixos de CD_CONTA_CONTABIL)
+GRUPOS_CONTAS: Dict[str, Tuple[str, ...]] = {
+    "contraprestacoes_efetivas": ("31",),
+    "eventos_sinistros": ("41",),
+    "despesas_administrativas": ("46",),
+}
+
+# Acima disso as somas parciais dos chunks são compactadas num só DataFrame
+LIMITE_PARTES = 2_000_000
+LINHAS_POR_GRUPO = 64_000
+
+SCHEMA_ROLLUP = pa.schema([
+    ("reg_ans", pa.string()),
+    ("prefixo", pa.string()),
+    ("nivel", pa.int8()),                   # quantidade de dígitos do prefixo
+    ("folhas_centavos", pa.int64()),        # soma das contas folha que começam com o prefixo
+    ("informado_centavos", pa.int64()),     # saldo lançado na própria conta; nulo se ela não aparece
+])
+PARTICOES = ds.partitioning(pa.schema([("ano", pa.int16()), ("trimestre", pa.int8())]), flavor="hive")
+
+
+def somar_contas(reg_ans: pd.Series, conta: pd.Series, centavos: pd.Series) -> pd.DataFrame:
+    """ Soma de centavos por (reg_ans, conta) de um chunk. Linhas sem REG_ANS, sem conta ou sem valor ficam de fora."""
+    ok = centavos.notna() & (reg_ans != "") & (conta != "")
+    df = pd.DataFrame({"reg_ans": reg_ans[ok], "conta": conta[ok], "centavos": centavos[ok].astype(np.int64)})
+    return df.groupby(["reg_ans", "conta"], sort=False, as_index=False)["centavos"].sum()
+
+
+def juntar_contas(partes: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Soma exata de somas parciais por (reg_ans, conta). Associativa: a ordem dos arquivos/chunks não muda o resultado."""
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame({"reg_ans": pd.Series(dtype=object), "conta": pd.Series(dtype=object),
+                             "centavos": pd.Series(dtype=np.int64)})
+    if len(partes) == 1:
+        return partes[0].reset_index(drop=True)
+    return pd.concat(partes, ignore_index=True).groupby(["reg_ans", "conta"], sort=False, as_index=False)["centavos"].sum()
+
+
+class AcumuladorContas:
+    """Somas por (reg_ans, conta) de um arquivo, chunk a chunk, na mesma passada da agregação principal."""
+
+    def __init__(self) -> None:
+        self._partes: List[pd.DataFrame] = []
+        self._linhas = 0
+
+    def adicionar(self, reg_ans: pd.Series, conta: pd.Series, centavos: pd.Series) -> None:
+        parte = somar_contas(reg_ans, conta, centavos)
+        self._partes.append(parte)
+        self._linhas += len(parte)
+        if self._linhas > LIMITE_PARTES and len(self._partes) > 1:
+            self._partes = [juntar_contas(self._partes)]
+            self._linhas = len(self._partes[0])
+
+    def resultado(self) -> pd.DataFrame:
+        return juntar_contas(self._partes)
+
+
+def contas_folha(contas: pd.DataFrame) -> np.ndarray:
+    """ True nas contas sem subconta na mesma operadora. Ordenado por (reg_ans, conta), as subcontas de uma conta vêm logo depois dela, então basta olhar a linha seguinte."""
+    reg = contas["reg_ans"].to_numpy(dtype=str)
+    conta = contas["conta"].to_numpy(dtype=str)
+    if len(conta) == 0:
+        return np.zeros(0, dtype=bool)
+    prox_reg = np.append(reg[1:], "")
+    prox_conta = np.append(conta[1:], "")
+    tem_filha = (prox_reg == reg) & (np.char.str_len(prox_conta) > np.char.str_len(conta)) \
+        & np.char.startswith(prox_conta, conta)
+    return ~tem_filha
+
+
+def rollup_contas(contas: pd.DataFrame) -> pd.DataFrame:
+    """ Agrega (reg_ans, conta, centavos) em todos os prefixos de cada conta (1, 2, 3... dígitos). As demonstrações da ANS trazem as contas sintéticas já totalizadas (41 = soma das 411..., que somam as 4111...), então só as contas folha sobem para os prefixos: somar tudo contaria o mesmo valor uma vez por nível. O saldo lançado em cada conta fica em informado_centavos, para comparar com o total das folhas."""
+    contas = juntar_contas([contas]).sort_values(["reg_ans", "conta"], ignore_index=True)
+    folhas = contas[contas_folha(contas)]
+
+    tamanhos = folhas["conta"].str.len()
+    niveis = []
+    for nivel in range(1, int(tamanhos.max()) + 1 if len(folhas) else 1):
+        sub = folhas[tamanhos >= nivel]
+        niveis.append(pd.DataFrame({
+            "reg_ans": sub["reg_ans"],
+            "prefixo": sub["conta"].str[:nivel],
+            "folhas_centavos": sub["centavos"],
+        }).groupby(["reg_ans", "prefixo"], sort=False, as_index=False)["folhas_centavos"].sum())
+
+    informado = contas.rename(columns={"conta": "prefixo", "centavos": "informado_centavos"})
+    if niveis:
+        out = pd.concat(niveis, ignore_index=True).merge(informado, on=["reg_ans", "prefixo"], how="outer")
+    else:
+        out = informado.assign(folhas_centavos=pd.Series(dtype=np.int64))
+    # conta lançada fora da hierarquia (sem folha embaixo, ex.: só zeros) entra com soma 0 das folhas
+    out["folhas_centavos"] = out["folhas_centavos"].fillna(0).astype(np.int64)
+    out["informado_centavos"] = out["informado_centavos"].astype("Int64")
+    out["nivel"] = out["prefixo"].str.len().astype(np.int8)
+    # ordenado por prefixo: consultas por conta pulam row groups pelas estatísticas do Parquet
+    return out.sort_values(["prefixo", "reg_ans"], ignore_index=True)[list(SCHEMA_ROLLUP.names)]
+
+
+def caminho_rollup(pasta: Path, ano: int, trimestre: int) -> Path:
+    return pasta / f"ano={ano}" / f"trimestre={trimestre}" / "contas.parquet"
+
+
+def salvar_rollup(rollup: pd.DataFrame, pasta: Path, ano: int, trimestre: int) -> Path:
+    """Grava o rollup de um trimestre em Parquet (zstd, dicionário em reg_ans/prefixo). Troca o arquivo de uma vez: quem está lendo nunca vê um pela metade."""
+    destino = caminho_rollup(pasta, ano, trimestre)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tabela = pa.Table.from_pandas(rollup, schema=SCHEMA_ROLLUP, preserve_index=False)
+    tmp = destino.with_name(f".{destino.name}.tmp")
+    pq.write_table(tabela, tmp, compression="zstd", row_group_size=LINHAS_POR_GRUPO)
+    tmp.replace(destino)
+    return destino
+
+
+class ConsultaContas:
+    """ Leitura do rollup gravado pela 1.2 (um Parquet por trimestre em ano=/trimestre=). Um grupo de contas vira uma leitura filtrada por prefixo, sem voltar às linhas dos arquivos da ANS."""
+
+    def __init__(self, pasta: Path) -> None:
+        self.pasta = Path(pasta)
+
+    def _dataset(self) -> Optional[ds.Dataset]:
+        if not any(self.pasta.glob("ano=*/trimestre=*/contas.parquet")):
+            return None
+        return ds.dataset(self.pasta, format="parquet", partitioning=PARTICOES, exclude_invalid_files=True)
+
+    def valores(
+        self,
+        prefixos: Union[str, Sequence[str]],
+        ano: Optional[int] = None,
+        trimestre: Optional[int] = None,
+        reg_ans: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Linhas do rollup dos prefixos pedidos: ano, trimestre, reg_ans, prefixo, nivel, folhas_centavos, informado_centavos."""
+        prefixos = [prefixos] if isinstance(prefixos, str) else list(prefixos)
+        colunas = ["ano", "trimestre", *SCHEMA_ROLLUP.names]
+        dataset = self._dataset()
+        if dataset is None:
+            vazio = SCHEMA_ROLLUP.empty_table().to_pandas()
+            return vazio.assign(ano=pd.Series(dtype=np.int16), trimestre=pd.Series(dtype=np.int8))[colunas]
+
+        filtro = ds.field("prefixo").isin(prefixos)
+        if ano is not None:
+            filtro &= ds.field("ano") == ano
+        if trimestre is not None:
+            filtro &= ds.field("trimestre") == trimestre
+        if reg_ans is not None:
+            filtro &= ds.field("reg_ans").isin(list(reg_ans))
+        df = dataset.to_table(columns=colunas, filter=filtro).to_pandas()
+        df["informado_centavos"] = df["informado_centavos"].astype("Int64")
+        return df.sort_values(["ano", "trimestre", "reg_ans", "prefixo"], ignore_index=True)
+
+    def grupo(
+        self,
+        nome_ou_prefixos: Union[str, Sequence[str]],
+        ano: Optional[int] = None,
+        trimestre: Optional[int] = None,
+        informado: bool = True,
+    ) -> pd.DataFrame:
+        """ Total de um grupo (nome de GRUPOS_CONTAS ou lista de prefixos) por ano, trimestre e reg_ans, em centavos. Com informado=True usa o saldo lançado na conta do prefixo (o mesmo critério da conta 41 na 1.2); operadora que não lança a conta cai para a soma das folhas."""
+        prefixos = GRUPOS_CONTAS.get(nome_ou_prefixos, (nome_ou_prefixos,)) \
+            if isinstance(nome_ou_prefixos, str) else tuple(nome_ou_prefixos)
+        df = self.valores(prefixos, ano=ano, trimestre=trimestre)
+        centavos = df["folhas_centavos"]
+        if informado:
+            centavos = df["informado_centavos"].fillna(centavos).astype(np.int64)
+        return (
+            df.assign(centavos=centavos)
+            .groupby(["ano", "trimestre", "reg_ans"], as_index=False)["centavos"].sum()
+        )
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import codecs
+import gzip
+import time
+import zipfile
+from contextlib import ExitStack
+from itertools import chain
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+# Nível de compressão padrão: o mesmo do zlib (e do ZipFile sem compresslevel)
+NIVEL_PADRAO = 6
+LINHAS_POR_BLOCO = 100_000
+FORMATOS_EXTRAS = ("gz", "zst")
+
+
+def blocos_csv(df: pd.DataFrame, encoding: str = "utf-8", linhas_por_bloco: int = LINHAS_POR_BLOCO,
+               **opcoes_csv) -> Iterator[bytes]:
+    """ O CSV de df em blocos de bytes, com o cabeçalho só no primeiro. Juntos, os blocos dão exatamente o mesmo arquivo que df.to_csv(caminho, index=False, encoding=encoding, **opcoes_csv); o encoder incremental escreve o BOM do utf-8-sig uma vez só."""
+    encoder = codecs.getincrementalencoder(encoding)()
+    for ini in range(0, max(len(df), 1), linhas_por_bloco):
+        texto = df.iloc[ini:ini + linhas_por_bloco].to_csv(index=False, header=ini == 0, **opcoes_csv)
+        yield encoder.encode(texto)
+    final = encoder.encode("", final=True)
+    if final:
+        yield final
+
+
+class _SaidaZstd:
+    """Arquivo .zst escrito bloco a bloco pelo codec do pyarrow (um frame por bloco; qualquer leitor de zstd concatena os frames). O zstd não tem nível "só guardar": nivel vai de 1 a 9 (escrever_csv_compactado recusa 0 com "zst")."""
+
+    def __init__(self, arquivo: BinaryIO, nivel: int) -> None:
+        self._arquivo = arquivo
+        self._codec = pa.Codec("zstd", compression_level=nivel)
+
+    def write(self, dados: bytes) -> None:
+        if dados:
+            self._arquivo.write(self._codec.compress(dados, asbytes=True))
+
+
+def _entrada_zip(nome: str, nivel: int) -> zipfile.ZipInfo:
+    """Entrada do ZIP com a data de agora e permissão de arquivo comum (0644), como o zf.write de um arquivo recém-gravado. zf.open(nome, "w") deixaria 1980-01-01 e 0600."""
+    info = zipfile.ZipInfo(nome, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    # Com ZipInfo, o zipfile usa o nível da entrada, não o do ZipFile. O atributo é público só a partir
+    # do Python 3.13 (compress_level); antes, é o mesmo _compresslevel que o ZipFile.open(nome) preenche.
+    if hasattr(zipfile.ZipInfo, "compress_level"):
+        info.compress_level = nivel
+    else:
+        info._compresslevel = nivel
+    return info
+
+
+def escrever_csv_compactado(
+    df: pd.DataFrame,
+    pasta: Path,
+    nome_csv: str,
+    nome_zip: Optional[str] = None,
+    extras: Iterable[str] = (),
+    nivel: int = NIVEL_PADRAO,
+    gravar_csv: bool = True,
+    encoding: str = "utf-8",
+    linhas_por_bloco: int = LINHAS_POR_BLOCO,
+    **opcoes_csv,
+) -> Dict[str, Path]:
+    """ Grava o CSV de df numa passada só: cada bloco vai ao mesmo tempo para o .csv (se gravar_csv), para a entrada nome_csv dentro de nome_zip e para os irmãos .csv.gz/.csv.zst pedidos em extras. Nada é relido do disco. nivel (0-9) vale para o deflate do ZIP, o gzip e o zstd; o zstd não tem nível 0 (ValueError se "zst" estiver em extras). Cada saída é escrita num temporário e trocada no final: quem está lendo nunca vê um arquivo pela metade. Retorna {"csv"|"zip"|"gz"|"zst": caminho}."""
+    extras = list(dict.fromkeys(extras))
+    desconhecidos = [e for e in extras if e not in FORMATOS_EXTRAS]
+    if desconhecidos:
+        raise ValueError(f"Formato de compressão desconhecido: {desconhecidos}. Use {list(FORMATOS_EXTRAS)}.")
+    if nivel == 0 and "zst" in extras:
+        raise ValueError("O zstd não tem nível 0 (sem compressão): use nivel de 1 a 9 com \"zst\".")
+
+    pasta.mkdir(parents=True, exist_ok=True)
+    destinos: Dict[str, Path] = {}
+    if gravar_csv:
+        destinos["csv"] = pasta / nome_csv
+    if nome_zip:
+        destinos["zip"] = pasta / nome_zip
+    for ext in extras:
+        destinos[ext] = pasta / f"{nome_csv}.{ext}"
+    tmps = {k: p.with_name(f".{p.name}.tmp") for k, p in destinos.items()}
+
+    blocos = blocos_csv(df, encoding=encoding, linhas_por_bloco=linhas_por_bloco, **opcoes_csv)
+    primeiro = next(blocos)
+    try:
+        # ExitStack fecha na ordem inversa: a entrada do ZIP antes do ZipFile, o GzipFile antes do arquivo
+        with ExitStack() as pilha:
+            saidas: List = []
+            if "csv" in tmps:
+                saidas.append(pilha.enter_context(open(tmps["csv"], "wb")))
+            if "zip" in tmps:
+                zf = pilha.enter_context(
+                    zipfile.ZipFile(tmps["zip"], "w", compression=zipfile.ZIP_DEFLATED, compresslevel=nivel))
+                # o tamanho só é conhecido no fim; estimado pelo primeiro bloco para decidir o ZIP64
+                estimado = len(primeiro) * (len(df) // linhas_por_bloco + 1)
+                saidas.append(pilha.enter_context(
+                    zf.open(_entrada_zip(nome_csv, nivel), "w", force_zip64=estimado > zipfile.ZIP64_LIMIT // 2)))
+            if "gz" in tmps:
+                arquivo = pilha.enter_context(open(tmps["gz"], "wb"))
+                saidas.append(pilha.enter_context(
+                    gzip.GzipFile(filename=nome_csv, mode="wb", compresslevel=nivel, fileobj=arquivo, mtime=0)))
+            if "zst" in tmps:
+                saidas.append(_SaidaZstd(pilha.enter_context(open(tmps["zst"], "wb")), nivel))
+
+            for bloco in chain((primeiro,), blocos):
+                for s in saidas:
+                    s.write(bloco)
+    except BaseException:
+        for tmp in tmps.values():
+            tmp.unlink(missing_ok=True)
+        raise
+
+    for k, tmp in tmps.items():
+        tmp.replace(destinos[k])
+    return destinos
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+# Acima disso a linha vai para o Decimal do chamador: mantissa não cabe em int64 com folga para somar
+MAX_DIGITOS = 17
+MAX_ESCALA = 6
+LARGURA_MAX = 24
+
+_VIRGULA, _PONTO, _MAIS, _MENOS, _ZERO, _NOVE = (ord(c) for c in ",.+-09")
+
+
+@dataclass
+class PontoFixo:
+    """ Valores como inteiros: valor = mantissa / 10**escala_comum. Linhas com ok=False fogem do formato simples (vazias, inválidas, com espaço, expoente, muitas casas, não-texto...) e ficam para o parser Decimal de quem chamou."""
+    mantissa: pd.Series      # int64, já na escala_comum
+    escala: pd.Series        # casas decimais de cada linha como veio no texto
+    negativo: pd.Series      # sinal do texto (distingue "-0,00" de "0,00")
+    ok: pd.Series
+    escala_comum: int
+
+    def linhas(self, mascara: pd.Series) -> PontoFixo:
+        """Só as linhas da máscara, na mesma escala_comum: quem já converteu o chunk inteiro não converte de novo um pedaço dele."""
+        return PontoFixo(
+            mantissa=self.mantissa[mascara],
+            escala=self.escala[mascara],
+            negativo=self.negativo[mascara],
+            ok=self.ok[mascara],
+            escala_comum=self.escala_comum,
+        )
+
+
+def _matriz_codigos(valores: pd.Series) -> tuple:
+    """ Textos de até LARGURA_MAX caracteres como matriz de code points, transposta (posição x linha) para cada posição ser contígua na memória; 0 no preenchimento."""
+    brutos = valores.to_numpy(dtype=object)
+    tamanhos = np.fromiter((len(v) if type(v) is str else -1 for v in brutos), dtype=np.int64, count=len(brutos))
+    cabe = (tamanhos > 0) & (tamanhos <= LARGURA_MAX)
+    largura = int(tamanhos[cabe].max()) if cabe.any() else 1
+    codigos = np.array(brutos[cabe], dtype=f"U{largura}").view(np.uint32).reshape(-1, largura)
+    return np.ascontiguousarray(codigos.T), cabe
+
+
+def para_ponto_fixo(valores: pd.Series, formato: str = "br") -> PontoFixo:
+    """ Converte textos de valor em inteiros sem passar por Decimal linha a linha. formato="br" segue analisar_decimal_br (1.2): pontos de milhar são ignorados e a vírgula é o decimal. formato="auto" segue extrair_decimal (1.3): com vírgula e ponto, o último dos dois é o decimal; só com ponto, o ponto é o decimal."""
+    n = len(valores)
+    codigos, cabe = _matriz_codigos(valores)
+    largura = codigos.shape[0]
+
+    virgulas = codigos == _VIRGULA
+    pontos = codigos == _PONTO
+    if formato == "br":
+        decimal, ignorado = virgulas, pontos
+    else:
+        posicao = np.arange(largura)[:, None]
+        tem_virgula = virgulas.any(axis=0)
+        ultima_virgula = np.where(virgulas, posicao, -1).max(axis=0)
+        ultimo_ponto = np.where(pontos, posicao, -1).max(axis=0)
+        br = tem_virgula & (ultima_virgula > ultimo_ponto)
+        us = tem_virgula & ~br
+        decimal = np.where(br, virgulas, pontos)
+        ignorado = np.where(br, pontos, us & virgulas)
+
+    digito = (codigos >= _ZERO) & (codigos <= _NOVE)
+    sinal = np.zeros_like(digito)
+    sinal[0] = (codigos[0] == _MAIS) | (codigos[0] == _MENOS)
+
+    depois_decimal = np.cumsum(decimal, axis=0) > 0
+    escala = (digito & depois_decimal).sum(axis=0)
+    qtd_digitos = digito.sum(axis=0)
+
+    ok = (
+        (digito | decimal | ignorado | sinal | (codigos == 0)).all(axis=0)
+        & (decimal.sum(axis=0) <= 1)
+        & (qtd_digitos > 0)
+        & (escala <= MAX_ESCALA)
+    )
+    escala_comum = int(escala[ok].max()) if ok.any() else 0
+    ok &= (qtd_digitos - escala + escala_comum) <= MAX_DIGITOS
+
+    m = np.zeros(codigos.shape[1], dtype=np.int64)
+    with np.errstate(over="ignore"):   # linhas longas demais estouram, mas já estão fora de ok
+        for j in range(largura):
+            m = np.where(digito[j], m * 10 + (codigos[j].astype(np.int64) - _ZERO), m)
+        m = m * np.power(10, escala_comum - np.minimum(escala, escala_comum)).astype(np.int64)
+    negativo = codigos[0] == _MENOS
+    m = np.where(negativo, -m, m)
+
+    def espalhar(v: np.ndarray, vazio: Any, dtype: Any) -> pd.Series:
+        out = np.full(n, vazio, dtype=dtype)
+        out[cabe] = v
+        return pd.Series(out, index=valores.index)
+
+    ok_s = espalhar(ok, False, bool)
+    return PontoFixo(
+        mantissa=espalhar(np.where(ok, m, 0), 0, np.int64),
+        escala=espalhar(escala, 0, np.int64),
+        negativo=espalhar(negativo & ok, False, bool),
+        ok=ok_s,
+        escala_comum=escala_comum,
+    )
+
+
+def decimal_de(mantissa: int, escala_comum: int, escala: int) -> Decimal:
+    """Decimal exato com `escala` casas (mantissa tem que ser múltiplo de 10**(escala_comum - escala))."""
+    return Decimal(mantissa // 10 ** (escala_comum - escala)).scaleb(-escala)
+
+
+def somar_por_grupo(chaves: pd.Series, pf: PontoFixo) -> Dict[Any, Decimal]:
+    """ Soma exata por chave das linhas ok. Cada soma sai com o maior número de casas do grupo, igual à soma de Decimals das mesmas linhas."""
+    m = pf.mantissa[pf.ok]
+    if m.empty:
+        return {}
+
+    # int64 estoura? soma em int do Python (ainda exato, só mais lento)
+    if int(m.abs().max()) * len(m) >= 2 ** 63:
+        m = m.astype(object)
+
+    g = pd.DataFrame({"m": m, "e": pf.escala[pf.ok]}).groupby(chaves[pf.ok], sort=False).agg(
+        m=("m", "sum"), e=("e", "max")
+    )
+    return {
+        chave: decimal_de(int(soma), pf.escala_comum, int(esc))
+        for chave, soma, esc in zip(g.index, g["m"], g["e"])
+    }
+
+
+def centavos_half_up(pf: PontoFixo) -> pd.Series:
+    """Valor arredondado para centavos (ROUND_HALF_UP, como Decimal.quantize) em int64."""
+    m = pf.mantissa.to_numpy()
+    if pf.escala_comum <= 2:
+        return pd.Series(m * 10 ** (2 - pf.escala_comum), index=pf.mantissa.index)
+
+    passo = 10 ** (pf.escala_comum - 2)
+    q, r = np.divmod(np.abs(m), passo)
+    q = q + (2 * r >= passo)
+    return pd.Series(np.where(m < 0, -q, q), index=pf.mantissa.index)
+
+
+def texto_centavos(centavos: pd.Series, negativo: pd.Series) -> pd.Series:
+    """int64 de centavos -> '1234.56' (mesmo texto de str(Decimal.quantize(Decimal('0.01'))))."""
+    absoluto = centavos.abs()
+    inteiro = (absoluto // 100).astype(str)
+    frac = (absoluto % 100).astype(str).str.zfill(2)
+    sinal = pd.Series(np.where(negativo, "-", ""), index=centavos.index)
+    return sinal + inteiro + "." + frac